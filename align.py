@@ -0,0 +1,165 @@
+"""
+Find where a translator's recording is in the original lecture: its offset and clock drift.
+
+Short probes of the translation (PROBES of PROBE_SECONDS spread over it) are decoded at a low
+sample rate (see pcm.py) and located in the original by cross-correlation computed with FFT.
+The first probe that matches is searched for within MAX_OFFSET_SECONDS, the others only around
+where the first match says they should be. Only the probes and the stretches of the original
+they are searched in are decoded, so memory doesn't depend on how long the recordings are.
+
+The matches are fitted with original time = offset + translation time * (1 + drift).
+"""
+import os
+import sys
+
+import numpy as np
+
+import ffmpeg
+import pcm
+import probe
+
+# the recordings share the low frequencies only anyway (e.g. the speaker heard in the translator's mic)
+SAMPLE_RATE = 1000
+PROBE_SECONDS = 30
+PROBES = 8
+MAX_OFFSET_SECONDS = 600
+# how far from the expected position the other probes are searched for, enough for the drift of any clock
+SEARCH_SECONDS = 5
+# normalized correlation below which a probe is taken for not found (the translator speaking over silence etc.)
+MIN_SCORE = 0.1
+
+
+class AlignmentError(Exception):
+    pass
+
+
+class Alignment:
+    def __init__(self, offset, drift, matches):
+        # time of the original (seconds) at which the translation starts, negative if it starts before the original
+        self.offset = offset
+        # how much faster the original's clock runs, e.g. 1e-4 (100 ppm)
+        self.drift = drift
+        # [(translation time, original time, score)] of the probes that were found
+        self.matches = matches
+
+    def original_time(self, translation_time):
+        return self.offset + translation_time * (1 + self.drift)
+
+    def seek_args(self):
+        """(original_input_args, translation_input_args): -ss to put before -i of each so that they start together"""
+        if self.offset >= 0:
+            return ['-ss', ffmpeg.seconds_arg(self.offset)], []
+        return [], ['-ss', ffmpeg.seconds_arg(-self.offset)]
+
+
+def usage_and_exit():
+    print("""find the offset (and clock drift) of a translation recording in the original
+usage: align "yyyy-mm-dd goswamimj.mp4" "translation.wav\"""")
+    exit()
+
+
+def align(orig_filename, translation_filename, max_offset=MAX_OFFSET_SECONDS) -> Alignment:
+    duration = probe.get_duration(translation_filename)
+    if not duration:
+        raise AlignmentError('duration of "{}" is unknown'.format(translation_filename))
+    probe_seconds = min(PROBE_SECONDS, duration)
+    matches = []
+    for position in np.linspace(0, duration - probe_seconds, PROBES if duration > probe_seconds else 1):
+        position = float(position)
+        if matches:
+            expected = _fit(matches).original_time(position)
+            search_start, search_seconds = expected - SEARCH_SECONDS, probe_seconds + 2 * SEARCH_SECONDS
+        else:
+            search_start, search_seconds = position - max_offset, probe_seconds + 2 * max_offset
+        needle = _read(translation_filename, position, probe_seconds)
+        haystack = _read(orig_filename, search_start, search_seconds)
+        found = correlate(needle, haystack)
+        if found is not None and found[1] >= MIN_SCORE:
+            lag, score = found
+            matches.append((position, search_start + lag / SAMPLE_RATE, score))
+    if not matches:
+        raise AlignmentError('"{}" is not found in "{}"'.format(translation_filename, orig_filename))
+    return _fit(matches)
+
+
+def correlate(needle, haystack):
+    """
+    (lag in samples, score) of where needle matches haystack best, None if it can't be told.
+    score is the normalized correlation, 1 for an exact (scaled) copy; lag is refined to a fraction of a sample.
+    """
+    m = len(needle)
+    n = len(haystack)
+    if m == 0 or n < m:
+        return None
+    needle = needle.astype(np.float64) - needle.mean()
+    needle_energy = np.dot(needle, needle)
+    if needle_energy < 1e-9:
+        # silence matches anything
+        return None
+    size = 1 << (n + m - 1).bit_length()
+    corr = np.fft.irfft(np.fft.rfft(haystack, size) * np.conj(np.fft.rfft(needle, size)), size)[:n - m + 1]
+    # energy of the haystack under the needle at every lag
+    squares = np.concatenate(([0.0], np.cumsum(np.square(haystack, dtype=np.float64))))
+    energy = np.maximum(squares[m:] - squares[:-m], 1e-12)
+    score = corr / np.sqrt(energy * needle_energy)
+    lag = int(np.argmax(score))
+    fraction = 0.0
+    if 0 < lag < len(score) - 1:
+        before, peak, after = score[lag - 1:lag + 2]
+        curvature = before - 2 * peak + after
+        if curvature < 0:
+            fraction = 0.5 * (before - after) / curvature
+    return lag + fraction, float(score[lag])
+
+
+def _fit(matches) -> Alignment:
+    if len(matches) == 1:
+        position, original_time, score = matches[0]
+        return Alignment(original_time - position, 0.0, matches)
+    positions, original_times, scores = (np.array(values) for values in zip(*matches))
+    slope, offset = np.polyfit(positions, original_times, 1, w=scores)
+    return Alignment(float(offset), float(slope - 1), matches)
+
+
+def _read(filename, start, seconds) -> np.ndarray:
+    """Mono samples of the audio from start, at most seconds long (silence before the audio starts)"""
+    samples = np.empty(int(np.ceil(seconds * SAMPLE_RATE)), dtype=np.float32)
+    size = 0
+    if start < 0:
+        size = min(len(samples), int(round(-start * SAMPLE_RATE)))
+        samples[:size] = 0
+        seconds -= size / SAMPLE_RATE
+        start = 0
+    if seconds <= 0:
+        return samples[:size]
+    for block in pcm.blocks(filename, SAMPLE_RATE, start=start, duration=seconds):
+        count = min(len(block), len(samples) - size)
+        samples[size:size + count] = block[:count, 0]
+        size += count
+    return samples[:size]
+
+
+def main():
+    try:
+        orig_filename, translation_filename = sys.argv[1:3]
+    except ValueError:
+        usage_and_exit()
+    for filename in (orig_filename, translation_filename):
+        if not os.path.isfile(filename):
+            print('file "%s" not found' % filename)
+            print('')
+            usage_and_exit()
+    try:
+        alignment = align(orig_filename, translation_filename)
+    except AlignmentError as e:
+        print(e)
+        sys.exit(1)
+    original_args, translation_args = alignment.seek_args()
+    print('offset: {} s'.format(ffmpeg.seconds_arg(alignment.offset)))
+    print('drift: {:.1f} ppm ({} of {} probes matched)'.format(alignment.drift * 1e6, len(alignment.matches), PROBES))
+    print('original: {}'.format(' '.join(original_args + ['-i', '"' + orig_filename + '"'])))
+    print('translation: {}'.format(' '.join(translation_args + ['-i', '"' + translation_filename + '"'])))
+
+
+if __name__ == '__main__':
+    main()
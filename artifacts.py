@@ -0,0 +1,201 @@
+"""
+Make-like skipping of ffmpeg runs whose output is already there.
+
+Every run is keyed by a hash of its full argument list, the size and mtime of its input
+files and the version of the ffmpeg executable. After a successful run the key is recorded
+for each output in a manifest in the output's directory (temp/artifacts.json) together with
+the size and mtime of the output. Next time the same command is skipped as long as the key
+matches and the output hasn't been touched since, so after a metadata fix only the steps
+that actually depend on it are re-done.
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+import filelock
+
+import ffmpegrunner
+
+MANIFEST_FILENAME = 'artifacts.json'
+
+# ffmpeg options that don't take a value, everything else starting with '-' does
+_FLAGS = {'-y', '-n', '-nostdin', '-nostats', '-hide_banner', '-stats',
+          '-vn', '-an', '-sn', '-dn', '-shortest', '-re', '-copyts', '-accurate_seek', '-noaccurate_seek'}
+
+# ffmpeg executable -> its version line
+_versions = {}
+
+
+def run(cmd, run_cmd=None, inputs=(), outputs=None, extra_key=None) -> bool:
+    """
+    Run cmd unless its outputs are up to date.
+    :param run_cmd: run_cmd(cmd) runs the command and raises if it fails, subprocess.run(cmd, check=True) by default
+    :param inputs: input files not seen in cmd (e.g. what is fed through a pipe)
+    :param outputs: output files, by default positional arguments of cmd
+    :param extra_key: what else the outputs depend on (json-serializable), e.g. the command feeding the pipe
+    :return: True if cmd was run, False if it was skipped
+    """
+    if is_up_to_date(cmd, inputs, outputs, extra_key):
+        return False
+    forget(cmd, outputs)
+    if run_cmd is None:
+        subprocess.run(cmd, check=True)
+    else:
+        run_cmd(cmd)
+    record(cmd, inputs, outputs, extra_key)
+    return True
+
+
+async def run_async(cmd, run_cmd=None, inputs=(), outputs=None, extra_key=None) -> bool:
+    """
+    Coroutine version of run()
+    :param run_cmd: coroutine function run_cmd(cmd), ffmpegrunner.run_async(cmd, check=True) by default
+    """
+    if is_up_to_date(cmd, inputs, outputs, extra_key):
+        return False
+    forget(cmd, outputs)
+    if run_cmd is None:
+        await ffmpegrunner.run_async(cmd, check=True)
+    else:
+        await run_cmd(cmd)
+    record(cmd, inputs, outputs, extra_key)
+    return True
+
+
+def is_up_to_date(cmd, inputs=(), outputs=None, extra_key=None) -> bool:
+    """True if every output was made by this very command from the same inputs and hasn't changed since"""
+    outputs = output_filenames(cmd) if outputs is None else outputs
+    if not outputs:
+        return False
+    try:
+        key = get_key(cmd, inputs, extra_key)
+    except FileNotFoundError:
+        return False
+    for output_filename in outputs:
+        entry = _read_manifest(os.path.dirname(os.path.abspath(output_filename))).get(os.path.basename(output_filename))
+        if entry is None or entry.get('key') != key or entry.get('output') != _identity(output_filename):
+            return False
+    return True
+
+
+def record(cmd, inputs=(), outputs=None, extra_key=None):
+    """Remember that the outputs were made by cmd (call after cmd succeeded)"""
+    outputs = output_filenames(cmd) if outputs is None else outputs
+    key = get_key(cmd, inputs, extra_key)
+    for output_filename in outputs:
+        _update_manifest(output_filename, {'key': key, 'output': _identity(output_filename)})
+
+
+def forget(cmd, outputs=None):
+    """Drop manifest entries of the outputs, e.g. before they are overwritten"""
+    outputs = output_filenames(cmd) if outputs is None else outputs
+    for output_filename in outputs:
+        _update_manifest(output_filename, None)
+
+
+def get_key(cmd, inputs=(), extra_key=None) -> str:
+    input_filenames = _input_filenames(cmd) + [os.path.abspath(filename) for filename in inputs]
+    key = {
+        'cmd': list(cmd),
+        'inputs': [[filename] + _identity(filename) for filename in input_filenames],
+        'ffmpeg': ffmpeg_version(cmd[0]),
+    }
+    if extra_key is not None:
+        key['extra'] = extra_key
+    return hashlib.sha1(json.dumps(key, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def ffmpeg_version(executable='ffmpeg') -> str:
+    """First line of `ffmpeg -version`, '' if it can't be run"""
+    try:
+        return _versions[executable]
+    except KeyError:
+        pass
+    try:
+        res = subprocess.run([executable, '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        version = res.stdout.decode('utf-8', 'replace').split('\n', 1)[0].strip()
+    except OSError:
+        version = ''
+    _versions[executable] = version
+    return version
+
+
+def _parse_cmd(cmd):
+    """Return (input files, output files) of an ffmpeg command line"""
+    inputs = []
+    outputs = []
+    # -f of the next input or output
+    file_format = None
+    i = 1
+    while i < len(cmd):
+        arg = cmd[i]
+        if arg.startswith('-') and arg != '-':
+            if arg in _FLAGS:
+                i += 1
+                continue
+            if arg == '-i':
+                if i + 1 < len(cmd) and os.path.isfile(cmd[i + 1]):
+                    inputs.append(os.path.abspath(cmd[i + 1]))
+                file_format = None
+            elif arg == '-f' and i + 1 < len(cmd):
+                file_format = cmd[i + 1]
+            i += 2
+        else:
+            if file_format == 'tee':
+                # "[f=matroska]a.mkv|[select=a]a.m4a", see ffmpeg.tee_output()
+                for slave in re.split(r'(?<!\\)\|', arg):
+                    outputs.append(re.sub(r'\\(.)', r'\1', re.sub(r'^\[[^]]*\]', '', slave)))
+            elif not arg.startswith('pipe:') and arg != '-':
+                outputs.append(arg)
+            file_format = None
+            i += 1
+    return inputs, outputs
+
+
+def _input_filenames(cmd):
+    return _parse_cmd(cmd)[0]
+
+
+def output_filenames(cmd):
+    """Files written by an ffmpeg command line (tee muxer slaves too)"""
+    return _parse_cmd(cmd)[1]
+
+
+def _identity(filename):
+    st = os.stat(filename)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _manifest_filename(dir_name):
+    return os.path.join(dir_name, MANIFEST_FILENAME)
+
+
+def _read_manifest(dir_name) -> dict:
+    try:
+        with open(_manifest_filename(dir_name), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict):
+            return manifest
+    except (FileNotFoundError, ValueError):
+        pass
+    return {}
+
+
+def _update_manifest(output_filename, entry):
+    dir_name = os.path.dirname(os.path.abspath(output_filename))
+    manifest_filename = _manifest_filename(dir_name)
+    os.makedirs(dir_name, exist_ok=True)
+    # scripts run several ffmpegs writing to the same temp dir at once
+    with filelock.FileLock(manifest_filename + '.lock'):
+        manifest = _read_manifest(dir_name)
+        if entry is None:
+            if manifest.pop(os.path.basename(output_filename), None) is None:
+                return
+        else:
+            manifest[os.path.basename(output_filename)] = entry
+        tmp_filename = manifest_filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_filename, manifest_filename)
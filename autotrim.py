@@ -0,0 +1,157 @@
+"""
+Suggest the skip and cut times of a lecture: where the speech starts and where it ends.
+
+Only the first and the last HEAD_SECONDS of the audio are decoded, as a low-rate mono proxy
+(see pcm.py). Every second of it is told apart as silence, a steady tone (the countdown beeps,
+sustained notes of the music before the lecture), noise (applause) or speech by its level and
+spectrum. The speech starts where the first MIN_SPEECH_SECONDS run that is mostly speech starts
+and ends where the last such run ends; skip and cut get PADDING_SECONDS around it.
+
+The suggestions are written to the .yml only where skip/cut are not set yet.
+"""
+import os
+import sys
+
+import numpy as np
+
+import meta
+import pcm
+import probe
+
+SAMPLE_RATE = 4000
+HEAD_SECONDS = 20 * 60
+WINDOW_SECONDS = 1
+MIN_SPEECH_SECONDS = 10
+# share of speech windows a run must have: a pause or a cough doesn't break it
+SPEECH_SHARE = 0.8
+PADDING_SECONDS = 1
+
+SILENCE = 0
+TONE = 1
+NOISE = 2
+SPEECH = 3
+
+# share of the power in the strongest bins above which a window is a tone
+TONE_SHARE = 0.7
+# spectral flatness (1 for white noise, 0 for a pure tone) above which a window is noise
+NOISE_FLATNESS = 0.3
+# frequencies the spectrum features look at, Hz
+BAND = (100, 1800)
+
+
+def usage_and_exit():
+    print("""suggest skip and cut times from where the speech starts and ends
+usage: autotrim [--force] "yyyy-mm-dd goswamimj.mp4"
+--force: overwrite skip and cut that are already set""")
+    exit()
+
+
+def suggest(filename):
+    """(skip, cut) in whole seconds, None where the audio needs no trimming or no speech is found"""
+    duration = probe.get_duration(filename)
+    head = classify(filename, 0, HEAD_SECONDS)
+    speech_start = _first_speech(head)
+    skip = None
+    if speech_start is not None and speech_start * WINDOW_SECONDS > PADDING_SECONDS:
+        skip = int(speech_start * WINDOW_SECONDS - PADDING_SECONDS)
+    cut = None
+    if duration is not None:
+        tail_start = max(0, int(duration) - HEAD_SECONDS)
+        tail = classify(filename, tail_start, HEAD_SECONDS)
+        speech_end = _last_speech(tail)
+        if speech_end is not None:
+            end = tail_start + speech_end * WINDOW_SECONDS + PADDING_SECONDS
+            if end < duration:
+                cut = int(np.ceil(end))
+    return skip, cut
+
+
+def write_suggestions(filename, force=False):
+    """Put the suggestions to the .yml (unless set already or forced), return them"""
+    skip, cut = suggest(filename)
+    # empty or invalid values (e.g. cleared in the gui) count as not set, an explicit 0 does not
+    if skip is not None and (force or meta.time_str_to_timedelta(meta.get_skip_time(filename)) is None):
+        meta.update_yaml(filename, 'skip', skip)
+    if cut is not None and (force or meta.get_cut_time_timedelta(filename) is None):
+        meta.update_yaml(filename, 'cut', cut)
+    return skip, cut
+
+
+def classify(filename, start, duration) -> np.ndarray:
+    """SILENCE, TONE, NOISE or SPEECH for every WINDOW_SECONDS of the audio between start and start + duration"""
+    classifier = Classifier()
+    pcm.analyze(filename, [classifier], sample_rate=SAMPLE_RATE, start=start, duration=duration)
+    return classifier.result()
+
+
+class Classifier(pcm.Reducer):
+    def start(self, sample_rate, channels):
+        super().start(sample_rate, channels)
+        self.window = int(sample_rate * WINDOW_SECONDS)
+        frequencies = np.fft.rfftfreq(self.window, 1 / sample_rate)
+        self._band = (frequencies >= BAND[0]) & (frequencies < BAND[1])
+        self._taper = np.hanning(self.window).astype(np.float32)
+        self._carry = np.empty(0, dtype=np.float32)
+        self._parts = []
+
+    def feed(self, block):
+        samples = block.mean(axis=1)
+        if len(self._carry):
+            samples = np.concatenate((self._carry, samples))
+        whole = len(samples) // self.window * self.window
+        self._carry = samples[whole:].copy()
+        if whole:
+            self._parts.append(self.classify_windows(samples[:whole].reshape(-1, self.window)))
+
+    def result(self):
+        # the last partial window is left out: there's too little of it to tell
+        return np.concatenate(self._parts) if self._parts else np.empty(0, dtype=np.int8)
+
+    def classify_windows(self, windows) -> np.ndarray:
+        rms_db = pcm.to_db(np.sqrt(np.square(windows).mean(axis=1)))
+        power = np.square(np.abs(np.fft.rfft(windows * self._taper, axis=1)))[:, self._band] + 1e-12
+        # a tone is a few bins, leaking into their neighbours
+        strongest = np.sort(power, axis=1)[:, -8:].sum(axis=1)
+        tone_share = strongest / power.sum(axis=1)
+        flatness = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+        classes = np.full(len(windows), SPEECH, dtype=np.int8)
+        classes[flatness > NOISE_FLATNESS] = NOISE
+        classes[tone_share > TONE_SHARE] = TONE
+        classes[rms_db < pcm.SILENCE_DB] = SILENCE
+        return classes
+
+
+def _first_speech(classes):
+    """Index of the window the first mostly speech run starts at, None if there's none"""
+    run = MIN_SPEECH_SECONDS // WINDOW_SECONDS
+    speech = classes == SPEECH
+    if len(speech) < run:
+        return None
+    counts = np.convolve(speech, np.ones(run, dtype=np.int32), 'valid')
+    starts = np.flatnonzero(speech[:len(counts)] & (counts >= SPEECH_SHARE * run))
+    return int(starts[0]) if len(starts) else None
+
+
+def _last_speech(classes):
+    """Index of the window after the last mostly speech run, None if there's none"""
+    first = _first_speech(classes[::-1])
+    return None if first is None else len(classes) - first
+
+
+def main():
+    try:
+        force = '--force' in sys.argv
+        filename = [arg for arg in sys.argv[1:] if arg != '--force'][0]
+    except IndexError:
+        usage_and_exit()
+    if not os.path.isfile(filename):
+        print('file "%s" not found' % filename)
+        print('')
+        usage_and_exit()
+    skip, cut = write_suggestions(filename, force)
+    print('skip: {}'.format('-' if skip is None else skip))
+    print('cut: {}'.format('-' if cut is None else cut))
+
+
+if __name__ == '__main__':
+    main()
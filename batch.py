@@ -0,0 +1,141 @@
+"""
+Process many lectures at once.
+
+All steps of the given scripts for every lecture are planned together and run on one pool
+with global limits per resource (see pipeline.py): N remuxes on the disk, M encodes,
+K uploads. The steps of the longest lectures go first. The uploads share a bandwidth cap
+and the daily API quota (see my_youtube.UploadScheduler).
+"""
+import importlib
+import os
+import sys
+
+import my_youtube
+import pipeline
+import probe
+
+DEFAULT_SCRIPTS = ['orig', 'rus']
+
+
+def usage_and_exit():
+    print("""run scripts for many lectures on one pool of workers
+usage: batch [--disk N] [--cpu N] [--network N] [--bandwidth MBIT] [script ...] dir_or_file [dir_or_file ...]
+scripts: """ + ', '.join(pipeline.SCRIPTS) + ' (' + ' '.join(DEFAULT_SCRIPTS) + """ by default)
+dir: all mp4 files in it having a .yml
+--disk, --cpu, --network: how many steps of the kind may run at once
+--bandwidth: megabits per second all the uploads together may take
+e.g.: batch --cpu 2 orig rus "D:\\festival\"""")
+    exit()
+
+
+def find_lectures(paths) -> list:
+    """The given mp4 files and mp4 files having a .yml in the given directories"""
+    lectures = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                filename = os.path.join(path, name)
+                if name.lower().endswith('.mp4') and os.path.isfile(os.path.splitext(filename)[0] + '.yml'):
+                    lectures.append(filename)
+        elif os.path.isfile(path):
+            lectures.append(path)
+        else:
+            raise FileNotFoundError(path)
+    return lectures
+
+
+def make_pipelines(lectures, scripts=None) -> dict:
+    """{pipeline: lecture name} of the scripts for every lecture, weighted by the lecture's duration"""
+    pipelines = {}
+    for orig_mp4_filename in lectures:
+        cost = probe.get_duration(orig_mp4_filename) or 1.0
+        for script in scripts or DEFAULT_SCRIPTS:
+            p = importlib.import_module(script).make_pipeline(orig_mp4_filename)
+            p.cost = cost
+            pipelines[p] = os.path.splitext(os.path.basename(orig_mp4_filename))[0]
+    return pipelines
+
+
+class BatchView(pipeline.ProgressView):
+    """Totals of the whole batch and a line per running or failed step"""
+    def __init__(self, pipelines, out=None, interval=0.5):
+        """:param pipelines: {pipeline: lecture name}, see make_pipelines()"""
+        self.lectures = dict(pipelines)
+        super().__init__([step for p in pipelines for step in p.steps], out, interval)
+
+    def lines(self) -> list:
+        counts = {}
+        unfinished_lectures = set()
+        for step in self.steps:
+            state = self.states[step][0]
+            counts[state] = counts.get(state, 0) + 1
+            if state not in ('done', 'done before'):
+                unfinished_lectures.add(self.lectures[step.pipeline])
+        lectures = {self.lectures[step.pipeline] for step in self.steps}
+        lines = ['lectures: {}/{} done, steps: {}'.format(
+            len(lectures) - len(unfinished_lectures), len(lectures),
+            ', '.join('{} {}'.format(count, state) for state, count in sorted(counts.items())))]
+        for step in self.steps:
+            state, curr, total = self.states[step]
+            if state in ('running', 'failed'):
+                lines.append('  {} {}  {}'.format(self.lectures[step.pipeline], step.label, state) +
+                             pipeline.percent(state, curr, total))
+        return lines
+
+
+def main():
+    limits = {}
+    bandwidth_mbit = None
+    scripts = []
+    paths = []
+    args = sys.argv[1:]
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg in ('--' + pipeline.DISK, '--' + pipeline.CPU, '--' + pipeline.NETWORK):
+                limits[arg[2:]] = int(args.pop(0))
+            elif arg == '--bandwidth':
+                bandwidth_mbit = float(args.pop(0))
+            elif arg in pipeline.SCRIPTS:
+                scripts.append(arg)
+            else:
+                paths.append(arg)
+        if not paths:
+            usage_and_exit()
+        lectures = find_lectures(paths)
+    except (IndexError, ValueError):
+        usage_and_exit()
+    except FileNotFoundError as e:
+        print('file "%s" not found' % e.args[0])
+        print('')
+        usage_and_exit()
+    if not lectures:
+        print('no lectures found')
+        exit()
+
+    network_limit = limits.get(pipeline.NETWORK, pipeline.default_limits()[pipeline.NETWORK])
+    my_youtube.set_scheduler(my_youtube.UploadScheduler(
+        concurrency=network_limit, bytes_per_second=bandwidth_mbit * 1e6 / 8 if bandwidth_mbit else None))
+    pipelines = make_pipelines(lectures, scripts)
+    try:
+        # e.g. orig and orig_norm (or rus and rus_titled) make the same files
+        pipeline.dependencies([step for p in pipelines for step in p.steps])
+    except ValueError as e:
+        print('these scripts can\'t run together: {}'.format(e))
+        print('')
+        usage_and_exit()
+    try:
+        pipeline.run(list(pipelines), limits, view=BatchView(pipelines))
+    except pipeline.PipelineError as e:
+        for step, exception in e.failed.items():
+            print('{} {}: {}'.format(pipelines[step.pipeline], step.label, exception))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print('interrupted, run it again to resume')
+        sys.exit(130)
+    finally:
+        print('YouTube API quota left today: {}'.format(my_youtube.get_scheduler().quota.remaining()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Time pcm.analyze() (peak, clipping, envelope and silences in one decode) on generated tone and
+noise audio and compare it with decoding the whole file into memory first.
+
+usage: bench_pcm [minutes] [block_seconds]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import pcm
+
+
+def make_source(filename, minutes):
+    # a lecture-like mix: tone and quiet noise with a pause every minute
+    seconds = minutes * 60
+    cmd = ['ffmpeg', '-v', 'error', '-y',
+           '-f', 'lavfi', '-i', 'sine=f=220:r=44100:d={}'.format(seconds),
+           '-f', 'lavfi', '-i', 'anoisesrc=r=44100:a=0.05:d={}'.format(seconds),
+           '-filter_complex', "[0:a][1:a]amix=inputs=2,volume='if(lt(mod(t,60),5),0,1)':eval=frame",
+           '-ac', '2', '-c:a', 'aac', '-b:a', '64k', filename]
+    subprocess.run(cmd, check=True)
+
+
+def reducers():
+    return [pcm.Peak(), pcm.Clipping(), pcm.Envelope(), pcm.Silence()]
+
+
+def streamed(filename, block_seconds):
+    return pcm.analyze(filename, reducers(), block_seconds=block_seconds)
+
+
+def in_memory(filename):
+    res = subprocess.run(pcm.decode_cmd(filename), stdout=subprocess.PIPE, check=True)
+    samples = np.frombuffer(res.stdout, dtype=np.float32).reshape(-1, 1)
+    results = reducers()
+    for reducer in results:
+        reducer.start(pcm.SAMPLE_RATE, 1)
+        reducer.feed(samples)
+    return [reducer.result() for reducer in results]
+
+
+def timed(name, seconds_of_audio, run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{:<24} {:8.2f}s {:6.0f}x realtime {:8.1f} MiB'.format(
+        name, seconds, seconds_of_audio / seconds, peak_memory / 2 ** 20))
+    return seconds, result
+
+
+def main():
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    block_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else pcm.BLOCK_SECONDS
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'source.m4a')
+        make_source(filename, minutes)
+        print('{} min of 44.1 kHz stereo aac, analyzed at {} Hz mono'.format(minutes, pcm.SAMPLE_RATE))
+        decode = ['ffmpeg', '-v', 'error', '-nostdin', '-i', filename, '-ac', '1', '-ar', str(pcm.SAMPLE_RATE),
+                  '-f', 'null', '-']
+        timed('decode only', minutes * 60, lambda: subprocess.run(decode, check=True))
+        _, result = timed('streamed', minutes * 60, lambda: streamed(filename, block_seconds))
+        timed('whole file in memory', minutes * 60, lambda: in_memory(filename))
+        print('{} silences'.format(len(result[3])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare single-process re-encoding with segments.encode() on a synthetic video.
+
+usage: bench_segments [seconds] [jobs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import keyframes
+import segments
+import title
+
+
+def make_source(filename, seconds):
+    # 720p like our lectures, a keyframe every 2 seconds
+    cmd = ['ffmpeg', '-v', 'error', '-y',
+           '-f', 'lavfi', '-i', 'testsrc2=s=1280x720:r=25:d={}'.format(seconds),
+           '-f', 'lavfi', '-i', 'sine=r=44100:d={}'.format(seconds),
+           '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+           '-profile:v', 'main', '-level:v', '3.1', '-g', '50',
+           '-c:a', 'aac',
+           filename]
+    subprocess.run(cmd, check=True)
+
+
+def single_process(input_filename, output_filename):
+    cmd = ['ffmpeg', '-v', 'error', '-y', '-nostdin', '-i', input_filename]
+    cmd += title.get_ffmpeg_encoding_options_from_video_file(input_filename)
+    cmd += [output_filename]
+    subprocess.run(cmd, check=True)
+
+
+def timed(name, run):
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    print('{:<24} {:8.2f}s'.format(name, seconds))
+    return seconds
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_filename = os.path.join(tmp_dir, 'source.mp4')
+        make_source(source_filename, seconds)
+        keyframes.get_keyframes(source_filename)
+        print('{}s of 1280x720, {} cores'.format(seconds, os.cpu_count()))
+        single = timed('single process', lambda: single_process(source_filename, os.path.join(tmp_dir, 'single.mp4')))
+        parallel = timed('segments, {} jobs'.format(jobs),
+                         lambda: segments.encode(source_filename, os.path.join(tmp_dir, 'parallel.mp4'), jobs=jobs))
+        print('speedup: {:.2f}x'.format(single / parallel))
+        keyframes._close(os.path.abspath(source_filename))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare fixed 2 MiB upload chunks with the adaptive chunk size (my_youtube.ChunkSizer)
+on a local fake upload endpoint with the given latency and bandwidth (my_youtube.use_base_url).
+
+usage: bench_upload [megabytes] [latency_ms] [bandwidth_mbit]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import fake_upload_server
+import my_youtube
+
+
+def upload(filename, sizer):
+    body = my_youtube._compose_upload_body(filename)
+    media = my_youtube._FileUpload(filename, chunksize=my_youtube.INITIAL_CHUNK_SIZE, resumable=True)
+    insert_request = my_youtube._get_authenticated_service().videos().insert(
+        part=','.join(body.keys()), body=body, media_body=media)
+    telemetry = my_youtube.UploadTelemetry()
+    my_youtube._resumable_upload(insert_request, filename, lambda curr, total: None, sizer=sizer, telemetry=telemetry)
+    return telemetry
+
+
+def timed(name, run):
+    start = time.perf_counter()
+    telemetry = run()
+    seconds = time.perf_counter() - start
+    sizes = [chunk['size'] for chunk in telemetry.chunks]
+    print('{:<16} {:8.2f}s {:4} chunks, {:.1f}-{:.1f} MiB'.format(
+        name, seconds, len(sizes), min(sizes) / 2 ** 20, max(sizes) / 2 ** 20))
+    return seconds
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    bandwidth_mbit = float(sys.argv[3]) if len(sys.argv) > 3 else 40
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'video.mkv')
+        with open(filename, 'wb') as f:
+            f.write(os.urandom(megabytes * 2 ** 20))
+        print('{} MiB, {:g} ms latency, {:g} Mbit/s'.format(megabytes, latency_ms, bandwidth_mbit))
+        with fake_upload_server.FakeUploadServer(latency_ms / 1000, bandwidth_mbit * 1e6 / 8) as server:
+            my_youtube.use_base_url(server.url)
+            start = time.perf_counter()
+            my_youtube._get_authenticated_service()
+            print('{:<16} {:8.2f}s'.format('service', time.perf_counter() - start))
+            fixed = timed('fixed 2 MiB', lambda: upload(filename, None))
+            adaptive = timed('adaptive', lambda: upload(filename, my_youtube.ChunkSizer()))
+        print('speedup: {:.2f}x'.format(fixed / adaptive))
+
+
+if __name__ == '__main__':
+    main()
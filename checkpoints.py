@@ -0,0 +1,148 @@
+"""
+Journal of finished pipeline steps of a lecture, so that an interrupted run can be resumed.
+
+The journal lives next to the lecture's .yml (<name>.journal). Every finished step appends
+a json line with its label, its fingerprint (e.g. artifacts key of its ffmpeg command)
+and what it made: size, mtime and a quick digest of every output file, or the value
+saved to the .yml (e.g. youtube id of an upload). The line is fsync'ed before the next
+step starts, so a crash loses at most the step that was running.
+
+On a rerun a step is skipped if its last journal entry has the same fingerprint (which
+also covers the size and mtime of its inputs) and its outputs are still there: files are
+checked by size and mtime (the digest is recalculated only if the mtime has changed),
+.yml values by comparing them.
+"""
+import datetime
+import hashlib
+import json
+import os
+
+import filelock
+
+import meta
+
+# bytes read from the start and from the end of a file for its quick digest
+_DIGEST_BLOCK = 1 << 20
+
+
+class Journal:
+    def __init__(self, orig_mp4_filename):
+        self.orig_mp4_filename = orig_mp4_filename
+        self.filename = os.path.splitext(orig_mp4_filename)[0] + '.journal'
+        self._entries = None
+
+    def entries(self) -> dict:
+        """label -> last journal entry of the step"""
+        if self._entries is None:
+            self._entries = _read_journal(self.filename)
+        return self._entries
+
+    def is_done(self, label, fingerprint=None, outputs=()) -> bool:
+        """True if the step has finished before with the same fingerprint and its outputs are intact"""
+        entry = self.entries().get(label)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            return False
+        recorded = entry.get('outputs', {})
+        if set(recorded) != set(outputs):
+            return False
+        return all(_verify_output(output, recorded[output]) for output in outputs)
+
+    def record(self, label, fingerprint=None, outputs=()):
+        """Append entry of a finished step (call after all its outputs are written)"""
+        entry = {
+            'step': label,
+            'fingerprint': fingerprint,
+            'outputs': {output: _describe_output(output) for output in outputs},
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with filelock.FileLock(self.filename + '.lock'):
+            with open(self.filename, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        self.entries()[label] = entry
+
+    def forget(self, label):
+        """Make the step run again next time"""
+        self.record(label, fingerprint='forgotten')
+
+
+def fingerprint(step_fingerprint, inputs) -> str:
+    """Fingerprint of a step run: its own fingerprint and the state of its inputs (files or .yml values)"""
+    state = {}
+    for input_name in inputs:
+        yaml_artifact = _split_yaml_artifact(input_name)
+        if yaml_artifact is not None:
+            state[input_name] = meta.get(*yaml_artifact)
+        else:
+            try:
+                st = os.stat(input_name)
+                state[input_name] = [st.st_size, st.st_mtime_ns]
+            except FileNotFoundError:
+                state[input_name] = None
+    key = {'step': step_fingerprint, 'inputs': state}
+    return hashlib.sha1(json.dumps(key, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _read_journal(filename) -> dict:
+    entries = {}
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[entry['step']] = entry
+                except (ValueError, KeyError, TypeError):
+                    # the last line may be cut short by a crash
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _split_yaml_artifact(output):
+    """(lecture filename, key) for outputs named by pipeline.yaml_artifact(), or None"""
+    filename, sep, key = output.rpartition('#')
+    if sep and key and not os.path.exists(output):
+        return filename, key
+    return None
+
+
+def _describe_output(output):
+    yaml_artifact = _split_yaml_artifact(output)
+    if yaml_artifact is not None:
+        filename, key = yaml_artifact
+        return {'value': meta.get(filename, key)}
+    st = os.stat(output)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digest': quick_digest(output)}
+
+
+def _verify_output(output, description) -> bool:
+    yaml_artifact = _split_yaml_artifact(output)
+    if yaml_artifact is not None:
+        filename, key = yaml_artifact
+        value = meta.get(filename, key)
+        return value is not None and value == description.get('value')
+    try:
+        st = os.stat(output)
+    except FileNotFoundError:
+        return False
+    if st.st_size != description.get('size'):
+        return False
+    if st.st_mtime_ns == description.get('mtime_ns'):
+        return True
+    return quick_digest(output) == description.get('digest')
+
+
+def quick_digest(filename) -> str:
+    """sha1 of the size, the first and the last MiB of the file: cheap even for multi-GB videos"""
+    h = hashlib.sha1()
+    size = os.path.getsize(filename)
+    h.update(str(size).encode('ascii'))
+    with open(filename, 'rb') as f:
+        h.update(f.read(_DIGEST_BLOCK))
+        if size > _DIGEST_BLOCK:
+            f.seek(max(_DIGEST_BLOCK, size - _DIGEST_BLOCK))
+            h.update(f.read(_DIGEST_BLOCK))
+    return h.hexdigest()
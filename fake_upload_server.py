@@ -0,0 +1,260 @@
+"""
+Local stand-in for the YouTube resumable upload endpoint and the read API of the channel's
+uploads, for tests and benchmarks (see my_youtube.use_base_url()).
+
+POST /upload/youtube/v3/videos starts an upload and returns its session uri in Location.
+PUT to the session uri with "Content-Range: bytes first-last/total" (total is '*' while
+unknown) appends a chunk and is answered with 308 and the committed Range, or with 200
+and the video resource once all the bytes are there. "Content-Range: bytes */total"
+asks for the committed range only.
+
+Set drop_after to make the server take only so many bytes of the next chunk and drop
+the connection without answering, like a flaky network does. latency (seconds added to
+every answer) and bandwidth (bytes per second the request bodies are read at) make it
+behave like a remote server.
+
+GET /youtube/v3/channels, /youtube/v3/playlistItems (of UPLOADS_PLAYLIST_ID, newest first,
+paged) and /youtube/v3/videos answer from the finished uploads and add_video(). Pages carry
+an etag and are answered with 304 if it matches If-None-Match.
+"""
+import datetime
+import hashlib
+import http.server
+import itertools
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+
+UPLOAD_PATH = '/upload/youtube/v3/videos'
+API_PATH = '/youtube/v3/'
+UPLOADS_PLAYLIST_ID = 'UUfake'
+
+
+class FakeUploadServer:
+    def __init__(self, latency=0.0, bandwidth=None):
+        # session id -> bytes received so far
+        self.sessions = {}
+        # video id -> content of finished uploads
+        self.videos = {}
+        # video resources of the channel, newest first
+        self.channel = []
+        # session id -> video resource posted to start the upload
+        self._posted = {}
+        self._clock = itertools.count()
+        # (method, path, Content-Range) of every request
+        self.requests = []
+        # bytes of the next chunk to take before dropping the connection, None to take it all
+        self.drop_after = None
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def add_video(self, title, lang=None, recording_date=None, video_id=None):
+        """Put a video on the channel (without content), return its resource"""
+        with self.lock:
+            video_id = video_id or 'video{}'.format(len(self.channel) + 1)
+            return self._add_video(video_id, {'snippet': {'title': title, 'defaultLanguage': lang},
+                                              'recordingDetails': {'recordingDate': recording_date}})
+
+    def rename_video(self, video_id, title):
+        with self.lock:
+            for video in self.channel:
+                if video['id'] == video_id:
+                    video['snippet']['title'] = title
+
+    def _add_video(self, video_id, body):
+        snippet = dict(body.get('snippet') or {})
+        # every video a second after the previous one
+        published_at = datetime.datetime(2020, 1, 1) + datetime.timedelta(seconds=next(self._clock))
+        snippet['publishedAt'] = published_at.isoformat() + 'Z'
+        video = {'id': video_id, 'snippet': snippet, 'recordingDetails': dict(body.get('recordingDetails') or {})}
+        self.channel.insert(0, video)
+        return video
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None  # type: FakeUploadServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._log()
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        with self.fake.lock:
+            if url.path == API_PATH + 'channels':
+                response = {'items': [{'contentDetails': {'relatedPlaylists': {'uploads': UPLOADS_PLAYLIST_ID}}}]}
+            elif url.path == API_PATH + 'playlistItems' and query.get('playlistId') == [UPLOADS_PLAYLIST_ID]:
+                response = self._playlist_page(int(query.get('maxResults', ['5'])[0]),
+                                               int(query.get('pageToken', ['0'])[0]))
+            elif url.path == API_PATH + 'videos':
+                ids = ','.join(query.get('id', [])).split(',')
+                response = {'items': [video for video in self.fake.channel if video['id'] in ids]}
+            else:
+                self._reply(404)
+                return
+            response = json.loads(json.dumps(response))
+        response['etag'] = _etag(response)
+        if self.headers.get('If-None-Match') == response['etag']:
+            self._reply(304)
+            return
+        self._reply(200, json.dumps(response).encode('utf-8'),
+                    {'Content-Type': 'application/json', 'ETag': response['etag']})
+
+    def _playlist_page(self, max_results, first):
+        items = []
+        for video in self.fake.channel[first:first + max_results]:
+            item = {'snippet': {'title': video['snippet'].get('title'),
+                                'publishedAt': video['snippet']['publishedAt'],
+                                'resourceId': {'kind': 'youtube#video', 'videoId': video['id']}}}
+            item['etag'] = _etag(item)
+            items.append(item)
+        response = {'items': items, 'pageInfo': {'totalResults': len(self.fake.channel)}}
+        if first + max_results < len(self.fake.channel):
+            response['nextPageToken'] = str(first + max_results)
+        return response
+
+    def do_POST(self):
+        path = urllib.parse.urlsplit(self.path).path
+        body = self._read_body()
+        self._log()
+        if path != UPLOAD_PATH:
+            self._reply(404)
+            return
+        with self.fake.lock:
+            session_id = str(len(self.fake.sessions) + 1)
+            self.fake.sessions[session_id] = bytearray()
+            try:
+                self.fake._posted[session_id] = json.loads(body.decode('utf-8'))
+            except ValueError:
+                self.fake._posted[session_id] = {}
+        location = 'http://{}:{}/session/{}'.format(*self.server.server_address[:2], session_id)
+        self._reply(200, headers={'Location': location})
+
+    def do_PUT(self):
+        drop_after = None
+        if int(self.headers.get('Content-Length') or 0):
+            with self.fake.lock:
+                drop_after, self.fake.drop_after = self.fake.drop_after, None
+        if drop_after is not None:
+            self._drop(drop_after)
+            return
+        body = self._read_body()
+        self._log()
+        match = re.match(r'^/session/(\w+)$', urllib.parse.urlsplit(self.path).path)
+        session_id = match.group(1) if match else None
+        with self.fake.lock:
+            data = self.fake.sessions.get(session_id)
+        if data is None:
+            self._reply(404)
+            return
+        content_range = self.headers.get('Content-Range', '')
+        match = re.match(r'^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$', content_range)
+        if match is None:
+            self._reply(400)
+            return
+        first, last, total = match.groups()
+        with self.fake.lock:
+            if first is not None:
+                first, last = int(first), int(last)
+                # a chunk may be sent again in part or in whole if its answer got lost
+                if first > len(data) or last - first + 1 != len(body):
+                    self._reply(400)
+                    return
+                data += body[len(data) - first:]
+            if total != '*' and int(total) == len(data):
+                video_id = 'video{}'.format(len(self.fake.channel) + 1)
+                self.fake.videos[video_id] = bytes(data)
+                self.fake._add_video(video_id, self.fake._posted.get(session_id, {}))
+                self._reply(200, json.dumps({'id': video_id}).encode('utf-8'),
+                            {'Content-Type': 'application/json'})
+                return
+            committed = len(data)
+        self._reply(308, headers={'Range': 'bytes=0-{}'.format(committed - 1)} if committed else {})
+
+    def _drop(self, size):
+        """Take the first bytes of the chunk and reset the connection"""
+        body = self.rfile.read(min(size, int(self.headers.get('Content-Length') or 0)))
+        self._log()
+        match = re.match(r'^/session/(\w+)$', urllib.parse.urlsplit(self.path).path)
+        first = re.match(r'^bytes (\d+)-', self.headers.get('Content-Range', ''))
+        with self.fake.lock:
+            data = self.fake.sessions.get(match.group(1)) if match else None
+            if data is not None and first is not None and int(first.group(1)) <= len(data):
+                data += body[len(data) - int(first.group(1)):]
+        # RST instead of FIN: the client fails however far it is with the request (after a FIN
+        # httplib2 would send the request again on its own)
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        self.connection.close()
+        self.close_connection = True
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not self.fake.bandwidth:
+            return self.rfile.read(length)
+        # read a tenth of a second worth of bytes at a time
+        block = max(1, int(self.fake.bandwidth / 10))
+        start = time.monotonic()
+        body = bytearray()
+        while len(body) < length:
+            data = self.rfile.read(min(block, length - len(body)))
+            if not data:
+                break
+            body += data
+            delay = start + len(body) / self.fake.bandwidth - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return bytes(body)
+
+    def _log(self):
+        with self.fake.lock:
+            self.fake.requests.append((self.command, self.path, self.headers.get('Content-Range')))
+
+    def _reply(self, status, body=b'', headers=None):
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _etag(resource):
+    return '"{}"'.format(hashlib.sha1(json.dumps(resource, sort_keys=True).encode('utf-8')).hexdigest())
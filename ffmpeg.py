@@ -1,5 +1,9 @@
+import subprocess
+import re
+
 from meta import get_skip_time, get_cut_time, get_artist_en, get_title_en, get_artist_ru, get_title_ru, \
-    get_year_month_day
+    get_year_month_day, time_str_to_timedelta
+import keyframes
 
 
 def ss_args(filename):
@@ -18,6 +22,68 @@ def to_args(filename):
         return []
 
 
+def seek_args(filename, video_filename=None):
+    """
+    Fast replacement for ss_args() + to_args(): returns (input_args, output_args).
+    input_args (put them before every -i of the source) seek right to the last keyframe
+    of video_filename before the skip time, so ffmpeg doesn't read the skipped part at all;
+    output_args trim the rest of the way to the skip time and cut at the cut time.
+    For audio-only inputs (video_filename=None) we seek exactly to the skip time.
+    The result starts at the same place as with ss_args() + to_args().
+    """
+    skip_str, cut_str = get_skip_time(filename), get_cut_time(filename)
+    skip_time, cut_time = time_str_to_timedelta(skip_str), time_str_to_timedelta(cut_str)
+    if (skip_str and skip_time is None) or (cut_str and cut_time is None):
+        # we can't parse them, so we can't plan the seek: pass them to ffmpeg as they are, like ss_args() + to_args()
+        return [], ss_args(filename) + to_args(filename)
+    skip = skip_time.total_seconds() if skip_time is not None else 0
+    cut = cut_time.total_seconds() if cut_time is not None else None
+    if video_filename is None or skip == 0:
+        seek = skip
+    else:
+        try:
+            seek = keyframes.prev_keyframe(video_filename, skip) or 0
+        except (OSError, subprocess.CalledProcessError):
+            # no index (e.g. no ffprobe): fall back to the slow output-side seek
+            seek = 0
+    return plan_seek(skip, cut, seek)
+
+
+def plan_seek(skip, cut, seek):
+    """
+    Split skip/cut times (in seconds, cut may be None) into input and output -ss/-to arguments
+    given that the input is seeked to `seek` (a keyframe at or before skip)
+    :return: (input_args, output_args)
+    """
+    input_args = []
+    output_args = []
+    if seek > 0:
+        input_args += ['-ss', seconds_arg(seek)]
+    if skip > seek:
+        output_args += ['-ss', seconds_arg(skip - seek)]
+    if cut is not None:
+        output_args += ['-to', seconds_arg(cut - seek)]
+    return input_args, output_args
+
+
+def seconds_arg(seconds):
+    return '{:.6f}'.format(seconds).rstrip('0').rstrip('.')
+
+
+def streamable_args():
+    """Output args making matroska only append to the file (no cues, no header updates at the end), see growingfile.py"""
+    return ['-live', '1']
+
+
+def tee_output(slaves):
+    """
+    Output of the tee muxer writing the same encoded streams to several files
+    :param slaves: [(filename, options)], e.g. ('a.m4a', 'f=ipod:select=a')
+    """
+    return '|'.join('[{}]{}'.format(options, re.sub(r"([\\'|\[\]])", r'\\\1', filename))
+                    for filename, options in slaves)
+
+
 def meta_args(filename, lang):
     if lang == 'ru':
         return meta_args_ru_stereo(filename)
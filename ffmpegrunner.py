@@ -1,8 +1,20 @@
-import subprocess
+import asyncio
+import collections
+import contextlib
+import os
 import re
+import subprocess
+import threading
+import time
+
+import probe
 
 
-def run(cmd, callback=None):
+def run(cmd, callback=None, check=False):
+    """
+    Run ffmpeg, calling callback(curr, total) (in seconds) as it goes.
+    Return its exit code, or raise CalledProcessError if it failed and check is True.
+    """
     curr = 0
     total = None
     p = subprocess.Popen(cmd, stderr=subprocess.PIPE, bufsize=1, universal_newlines=True)
@@ -20,6 +32,9 @@ def run(cmd, callback=None):
                 callback(curr, total)
 
     p.communicate()
+    if check and p.returncode:
+        raise subprocess.CalledProcessError(p.returncode, cmd)
+    return p.returncode
 
 
 regex = re.compile(r'(?P<hours>\d+):'
@@ -31,3 +46,247 @@ def time_to_secs(time):
     m = re.match(regex, time)
     parts = m.groupdict()
     return int(parts['hours'])*3600 + int(parts['min'])*60 + float(parts['sec'])
+
+
+class Progress:
+    """One record of ffmpeg's -progress output"""
+    def __init__(self, fields, total=None):
+        self.fields = fields
+        self.total = total
+
+    @property
+    def out_time(self):
+        """Seconds of output written so far"""
+        for key in ['out_time_us', 'out_time_ms']:  # out_time_ms is in microseconds too
+            value = _to_float(self.fields.get(key))
+            if value is not None:
+                return max(0.0, value / 1000000)
+        try:
+            return max(0.0, time_to_secs(self.fields['out_time']))
+        except (KeyError, AttributeError):
+            return 0.0
+
+    @property
+    def frame(self):
+        return _to_float(self.fields.get('frame'))
+
+    @property
+    def fps(self):
+        return _to_float(self.fields.get('fps'))
+
+    @property
+    def speed(self):
+        """e.g. 12.5 for "12.5x" """
+        return _to_float(self.fields.get('speed', '').rstrip('x'))
+
+    @property
+    def bitrate(self):
+        """kbit/s"""
+        return _to_float(self.fields.get('bitrate', '').replace('kbits/s', ''))
+
+    @property
+    def total_size(self):
+        """bytes"""
+        return _to_float(self.fields.get('total_size'))
+
+    @property
+    def done(self):
+        return self.fields.get('progress') == 'end'
+
+
+class Result:
+    """Outcome of run_progress() and run_async()"""
+    def __init__(self, cmd, returncode, wall_time, cpu_time, stderr_tail, progress):
+        self.cmd = cmd
+        self.returncode = returncode
+        # seconds
+        self.wall_time = wall_time
+        # user + system seconds of this ffmpeg process, None where the platform can't tell
+        # (Windows; run_async() without /proc, where it's read up to the last progress record)
+        self.cpu_time = cpu_time
+        # last lines of stderr
+        self.stderr_tail = stderr_tail
+        # last Progress record, None if ffmpeg didn't get to write any
+        self.progress = progress
+
+    def check_returncode(self):
+        if self.returncode:
+            raise subprocess.CalledProcessError(self.returncode, self.cmd, stderr='\n'.join(self.stderr_tail))
+
+
+def run_progress(cmd, callback=None, progress_callback=None, interval=0.5, stderr_lines=20, check=False) -> Result:
+    """
+    Run ffmpeg reading its machine-readable -progress output instead of scanning stderr.
+    cmd must not write to stdout (it is used for the progress records).
+    :param callback: callback(curr, total) in seconds, like in run()
+    :param progress_callback: progress_callback(Progress) with all fields of the record
+    :param interval: callbacks are called at most once per interval seconds (and for the last record)
+    :param stderr_lines: how many last lines of stderr to keep in the result
+    :param check: raise CalledProcessError (with the stderr tail) if ffmpeg fails
+    """
+    reader = _Reader(cmd, callback, progress_callback, interval, stderr_lines)
+    p = subprocess.Popen(reader.full_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         bufsize=1, universal_newlines=True, encoding='utf-8', errors='replace')
+
+    def read_stderr():
+        for line in p.stderr:
+            reader.feed_stderr(line)
+    stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+    stderr_thread.start()
+    for line in p.stdout:
+        reader.feed_progress(line)
+    cpu_time = None
+    if hasattr(os, 'wait4'):
+        # reap it ourselves to get the resource usage of this very process
+        _, status, rusage = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+        cpu_time = rusage.ru_utime + rusage.ru_stime
+    else:
+        p.wait()
+    stderr_thread.join()
+    p.stdout.close()
+    p.stderr.close()
+    return reader.result(p.returncode, cpu_time, check)
+
+
+async def run_async(cmd, callback=None, progress_callback=None, interval=0.5, stderr_lines=20, check=False,
+                    timeout=None) -> Result:
+    """
+    asyncio version of run_progress(), so that one event loop can drive many ffmpegs at once.
+    If the task is cancelled or the timeout (in seconds) expires, ffmpeg is terminated
+    and CancelledError or subprocess.TimeoutExpired is raised.
+    """
+    reader = _Reader(cmd, callback, progress_callback, interval, stderr_lines)
+    p = await asyncio.create_subprocess_exec(
+        *reader.full_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    async def read_lines(stream, feed):
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            feed(line.decode('utf-8', 'replace'))
+
+    # the event loop reaps the process as soon as it exits, so its cpu time is read while it runs:
+    # when it starts, on every progress record and once more when it closes stdout
+    # (a run shorter than a progress period may still be reaped before the last read)
+    cpu_time = _proc_cpu_time(p.pid)
+
+    def feed_progress(line):
+        nonlocal cpu_time
+        reader.feed_progress(line)
+        if line.startswith('progress='):
+            cpu_time = _proc_cpu_time(p.pid, cpu_time)
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(read_lines(p.stderr, reader.feed_stderr), read_lines(p.stdout, feed_progress)),
+            timeout)
+        cpu_time = _proc_cpu_time(p.pid, cpu_time)
+        await p.wait()
+    except asyncio.TimeoutError:
+        await _terminate(p)
+        raise subprocess.TimeoutExpired(reader.cmd, timeout, stderr='\n'.join(reader.stderr_tail))
+    except BaseException:
+        await _terminate(p)
+        raise
+    return reader.result(p.returncode, cpu_time, check)
+
+
+async def _terminate(p, grace_period=5):
+    if p.returncode is not None:
+        return
+    with contextlib.suppress(ProcessLookupError):
+        p.terminate()
+    try:
+        await asyncio.wait_for(p.wait(), grace_period)
+    except asyncio.TimeoutError:
+        with contextlib.suppress(ProcessLookupError):
+            p.kill()
+        await p.wait()
+
+
+class _Reader:
+    """Parses stderr and -progress lines of one ffmpeg run, calls the callbacks and makes the Result"""
+    def __init__(self, cmd, callback, progress_callback, interval, stderr_lines):
+        self.cmd = list(cmd)
+        self.full_cmd = self.cmd[:1] + ['-progress', 'pipe:1', '-nostats'] + self.cmd[1:]
+        self.callback = callback
+        self.progress_callback = progress_callback
+        self.interval = interval
+        self.stderr_tail = collections.deque(maxlen=stderr_lines)
+        # stderr is read along with the progress records, so the Duration line may come after the first callback
+        self.total = _input_duration(self.cmd) if callback is not None or progress_callback is not None else None
+        self.progress = None
+        self.fields = {}
+        self.last_callback_time = None
+        self.start = time.monotonic()
+
+    def feed_stderr(self, line):
+        line = line.rstrip('\r\n')
+        self.stderr_tail.append(line)
+        if self.total is None:
+            m = re.search(r'Duration: (\d+([:.]\d+)+)', line)
+            if m:
+                self.total = 1 + time_to_secs(m.group(1))
+
+    def feed_progress(self, line):
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return
+        self.fields[key] = value
+        if key != 'progress':
+            return
+        self.progress = Progress(self.fields, self.total)
+        self.fields = {}
+        now = time.monotonic()
+        if self.last_callback_time is None or now - self.last_callback_time >= self.interval or self.progress.done:
+            self.last_callback_time = now
+            if self.callback is not None:
+                self.callback(self.progress.out_time, self.total)
+            if self.progress_callback is not None:
+                self.progress_callback(self.progress)
+
+    def result(self, returncode, cpu_time, check) -> Result:
+        result = Result(
+            cmd=self.cmd,
+            returncode=returncode,
+            wall_time=time.monotonic() - self.start,
+            cpu_time=cpu_time,
+            stderr_tail=list(self.stderr_tail),
+            progress=self.progress)
+        if check:
+            result.check_returncode()
+        return result
+
+
+def _proc_cpu_time(pid, default=None):
+    """user + system seconds of a process that isn't reaped yet from /proc/<pid>/stat, default if it can't be read"""
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as f:
+            stat = f.read()
+        # the fields after "pid (comm)", comm may have spaces and parentheses; utime and stime are the 14th and 15th
+        fields = stat[stat.rindex(b')') + 2:].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return default
+
+
+def _input_duration(cmd):
+    """1 + duration of the first input of cmd like in run(), None if it's not a file (then it's read from stderr)"""
+    try:
+        filename = cmd[cmd.index('-i') + 1]
+    except (ValueError, IndexError):
+        return None
+    if not os.path.isfile(filename):
+        return None
+    # the runner must not leave sidecars (and temp/ directories) next to whatever it reads
+    duration = probe.get_duration(filename, persist=False)
+    return 1 + duration if duration is not None else None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
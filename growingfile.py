@@ -0,0 +1,106 @@
+"""
+Resumable upload of a file that is still being written, e.g. by ffmpeg.
+
+GrowingFileUpload is a googleapiclient media source that follows the file: every chunk is
+sent as soon as it is on disk and the upload is finalized once the writer calls finish().
+The writer must only append to the file, for matroska use ffmpeg.streamable_args().
+"""
+import os
+import threading
+import time
+
+import googleapiclient.http
+
+# googleapiclient requires chunks to be multiples of 256 KiB
+CHUNK_SIZE_ALIGNMENT = 256 * 1024
+
+
+class WriterFailed(Exception):
+    pass
+
+
+class GrowingFileUpload(googleapiclient.http.MediaUpload):
+    def __init__(self, filename, mimetype='application/octet-stream', chunksize=8 * 1024 * 1024, poll_interval=0.5):
+        super().__init__()
+        self._filename = filename
+        self._mimetype = mimetype
+        self.set_chunksize(chunksize)
+        self._poll_interval = poll_interval
+        # seconds spent waiting for the writer, so that the upload speed can be measured without them
+        self.wait_seconds = 0.0
+        self._changed = threading.Condition()
+        self._finished = False
+        self._error = None
+        # where the next chunk starts, see size()
+        self._next_begin = 0
+
+    def finish(self):
+        """The writer has closed the file, it won't grow anymore"""
+        with self._changed:
+            self._finished = True
+            self._changed.notify_all()
+
+    def abort(self, error=None):
+        """The writer has failed: make the upload fail too instead of waiting for more data"""
+        with self._changed:
+            self._error = error or WriterFailed(self._filename)
+            self._changed.notify_all()
+
+    def chunksize(self):
+        return self._chunksize
+
+    def set_chunksize(self, chunksize):
+        """Size of the next chunks, see my_youtube.ChunkSizer"""
+        if chunksize <= 0 or chunksize % CHUNK_SIZE_ALIGNMENT:
+            raise ValueError('chunksize must be a positive multiple of %d' % CHUNK_SIZE_ALIGNMENT)
+        self._chunksize = chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def size(self):
+        """
+        None while the file is growing, its size after finish().
+        The upload asks for the size before reading each chunk, so this waits until the next
+        chunk is complete and isn't the last one: otherwise an upload of a file whose size is a
+        multiple of the chunk size would end with an empty chunk, which the server rejects.
+        """
+        self._wait_for(self._next_begin + self._chunksize + 1)
+        return self._current_size() if self._finished else None
+
+    def getbytes(self, begin, length):
+        self._wait_for(begin + length)
+        with open(self._filename, 'rb') as f:
+            f.seek(begin)
+            data = f.read(length)
+        self._next_begin = begin + len(data)
+        return data
+
+    def _wait_for(self, end):
+        """Wait until the file is `end` bytes long or the writer has finished"""
+        start = time.monotonic()
+        try:
+            with self._changed:
+                while True:
+                    if self._error is not None:
+                        raise self._error
+                    if self._finished or self._current_size() >= end:
+                        return
+                    self._changed.wait(self._poll_interval)
+        finally:
+            self.wait_seconds += time.monotonic() - start
+
+    def _current_size(self):
+        try:
+            return os.path.getsize(self._filename)
+        except FileNotFoundError:
+            return 0
+
+    def to_json(self):
+        raise NotImplementedError('GrowingFileUpload can\'t be serialized')
@@ -2,7 +2,9 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
 import re
+import threading
 
+import autotrim
 import meta
 from gui_proc import ProcessingFrame
 
@@ -120,12 +122,36 @@ class FileFrame:
         self.replace_text_in_text_widget(self.descr_eng_widget, descr)
         self.descr_eng_active = True
 
-        self.skip_var.set(meta.get_skip_time(source_filename))
+        self.skip_var.set(meta.get_skip_time(source_filename) or '')
         self.enable_widget(self.skip_entry)
 
-        self.cut_var.set(meta.get_cut_time(source_filename))
+        self.cut_var.set(meta.get_cut_time(source_filename) or '')
         self.enable_widget(self.cut_entry)
 
+        if not self.skip_var.get() and not self.cut_var.get():
+            self.suggest_trim(source_filename)
+
+    def suggest_trim(self, source_filename):
+        """Prefill skip and cut with where the speech starts and ends (see autotrim.py)"""
+        # it takes a few seconds, so the window stays responsive meanwhile
+        done = []
+        thread = threading.Thread(target=lambda: done.append(autotrim.write_suggestions(source_filename)),
+                                  daemon=True)
+        thread.start()
+
+        def poll():
+            if thread.is_alive():
+                self.frame.after(200, poll)
+                return
+            if not done or self.filename.get() != source_filename:
+                # failed (see the console) or another file is open by now
+                return
+            if not self.skip_var.get():
+                self.skip_var.set(meta.get_skip_time(source_filename) or '')
+            if not self.cut_var.get():
+                self.cut_var.set(meta.get_cut_time(source_filename) or '')
+        self.frame.after(200, poll)
+
     @staticmethod
     def replace_text_in_text_widget(widget, text):
         widget.delete('1.0', tk.END)
@@ -13,6 +13,7 @@ class ProcessingFrame:
     filename_var = None  # type: tk.StringVar
     rus_button = None  # type: ttk.Button
     rus_titled_button = None  # type: ttk.Button
+    batch_button = None  # type: ttk.Button
     timing_button = None  # type: ttk.Button
     hk_button = None  # type: ttk.Button
     orig_norm_button = None  # type: ttk.Button
@@ -52,6 +53,10 @@ class ProcessingFrame:
         self.rus_titled_button = ttk.Button(self.frame, text='Rus (titled)', command=self.rus_titled_run)
         self.rus_titled_button.grid(row=6, column=1)
 
+        ttk.Label(self.frame, text='Batch (folder):').grid(row=7, column=0)
+        self.batch_button = ttk.Button(self.frame, text='Orig + Rus', command=self.batch_run)
+        self.batch_button.grid(row=7, column=1)
+
 
     def orig_run(self):
         dir = os.path.dirname(__file__)
@@ -93,6 +98,14 @@ class ProcessingFrame:
         print(cmd_str)
         os.system(cmd_str)
 
+    def batch_run(self):
+        dir = os.path.dirname(__file__)
+        path = os.path.join(dir, 'batch.cmd')
+        lectures_dir = os.path.dirname(os.path.abspath(self.filename_var.get()))
+        cmd_str = 'start cmd /c ' + path + ' orig rus ' + '"' + lectures_dir + '"'
+        print(cmd_str)
+        os.system(cmd_str)
+
     def timing_run(self):
         text = audition.timestamps(self.filename_var.get())
         self.parent.clipboard_clear()
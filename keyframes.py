@@ -0,0 +1,144 @@
+"""
+Keyframe index of a video file.
+
+ffprobe lists the flags of the video packets without decoding anything. We keep the
+timestamps of keyframe packets in a small sidecar next to other work files
+(temp/<name>.keyframes): a header with the source size and mtime followed by a packed
+array of doubles (seconds). The sidecar is memory-mapped, searched with bisect and
+rebuilt whenever the source file changes.
+
+The timestamps are relative to the start of the container (format start_time), like the
+times of input -ss and of the skip/cut times in the .yml, not the raw packet pts.
+"""
+import bisect
+import mmap
+import os
+import struct
+import subprocess
+from typing import Optional
+
+import meta
+import probe
+
+# KFI1 indexes had the raw packet pts
+_MAGIC = b'KFI2'
+# magic, padding (so that timestamps are 8-byte aligned), source size, source mtime in ns
+_HEADER = struct.Struct('=4s4xQq')
+_TIMESTAMP = struct.Struct('=d')
+
+# source filename -> (source identity, mmap, memoryview of timestamps)
+_open_indexes = {}
+
+
+def next_keyframe(filename, seconds) -> Optional[float]:
+    """Return timestamp of the first keyframe at or after given time (in seconds), or None"""
+    timestamps = get_keyframes(filename)
+    i = bisect.bisect_left(timestamps, seconds)
+    if i == len(timestamps):
+        return None
+    return timestamps[i]
+
+
+def prev_keyframe(filename, seconds) -> Optional[float]:
+    """Return timestamp of the last keyframe at or before given time (in seconds), or None"""
+    timestamps = get_keyframes(filename)
+    i = bisect.bisect_right(timestamps, seconds)
+    if i == 0:
+        return None
+    return timestamps[i - 1]
+
+
+def get_keyframes(filename):
+    """
+    Return sorted sequence of keyframe timestamps (in seconds) of the first video stream.
+    The index is built on first use and then reused until the source file changes.
+    """
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    source_identity = (st.st_size, st.st_mtime_ns)
+    try:
+        identity, _, timestamps = _open_indexes[filename]
+        if identity == source_identity:
+            return timestamps
+    except KeyError:
+        pass
+    _close(filename)
+
+    index_filename = _index_filename(filename)
+    if _read_header(index_filename) != source_identity:
+        timestamps = _probe_keyframes(filename)
+        _write_index(index_filename, timestamps, source_identity)
+    m, timestamps = _map_index(index_filename)
+    _open_indexes[filename] = (source_identity, m, timestamps)
+    return timestamps
+
+
+def _index_filename(filename):
+    return meta.get_work_filename(filename, '.keyframes')
+
+
+def _probe_keyframes(filename):
+    cmd = ['ffprobe', '-v', 'error',
+           '-select_streams', 'v:0',
+           '-show_entries', 'packet=pts_time,flags',
+           '-of', 'csv=print_section=0',
+           filename]
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+    return _parse_packets(res.stdout.decode('utf-8'), probe.get_start_time(filename))
+
+
+def _parse_packets(csv_str, start_time=0.0):
+    """
+    Parse "pts_time,flags" lines printed by ffprobe, e.g. "2.000000,K__"
+    and return sorted timestamps of the keyframes relative to start_time of the container
+    """
+    timestamps = []
+    for line in csv_str.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or 'K' not in parts[1] or parts[0] == 'N/A':
+            continue
+        timestamps.append(float(parts[0]) - start_time)
+    timestamps.sort()
+    return timestamps
+
+
+def _write_index(index_filename, timestamps, source_identity):
+    os.makedirs(os.path.dirname(index_filename), exist_ok=True)
+    tmp_filename = index_filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, source_identity[0], source_identity[1]))
+        f.write(struct.pack('=%dd' % len(timestamps), *timestamps))
+    os.replace(tmp_filename, index_filename)
+
+
+def _read_header(index_filename):
+    """Return (source size, source mtime) the index was built for, or None if there is no valid index"""
+    try:
+        with open(index_filename, 'rb') as f:
+            header = f.read(_HEADER.size)
+            f.seek(0, os.SEEK_END)
+            file_size = f.tell()
+    except FileNotFoundError:
+        return None
+    if len(header) != _HEADER.size or (file_size - _HEADER.size) % _TIMESTAMP.size:
+        return None
+    magic, size, mtime_ns = _HEADER.unpack(header)
+    if magic != _MAGIC:
+        return None
+    return size, mtime_ns
+
+
+def _map_index(index_filename):
+    with open(index_filename, 'rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with memoryview(m) as view:
+        return m, view[_HEADER.size:].cast('d')
+
+
+def _close(filename):
+    try:
+        _, m, timestamps = _open_indexes.pop(filename)
+    except KeyError:
+        return
+    timestamps.release()
+    m.close()
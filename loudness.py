@@ -0,0 +1,126 @@
+"""
+EBU R128 loudness of a lecture's audio, measured once, so that every encode of it can apply
+a plain linear gain (the volume filter) instead of running an adaptive normalization.
+
+measure() runs the analysis pass of loudnorm over the part of the audio that gets published
+(from the skip to the cut time) and saves integrated loudness, loudness range and true peak to
+a sidecar among the work files (<name> loudness.json). The sidecar remembers the size and mtime
+of the audio and the trim, so the audio is measured again only when one of them changes.
+
+gain() is the gain loudnorm applies in its linear mode: up or down to TARGET_I, but no more
+than keeps the true peak at TARGET_TP (see ffmpeg-notes.md).
+"""
+import json
+import os
+
+import artifacts
+import ffmpeg
+import ffmpegrunner
+import meta
+
+TARGET_I = -16.0
+TARGET_TP = -1.0
+
+SIDECAR_SUFFIX = ' loudness.json'
+
+
+def sidecar_filename(orig_mp4_filename, audio_filename=None):
+    return meta.get_work_filename(audio_filename or orig_mp4_filename, SIDECAR_SUFFIX)
+
+
+def analysis_cmd(orig_mp4_filename, audio_filename=None):
+    """ffmpeg command printing loudnorm's measurement of the published part of the audio (the source's by default)"""
+    # audio alone can be seeked exactly, no need to start at a keyframe
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename)
+    cmd = ['ffmpeg', '-hide_banner']
+    cmd += input_seek_args
+    cmd += ['-i', audio_filename or orig_mp4_filename,
+            '-map', '0:a:0']
+    cmd += output_seek_args
+    cmd += ['-af', 'loudnorm=I={}:TP={}:print_format=json'.format(TARGET_I, TARGET_TP),
+            '-f', 'null', '-']
+    return cmd
+
+
+def load(orig_mp4_filename, audio_filename=None):
+    """The saved measurement if it is still valid, else None"""
+    try:
+        with open(sidecar_filename(orig_mp4_filename, audio_filename), 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if saved.get('key') != _key(orig_mp4_filename, audio_filename):
+        return None
+    return saved.get('loudness')
+
+
+async def measure(orig_mp4_filename, audio_filename=None, progress=None) -> dict:
+    """{'i': LUFS, 'lra': LU, 'tp': dBTP, 'threshold': LUFS}, measured unless it's saved"""
+    loudness = load(orig_mp4_filename, audio_filename)
+    if loudness is not None:
+        return loudness
+    cmd = analysis_cmd(orig_mp4_filename, audio_filename)
+    result = await ffmpegrunner.run_async(cmd, progress, stderr_lines=50, check=True)
+    loudness = parse_loudnorm_output(result.stderr_tail)
+    filename = sidecar_filename(orig_mp4_filename, audio_filename)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump({'key': _key(orig_mp4_filename, audio_filename), 'loudness': loudness}, f, indent=1)
+    os.replace(tmp_filename, filename)
+    return loudness
+
+
+def step(orig_mp4_filename, audio_filename=None):
+    """Pipeline step function measuring the loudness, its output is sidecar_filename()"""
+    async def run(progress):
+        await measure(orig_mp4_filename, audio_filename, progress)
+    run.fingerprint = lambda: artifacts.get_key(analysis_cmd(orig_mp4_filename, audio_filename))
+    return run
+
+
+def parse_loudnorm_output(lines) -> dict:
+    """Measurement from the json that loudnorm prints at the end of stderr"""
+    text = '\n'.join(lines)
+    start = text.rfind('{')
+    end = text.rfind('}')
+    if start < 0 or end < start:
+        raise ValueError('no loudnorm measurement in the ffmpeg output')
+    values = json.loads(text[start:end + 1])
+    return {
+        'i': float(values['input_i']),
+        'lra': float(values['input_lra']),
+        'tp': float(values['input_tp']),
+        'threshold': float(values['input_thresh']),
+    }
+
+
+def gain(loudness) -> float:
+    """dB to add to reach TARGET_I without the true peak going over TARGET_TP"""
+    if loudness['i'] == float('-inf'):
+        # silence
+        return 0.0
+    return min(TARGET_I - loudness['i'], TARGET_TP - loudness['tp'])
+
+
+def volume_filter(orig_mp4_filename, audio_filename=None) -> str:
+    """Filter normalizing the audio by the saved measurement (the loudness step must have run)"""
+    loudness = load(orig_mp4_filename, audio_filename)
+    if loudness is None:
+        raise RuntimeError('loudness of "{}" is not measured'.format(audio_filename or orig_mp4_filename))
+    return 'volume={:.2f}dB'.format(gain(loudness))
+
+
+def _key(orig_mp4_filename, audio_filename):
+    """What the measurement depends on: the audio file and the trim"""
+    audio_filename = audio_filename or orig_mp4_filename
+    try:
+        st = os.stat(audio_filename)
+    except FileNotFoundError:
+        return None
+    return {
+        'audio': os.path.basename(audio_filename),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'cmd': analysis_cmd(orig_mp4_filename, audio_filename)[1:],
+    }
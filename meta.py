@@ -6,16 +6,15 @@ import string
 from typing import Optional
 
 import babel.dates
-import yaml
 
+import yamlcache
 import yamlupdater
 
 
 def _yaml_data(filename) -> dict:
     try:
         yaml_filename = os.path.splitext(filename)[0] + '.yml'
-        with open(yaml_filename, 'r', encoding='UTF-8') as f:
-            return yaml.load(f)
+        return yamlcache.load(yaml_filename)
     except (IndexError, FileNotFoundError):
         return dict()
 
@@ -44,16 +43,35 @@ def get_skip_time_timedelta(filename: str) -> datetime.timedelta:
     :param filename:
     :return: datetime.timedelta
     """
-    skip_time_str = get_skip_time(filename)
-    if not skip_time_str:
+    skip_time = time_str_to_timedelta(get_skip_time(filename))
+    if skip_time is None:
         return datetime.timedelta()
-    m = re.match(r'^(((?P<hours>\d+):)?(?P<minutes>\d{1,2}):)?(?P<seconds>\d{1,2})$', skip_time_str)
+    return skip_time
+
+
+def get_cut_time_timedelta(filename: str) -> Optional[datetime.timedelta]:
+    """
+    get timedelta of the position where the source video file should be cut (from meta data)
+    :param filename:
+    :return: datetime.timedelta or None if there is no (valid) cut time
+    """
+    return time_str_to_timedelta(get_cut_time(filename))
+
+
+def time_str_to_timedelta(time_str: Optional[str]) -> Optional[datetime.timedelta]:
+    """
+    parse [[hours:]minutes:]seconds[.fraction] string, e.g. '1:02:19' or '7:56.5'
+    :return: datetime.timedelta or None if time_str is empty or invalid
+    """
+    if not time_str:
+        return None
+    m = re.match(r'^(((?P<hours>\d+):)?(?P<minutes>\d{1,2}):)?(?P<seconds>\d{1,2}(\.\d+)?)$', time_str)
     if not m:
-        return datetime.timedelta()
+        return None
     params = {}
     for (key, val) in m.groupdict().items():
         if val is not None:
-            params[key] = int(val)
+            params[key] = float(val)
     return datetime.timedelta(**params)
 
 def _yaml_get_time_length(filename: str, key: str) -> Optional[str]:
@@ -1,13 +1,22 @@
 #!/usr/bin/python
 
+import collections
+import contextlib
+import datetime
+import filelock
+import hashlib
 import http.client
 import httplib2
+import io
+import json
 import os
 import random
 import progressbar
 import time
 import re
+import sqlite3
 import sys
+import threading
 
 import googleapiclient.discovery  # build
 import googleapiclient.errors  # HTTPError
@@ -33,6 +42,35 @@ RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, IOError, http.client.NotConnecte
 # codes is raised.
 RETRIABLE_STATUS_CODES = [500, 502, 503, 504]
 
+# The resumable upload session of a file is saved next to it (<file>.upload.json), so that
+# an upload interrupted by a crash or a reboot continues where it has stopped next time.
+UPLOAD_STATE_SUFFIX = '.upload.json'
+
+# Every chunk is a request round-trip, and a failed chunk is sent again as a whole. So the
+# chunk size follows the measured speed: a chunk should take about CHUNK_SECONDS to send.
+# It grows at most twice per chunk on a clean link and halves after every retriable error.
+# Chunks must be multiples of 256 KiB.
+CHUNK_SIZE_ALIGNMENT = 256 * 1024
+INITIAL_CHUNK_SIZE = 2 * 1024 * 1024
+MIN_CHUNK_SIZE = CHUNK_SIZE_ALIGNMENT
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+CHUNK_SECONDS = 15.0
+
+# Quota of the YouTube Data API in units per day, the day ends at midnight Pacific time.
+# Costs: https://developers.google.com/youtube/v3/determine_quota_cost (chunks of an
+# upload are free, only the request starting it costs).
+DAILY_QUOTA = 10000
+QUOTA_COST_INSERT = 1600
+QUOTA_COST_READ = 1
+QUOTA_COST_WRITE = 50
+# Units spent by all the processes, see QuotaLedger
+QUOTA_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quota.json')
+
+# Local copy of the channel's uploads, see UploadsIndex
+UPLOADS_INDEX_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads.sqlite3')
+# UploadsIndex.sync() reads the whole playlist when the last full read is older than that
+UPLOADS_FULL_SYNC_INTERVAL = datetime.timedelta(days=7)
+
 # The CLIENT_SECRETS_FILE variable specifies the name of a file that contains
 # the OAuth 2.0 information for this application, including its client_id and
 # client_secret. You can acquire an OAuth 2.0 client ID and client secret from
@@ -53,6 +91,10 @@ REQUEST_SCOPES = ' '.join([YOUTUBE_UPLOAD_SCOPE, YOUTUBE_READONLY_SCOPE])
 YOUTUBE_API_SERVICE_NAME = 'youtube'
 YOUTUBE_API_VERSION = 'v3'
 
+# The discovery document of the API is saved here when it's first downloaded, so that
+# building the service doesn't need a request (googleapiclient 2 ships the document).
+DISCOVERY_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'youtube.v3.discovery.json')
+
 # This variable defines a message to display if the CLIENT_SECRETS_FILE is
 # missing.
 MISSING_CLIENT_SECRETS_MESSAGE = """
@@ -72,7 +114,59 @@ https://developers.google.com/api-client-library/python/guide/aaa_client_secrets
                                    CLIENT_SECRETS_FILE))
 
 
+# The service is built once per thread (httplib2 connections can't be shared between threads)
+# and the credentials are read once per process, see _get_authenticated_service().
+_lock = threading.Lock()
+_local = threading.local()
+_discovery = None
+_credentials = None
+# see use_base_url()
+_base_url = None
+# bumped by use_base_url() to make the threads build their services again
+_generation = 0
+
+
+def use_base_url(base_url, credentials=None):
+    """
+    Talk to the API at base_url (e.g. fake_upload_server.FakeUploadServer().url) instead of YouTube,
+    unauthorized unless credentials are given. use_base_url(None) goes back to YouTube.
+    """
+    global _base_url, _credentials, _generation
+    with _lock:
+        _base_url = base_url
+        _credentials = credentials
+        _generation += 1
+    # calls to another endpoint aren't charged to the channel's quota
+    set_scheduler(UploadScheduler(quota=QuotaLedger(None)) if base_url is not None else None)
+
+
 def _get_authenticated_service():
+    """Service of the current thread, built from the saved discovery document on the first call"""
+    credentials = _get_credentials()
+    cached = getattr(_local, 'service', None)
+    if cached is None or cached[0] != _generation:
+        # build_http() doesn't take the 308 of an unfinished upload chunk for a redirect
+        http = googleapiclient.http.build_http()
+        if credentials is not None:
+            http = credentials.authorize(http)
+        http = _ScheduledHttp(http)
+        service = googleapiclient.discovery.build_from_document(_discovery_document(_base_url), http=http)
+        cached = _local.service = (_generation, service)
+    return cached[1]
+
+
+def _get_credentials():
+    """Credentials read once per process and refreshed only when they've expired, None if unauthorized"""
+    global _credentials
+    with _lock:
+        if _credentials is None and _base_url is None:
+            _credentials = _read_credentials()
+        if _credentials is not None and _credentials.access_token_expired:
+            _credentials.refresh(httplib2.Http())
+        return _credentials
+
+
+def _read_credentials():
     flow = oauth2client.client.flow_from_clientsecrets(CLIENT_SECRETS_FILE,
                                                        scope=REQUEST_SCOPES,
                                                        message=MISSING_CLIENT_SECRETS_MESSAGE)
@@ -82,12 +176,231 @@ def _get_authenticated_service():
 
     if credentials is None or credentials.invalid:
         credentials = oauth2client.tools.run_flow(flow, storage)
+    return credentials
+
+
+def _discovery_document(base_url=None) -> dict:
+    global _discovery
+    if _discovery is None:
+        _discovery = _load_discovery_document()
+    if base_url is None:
+        return _discovery
+    root_url = base_url.rstrip('/') + '/'
+    return dict(_discovery, rootUrl=root_url, baseUrl=root_url + _discovery.get('servicePath', ''))
+
+
+def _load_discovery_document() -> dict:
+    """The saved document, the one shipped with googleapiclient or the downloaded one (which is saved)"""
+    try:
+        with open(DISCOVERY_FILENAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+    try:
+        import googleapiclient.discovery_cache
+        content = googleapiclient.discovery_cache.get_static_doc(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION)
+        if content is not None:
+            return json.loads(content)
+    except (ImportError, AttributeError):
+        pass
+    url = googleapiclient.discovery.DISCOVERY_URI.format(api=YOUTUBE_API_SERVICE_NAME,
+                                                         apiVersion=YOUTUBE_API_VERSION)
+    resp, content = httplib2.Http().request(url)
+    if resp.status >= 400:
+        raise googleapiclient.errors.HttpError(resp, content, uri=url)
+    document = json.loads(content.decode('utf-8'))
+    tmp_filename = DISCOVERY_FILENAME + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(document, f)
+    os.replace(tmp_filename, DISCOVERY_FILENAME)
+    return document
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class QuotaLedger:
+    """
+    API quota units spent per day. With a filename, the ledger is shared by all the processes
+    (e.g. orig and rus started from the gui) and survives restarts.
+    """
+    def __init__(self, filename=QUOTA_FILENAME, daily_quota=DAILY_QUOTA):
+        self.filename = filename
+        self.daily_quota = daily_quota
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def spend(self, units):
+        """Charge units to today's quota, raise QuotaExceeded (charging nothing) if there's not enough left"""
+        with self._lock, self._file_lock():
+            days = self._load()
+            day = _quota_day()
+            if days.get(day, 0) + units > self.daily_quota:
+                raise QuotaExceeded('{} quota units needed, {} of {} left for {}'.format(
+                    units, self.daily_quota - days.get(day, 0), self.daily_quota, day))
+            days[day] = days.get(day, 0) + units
+            self._save(days)
+
+    def spent(self) -> int:
+        """Units spent today"""
+        with self._lock, self._file_lock():
+            return self._load().get(_quota_day(), 0)
+
+    def remaining(self) -> int:
+        return self.daily_quota - self.spent()
+
+    def _file_lock(self):
+        return filelock.FileLock(self.filename + '.lock') if self.filename else contextlib.nullcontext()
+
+    def _load(self) -> dict:
+        if not self.filename:
+            return self._days
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, days):
+        # a week is enough to look back at
+        days = dict(sorted(days.items())[-7:])
+        if not self.filename:
+            self._days = days
+            return
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(days, f, indent=1, sort_keys=True)
+        os.replace(tmp_filename, self.filename)
+
+
+def _quota_day() -> str:
+    """Today in Pacific time, when the quota is reset"""
+    try:
+        import zoneinfo
+        now = datetime.datetime.now(zoneinfo.ZoneInfo('America/Los_Angeles'))
+    except (ImportError, LookupError):
+        # no time zone database (e.g. windows without tzdata): standard time
+        now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=-8)))
+    return now.date().isoformat()
+
+
+class RateLimiter:
+    """Token bucket: at most bytes_per_second on average to all its users together, in bursts of up to a second"""
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._tokens = bytes_per_second
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        """Wait until size bytes may be sent"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.bytes_per_second, self._tokens + (now - self._last) * self.bytes_per_second)
+            self._last = now
+            # going into debt makes the next ones wait too: they are served in turn
+            self._tokens -= size
+            delay = -self._tokens / self.bytes_per_second if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class UploadScheduler:
+    """
+    Uploads of the process (e.g. of all the pipelines of a batch): at most `concurrency` run at
+    once and the rest wait in turn, together they send at most bytes_per_second (so that the link
+    is left for e.g. a livestream recording) and the API calls are charged to the quota ledger.
+    """
+    def __init__(self, concurrency=2, bytes_per_second=None, quota=None):
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(bytes_per_second) if bytes_per_second else None
+        self.quota = quota if quota is not None else QuotaLedger()
+        self._changed = threading.Condition()
+        self._queue = collections.deque()
+        self._running = 0
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Wait for the turn of an upload and hold it for the with block"""
+        ticket = object()
+        with self._changed:
+            self._queue.append(ticket)
+            try:
+                while self._queue[0] is not ticket or self._running >= self.concurrency:
+                    self._changed.wait()
+            finally:
+                self._queue.remove(ticket)
+                self._changed.notify_all()
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._running -= 1
+                self._changed.notify_all()
+
+
+_scheduler = None
+
+
+def get_scheduler() -> UploadScheduler:
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = UploadScheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    """Use the scheduler for the uploads and the API calls from now on, None for the default one"""
+    global _scheduler
+    with _lock:
+        _scheduler = scheduler
+
+
+class _ScheduledHttp:
+    """http of the services: charges the API calls to the quota and throttles the upload chunks"""
+    def __init__(self, http):
+        self._http = http
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        scheduler = get_scheduler()
+        if any(name.lower() == 'content-range' for name in headers or {}):
+            # a chunk of an upload (or a query of its progress)
+            if body and scheduler.limiter is not None:
+                body = _ThrottledBody(body, scheduler.limiter)
+        else:
+            scheduler.quota.spend(_quota_cost(uri, method))
+        return self._http.request(uri, method, body, headers, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+
+def _quota_cost(uri, method):
+    if method == 'GET':
+        return QUOTA_COST_READ
+    if method == 'POST' and '/upload/' in uri:
+        return QUOTA_COST_INSERT
+    return QUOTA_COST_WRITE
 
-    return googleapiclient.discovery.build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
-                                           http=credentials.authorize(httplib2.Http()))
 
+class _ThrottledBody:
+    """Request body that is read (by http.client, while sending it) no faster than the limiter allows"""
+    _BLOCK_SIZE = 64 * 1024
 
-def _initialize_upload(youtube, filename, body, update):
+    def __init__(self, body, limiter):
+        self._body = io.BytesIO(body) if isinstance(body, (bytes, bytearray)) else body
+        self._limiter = limiter
+
+    def read(self, size=-1):
+        data = self._body.read(self._BLOCK_SIZE if size is None or size < 0 else min(size, self._BLOCK_SIZE))
+        self._limiter.consume(len(data))
+        return data
+
+
+def _initialize_upload(youtube, filename, body, update, media=None, telemetry=None):
     # Call the API's videos.insert method to create and upload the video.
     insert_request = youtube.videos().insert(
         part=','.join(body.keys()),
@@ -103,13 +416,135 @@ def _initialize_upload(youtube, filename, body, update):
         # practice, but if you're using Python older than 2.6 or if you're
         # running on App Engine, you should set the chunksize to something like
         # 1024 * 1024 (1 megabyte).
-        media_body=googleapiclient.http.MediaFileUpload(filename, chunksize=2*1024*1024, resumable=True)
+        media_body=media or _FileUpload(filename, chunksize=INITIAL_CHUNK_SIZE, resumable=True)
     )
 
-    video_id = _resumable_upload(insert_request, filename, update)
+    # a growing file (see growingfile.py) is written anew if the upload is interrupted
+    state = _UploadState(filename, body) if media is None else None
+    sizer = ChunkSizer(insert_request.resumable.chunksize())
+    video_id = _resumable_upload(insert_request, filename, update, state, sizer, telemetry)
     return video_id
 
 
+class _FileUpload(googleapiclient.http.MediaFileUpload):
+    """MediaFileUpload whose chunk size can be changed between chunks"""
+    def set_chunksize(self, chunksize):
+        self._chunksize = chunksize
+
+
+class ChunkSizer:
+    """Size of the next chunk of an upload, see CHUNK_SECONDS"""
+    def __init__(self, chunk_size=INITIAL_CHUNK_SIZE, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE,
+                 chunk_seconds=CHUNK_SECONDS):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.chunk_seconds = chunk_seconds
+        self.chunk_size = self._clamp(chunk_size)
+
+    def succeeded(self, size, seconds) -> int:
+        """A chunk of `size` bytes was sent in `seconds`: return the size of the next one"""
+        if size > 0 and seconds > 0:
+            target = size / seconds * self.chunk_seconds
+            self.chunk_size = self._clamp(min(target, 2 * self.chunk_size))
+        return self.chunk_size
+
+    def failed(self) -> int:
+        """A chunk has failed with a retriable error: return the size of the next try"""
+        self.chunk_size = self._clamp(self.chunk_size // 2)
+        return self.chunk_size
+
+    def _clamp(self, size):
+        size = int(size) // CHUNK_SIZE_ALIGNMENT * CHUNK_SIZE_ALIGNMENT
+        return max(self.min_size, min(self.max_size, size))
+
+
+class UploadTelemetry:
+    """
+    Log of the chunks of an upload: a dict per chunk with its offset, size, seconds, bytes_per_second,
+    retries (failed tries before it went through) and next_chunk_size, also appended to the json lines
+    log file if given. Pass it to upload() and read it from the progress callback.
+    """
+    def __init__(self, log_filename=None):
+        self.log_filename = log_filename
+        self.chunks = []
+
+    def add(self, offset, size, seconds, retries, next_chunk_size):
+        chunk = {
+            'offset': offset,
+            'size': size,
+            'seconds': round(seconds, 3),
+            'bytes_per_second': round(size / seconds) if seconds > 0 else None,
+            'retries': retries,
+            'next_chunk_size': next_chunk_size,
+        }
+        self.chunks.append(chunk)
+        if self.log_filename is not None:
+            with open(self.log_filename, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(chunk) + '\n')
+        return chunk
+
+    def bytes_per_second(self):
+        """Average speed of the upload so far, None before the first chunk"""
+        seconds = sum(chunk['seconds'] for chunk in self.chunks)
+        return sum(chunk['size'] for chunk in self.chunks) / seconds if seconds > 0 else None
+
+
+class _UploadState:
+    """Session uri and uploaded size of an upload of the file with the body, saved next to the file"""
+    def __init__(self, filename, body):
+        self.filename = filename + UPLOAD_STATE_SUFFIX
+        st = os.stat(filename)
+        self.identity = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'body': hashlib.sha1(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest(),
+        }
+
+    def load(self):
+        """Saved session uri of the same file and body, or None"""
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('identity') == self.identity:
+                return state.get('session_uri')
+        except (FileNotFoundError, ValueError, AttributeError):
+            pass
+        return None
+
+    def save(self, session_uri, offset):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump({'identity': self.identity, 'session_uri': session_uri, 'offset': offset}, f)
+        os.replace(tmp_filename, self.filename)
+
+    def clear(self):
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+
+def _resume_session(insert_request, session_uri, file_size):
+    """
+    Continue the upload in a saved session from the size the server has got.
+    :return: (status, body) like insert_request.next_chunk(), (None, None) if the session has expired
+    """
+    resp, content = insert_request.http.request(session_uri, 'PUT', headers={
+        'Content-Range': 'bytes */%d' % file_size,
+        'content-length': '0'})
+    if resp.status in (200, 201):
+        return None, insert_request.postproc(resp, content)
+    if resp.status in (404, 410):
+        print('The saved upload session has expired, starting over')
+        return None, None
+    if resp.status != 308:
+        raise googleapiclient.errors.HttpError(resp, content, uri=session_uri)
+    insert_request.resumable_uri = session_uri
+    insert_request.resumable_progress = int(resp['range'].split('-')[1]) + 1 if 'range' in resp else 0
+    print('Resuming the upload from %d bytes' % insert_request.resumable_progress)
+    return googleapiclient.http.MediaUploadProgress(insert_request.resumable_progress, file_size), None
+
+
 def _compose_upload_body(filename, title=None, description=None, lang=None):
     tags = [
         'Bhakti Sudhir Goswami (Person)',
@@ -159,11 +594,21 @@ def _compose_upload_body(filename, title=None, description=None, lang=None):
 
 # This method implements an exponential backoff strategy to resume a
 # failed upload.
-def _resumable_upload(insert_request, filename, update):
+def _resumable_upload(insert_request, filename, update, state=None, sizer=None, telemetry=None):
+    """
+    :param state: _UploadState to save the session to and resume it from
+    :param sizer: ChunkSizer to change the chunk size as the upload goes, if the media allows it
+    :param telemetry: UploadTelemetry to log the chunks to
+    """
     response = None
     error = None
     retry = 0
-    file_size = os.path.getsize(filename)
+    chunk_retries = 0
+    media = insert_request.resumable
+    if not hasattr(media, 'set_chunksize'):
+        sizer = None
+    # the file may still be growing, see growingfile.py
+    file_size = _get_size(filename)
     if update is None:
         print('Uploading file...')
         bar = progressbar.ProgressBar(
@@ -179,15 +624,37 @@ def _resumable_upload(insert_request, filename, update):
         bar.start()
     else:
         update(0, file_size)
+    session_uri = state.load() if state is not None else None
     while response is None:
         try:
-            status, response = insert_request.next_chunk()
+            if session_uri is not None:
+                status, response = _resume_session(insert_request, session_uri, file_size)
+                session_uri = None
+            else:
+                offset = insert_request.resumable_progress
+                wait_seconds = getattr(media, 'wait_seconds', 0.0)
+                start = time.monotonic()
+                status, response = insert_request.next_chunk()
+                # time spent waiting for a growing file to grow is not upload time
+                seconds = time.monotonic() - start - (getattr(media, 'wait_seconds', 0.0) - wait_seconds)
+                size = (insert_request.resumable_progress if response is None else _get_size(filename)) - offset
+                if sizer is not None:
+                    media.set_chunksize(sizer.succeeded(size, seconds))
+                if telemetry is not None:
+                    telemetry.add(offset, size, seconds, chunk_retries, media.chunksize())
+                chunk_retries = 0
+            if state is not None and response is None and insert_request.resumable_uri is not None:
+                state.save(insert_request.resumable_uri, insert_request.resumable_progress)
+            file_size = max(file_size, _get_size(filename))
             if status:
                 if update:
                     update(status.resumable_progress, file_size)
                 else:
+                    bar.max_value = file_size
                     bar.update(status.resumable_progress)
             if response is not None:
+                if state is not None:
+                    state.clear()
                 if 'id' in response:
                     if update:
                         update(file_size, file_size)
@@ -209,6 +676,9 @@ def _resumable_upload(insert_request, filename, update):
         if error is not None:
             print(error)
             retry += 1
+            chunk_retries += 1
+            if sizer is not None:
+                media.set_chunksize(sizer.failed())
             if retry > MAX_RETRIES:
                 raise Exception('No longer attempting to retry.')
 
@@ -216,12 +686,27 @@ def _resumable_upload(insert_request, filename, update):
             sleep_seconds = random.random() * max_sleep
             print('Sleeping %f seconds and then retrying...' % sleep_seconds)
             time.sleep(sleep_seconds)
+            error = None
+
 
+def _get_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except FileNotFoundError:
+        return 0
 
-def upload(filename, title=None, description=None, lang=None, update=None):
-    youtube = _get_authenticated_service()
-    body = _compose_upload_body(filename, title=title, description=description, lang=lang)
-    return _initialize_upload(youtube, filename, body, update=update)
+
+def upload(filename, title=None, description=None, lang=None, update=None, media=None, telemetry=None):
+    """
+    :param media: what to upload instead of the whole file, e.g. growingfile.GrowingFileUpload(filename)
+    to upload it while it's being written
+    :param telemetry: UploadTelemetry to log the chunks to
+    Waits for its turn in the scheduler, see set_scheduler().
+    """
+    with get_scheduler().slot():
+        youtube = _get_authenticated_service()
+        body = _compose_upload_body(filename, title=title, description=description, lang=lang)
+        return _initialize_upload(youtube, filename, body, update=update, media=media, telemetry=telemetry)
 
 
 def print_my_videos():
@@ -232,55 +717,161 @@ def print_my_videos():
 
 
 def get_my_videos(max_count=None):
-    youtube = _get_authenticated_service()
-    # Retrieve the contentDetails part of the channel resource for the
-    # authenticated user's channel.
-    channels_response = youtube.channels().list(
-        mine=True,
-        part='contentDetails'
-    ).execute()
-
-    videos = []
-    chunk_size = min(max_count or 50, 50)
-    for channel in channels_response['items']:
-        # From the API response, extract the playlist ID that identifies the list
-        # of videos uploaded to the authenticated user's channel.
-        uploads_list_id = channel['contentDetails']['relatedPlaylists']['uploads']
-
-        # Retrieve the list of videos uploaded to the authenticated user's channel.
-        playlistitems_list_request = youtube.playlistItems().list(
-            playlistId=uploads_list_id,
-            part='snippet',
-            maxResults=chunk_size
-        )
-
-        while playlistitems_list_request:
-            playlistitems_list_response = playlistitems_list_request.execute()
-
-            # Get information about each video.
-            for playlist_item in playlistitems_list_response['items']:
-                title = playlist_item['snippet']['title']
-                video_id = playlist_item['snippet']['resourceId']['videoId']
-                new_video = {'title': title, 'videoId': video_id}
-                videos.append(new_video)
-                if len(videos) >= max_count:
-                    return videos
-
-            playlistitems_list_request = youtube.playlistItems().list_next(
-                playlistitems_list_request, playlistitems_list_response)
-    return videos
+    """The latest videos of the channel, newest first: [{'title': ..., 'videoId': ...}]"""
+    index = UploadsIndex()
+    index.sync()
+    return [{'title': video['title'], 'videoId': video['id']} for video in index.videos(max_count)]
 
 
 def get_recent_video_id(title):
-    for video in get_my_videos(10):
-        if video['title'] == title:
-            return video['videoId']
-    return None
-
+    """Id of the latest video of the channel with the title, or None"""
+    index = UploadsIndex()
+    index.sync()
+    return index.video_id(title)
+
+
+class UploadsIndex:
+    """
+    Local copy of the channel's uploads: id, title, publish time, language and recording date
+    of every video, so that lookups don't page through the uploads playlist.
+
+    sync() reads the playlist from the newest videos on and stops at the first page that has
+    a known video: the first page is requested with the etag of the last sync and a 304 means
+    there's nothing to do at all. Of the pages read, only new and changed items (e.g. with a
+    new title, they get a new etag) are fetched, so changes to older videos aren't seen.
+    sync(full=True) reads the whole playlist, picks those up and forgets deleted videos; it's
+    done by sync() too once UPLOADS_FULL_SYNC_INTERVAL has passed since the last one, and
+    by `my_youtube --sync`.
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS videos (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            published_at TEXT,
+            lang TEXT,
+            recording_date TEXT,
+            etag TEXT);
+        CREATE INDEX IF NOT EXISTS videos_title ON videos (title, published_at);
+        CREATE INDEX IF NOT EXISTS videos_recording_date ON videos (recording_date, lang);
+        CREATE TABLE IF NOT EXISTS sync (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename or UPLOADS_INDEX_FILENAME
+        with self._connect() as db:
+            db.executescript(self._SCHEMA)
+
+    def sync(self, full=False, page_size=50) -> int:
+        """Bring the index up to date with the channel, return the number of new or changed videos"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        last_full_sync = self._get('last_full_sync')
+        if last_full_sync is None or now - datetime.datetime.fromisoformat(last_full_sync) > UPLOADS_FULL_SYNC_INTERVAL:
+            full = True
+        youtube = _get_authenticated_service()
+        playlist_id = self._get('uploads_playlist_id')
+        if playlist_id is None:
+            channels_response = youtube.channels().list(mine=True, part='contentDetails').execute()
+            playlist_id = channels_response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+            self._set('uploads_playlist_id', playlist_id)
+
+        with self._connect() as db:
+            known = dict(db.execute('SELECT id, etag FROM videos'))
+        changed = {}
+        seen = set()
+        last_etag = None if full else self._get('first_page_etag')
+        first_page_etag = None
+        request = youtube.playlistItems().list(playlistId=playlist_id, part='snippet', maxResults=page_size)
+        while request is not None:
+            if first_page_etag is None and last_etag:
+                request.headers['If-None-Match'] = last_etag
+            try:
+                response = request.execute()
+            except googleapiclient.errors.HttpError as e:
+                if e.resp.status == 304:
+                    return 0
+                raise
+            if first_page_etag is None:
+                first_page_etag = response.get('etag', '')
+            items = response.get('items', [])
+            for item in items:
+                video_id = item['snippet']['resourceId']['videoId']
+                seen.add(video_id)
+                if known.get(video_id) != item.get('etag'):
+                    changed[video_id] = item
+            if not full and any(known.get(item['snippet']['resourceId']['videoId']) == item.get('etag')
+                                for item in items):
+                # the rest of the playlist is older than the last sync
+                break
+            request = youtube.playlistItems().list_next(request, response)
+
+        rows = []
+        ids = list(changed)
+        for i in range(0, len(ids), 50):
+            videos_response = youtube.videos().list(id=','.join(ids[i:i + 50]),
+                                                    part='snippet,recordingDetails').execute()
+            for video in videos_response.get('items', []):
+                snippet = video.get('snippet', {})
+                recording_date = (video.get('recordingDetails') or {}).get('recordingDate')
+                rows.append((video['id'], snippet.get('title', ''), snippet.get('publishedAt'),
+                             snippet.get('defaultLanguage'), recording_date[:10] if recording_date else None,
+                             changed[video['id']].get('etag')))
+        with self._connect() as db:
+            db.executemany('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?)', rows)
+            if full:
+                db.executemany('DELETE FROM videos WHERE id = ?', [(video_id,) for video_id in set(known) - seen])
+                db.execute('INSERT OR REPLACE INTO sync VALUES (?, ?)', ('last_full_sync', now.isoformat()))
+            db.execute('INSERT OR REPLACE INTO sync VALUES (?, ?)', ('first_page_etag', first_page_etag))
+        return len(rows)
+
+    def video_id(self, title):
+        """Id of the latest video with the title, or None"""
+        with self._connect() as db:
+            row = db.execute('SELECT id FROM videos WHERE title = ? ORDER BY published_at DESC LIMIT 1',
+                             (title,)).fetchone()
+        return row[0] if row else None
+
+    def videos(self, max_count=None) -> list:
+        """The latest videos, newest first"""
+        with self._connect() as db:
+            rows = db.execute('SELECT * FROM videos ORDER BY published_at DESC LIMIT ?',
+                              (-1 if max_count is None else max_count,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def missing_russian(self) -> list:
+        """Videos not in russian with no russian video of the same recording date, newest first"""
+        with self._connect() as db:
+            rows = db.execute("""
+                SELECT * FROM videos AS v
+                WHERE v.recording_date IS NOT NULL AND v.lang IS NOT 'ru' AND NOT EXISTS (
+                    SELECT 1 FROM videos AS ru WHERE ru.recording_date = v.recording_date AND ru.lang = 'ru')
+                ORDER BY v.published_at DESC""").fetchall()
+        return [dict(row) for row in rows]
+
+    def _get(self, key):
+        with self._connect() as db:
+            row = db.execute('SELECT value FROM sync WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, value):
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO sync VALUES (?, ?)', (key, value))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Connection that commits (or rolls back) and closes at the end of the with block"""
+        db = sqlite3.connect(self.filename)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
 
 def _main():
     oauth2client.tools.argparser.add_argument('-f', '--file', help='Video file to upload')
     oauth2client.tools.argparser.add_argument('-l', '--list', action='store_true', help='List videos on my channel')
+    oauth2client.tools.argparser.add_argument('--sync', action='store_true',
+                                              help='Read all videos of my channel into the local index')
     args = oauth2client.tools.argparser.parse_args()
     if args.file is not None:
         if not os.path.exists(args.file):
@@ -288,6 +879,8 @@ def _main():
         upload(args.file)
     elif args.list:
         print_my_videos()
+    elif args.sync:
+        print('{} new or changed videos'.format(UploadsIndex().sync(full=True)))
     else:
         oauth2client.tools.argparser.print_help()
 
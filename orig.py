@@ -1,145 +1,168 @@
 import sys
 import os
-import multiprocessing
-import progressbar
-import colorama
 
+import checkpoints
 import ffmpeg
 import meta
 import my_youtube
-import ffmpegrunner
-import title
+import pipeline
 
 
 def usage_and_exit():
     print("""mux en/ru audio files into a Goswami Maharaj's video
-usage: mux "yyyy-mm-dd goswamimj.mp4"
-(or drag and drop the file onto me)""")
+usage: mux [--single-pass] [--stream-upload] "yyyy-mm-dd goswamimj.mp4"
+(or drag and drop the file onto me)
+--single-pass: read the source only once and write m4a, mkv and mp3 from the same ffmpeg run
+--stream-upload: upload the mkv while it's being written""")
     exit()
 
 
-def orig(orig_mp4_filename):
+def orig(orig_mp4_filename, single_pass=False, stream_upload=False):
     """Prepare all files in original language: m4a, mp4, mp3"""
-    lang = meta.get_lang(orig_mp4_filename)
-
-    # first we cut m4a and mp4 version sequentially because these are
-    # IO-bound tasks on the single drive, so running them in parallel
-    # doesn't make much sense.
-    _cut_orig_m4a(orig_mp4_filename, lang, line=0)
-    cut_video_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mkv')
-    _cut_orig_mp4(orig_mp4_filename, cut_video_filename, lang, line=1)
-
-    # And now we run two long-running tasks (uploading to youtube
-    # and encoding mp3) in parallel
-
-    p_upload_orig_mp4 = multiprocessing.Process(
-        target=_upload_orig_mp4,
-        kwargs={'orig_mp4_filename': orig_mp4_filename, 'cut_video_filename': cut_video_filename, 'lang': lang, 'line': 2})
-    p_upload_orig_mp4.start()
-
-    p_encode_orig_mp3 = multiprocessing.Process(
-        target=_encode_orig_mp3,
-        kwargs={'orig_mp4_filename': orig_mp4_filename, 'lang': lang, 'line': 3})
-    p_encode_orig_mp3.start()
+    pipeline.run(make_pipeline(orig_mp4_filename, single_pass, stream_upload))
 
-    p_upload_orig_mp4.join()
-    p_encode_orig_mp3.join()
 
-
-def _cut_orig_mp4(orig_mp4_filename, cut_mp4_filename, lang, line):
+def make_pipeline(orig_mp4_filename, single_pass=False, stream_upload=False) -> pipeline.Pipeline:
+    lang = meta.get_lang(orig_mp4_filename)
+    m4a_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.m4a')
+    cut_video_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mkv')
+    mp3_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mp3')
+    youtube_id = pipeline.yaml_artifact(orig_mp4_filename, 'youtube_id_orig')
+
+    def upload(media, progress):
+        _upload_orig_mp4(orig_mp4_filename, cut_video_filename, lang, progress, media)
+
+    p = pipeline.Pipeline('orig', journal=checkpoints.Journal(orig_mp4_filename))
+    # with stream_upload the mkv is uploaded while it's being written: the remux is much
+    # faster than the upload, so such a step takes a network slot
+    if single_pass:
+        # one ffmpeg demuxes (and decodes) the multi-GB source once and
+        # fans it out to all three outputs
+        outputs = [m4a_filename, cut_video_filename, mp3_filename]
+        if stream_upload:
+            p.add('m4a+mkv+mp3+upload',
+                  pipeline.ffmpeg_upload_step(upload, cut_video_filename,
+                                              _cut_orig_all_cmd, orig_mp4_filename, cut_video_filename, lang, True),
+                  inputs=[orig_mp4_filename], outputs=outputs + [youtube_id], resource=pipeline.NETWORK)
+        else:
+            p.add('m4a+mkv+mp3', pipeline.ffmpeg_step(_cut_orig_all_cmd, orig_mp4_filename, cut_video_filename, lang),
+                  inputs=[orig_mp4_filename], outputs=outputs, resource=pipeline.DISK)
+    else:
+        # m4a and mkv are IO-bound remuxes on the single drive, so they take turns;
+        # mp3 encoding is CPU-bound and runs alongside
+        p.add('m4a', pipeline.ffmpeg_step(_cut_orig_m4a_cmd, orig_mp4_filename, lang),
+              inputs=[orig_mp4_filename], outputs=[m4a_filename], resource=pipeline.DISK)
+        if stream_upload:
+            p.add('mkv+upload',
+                  pipeline.ffmpeg_upload_step(upload, cut_video_filename,
+                                              _cut_orig_mp4_cmd, orig_mp4_filename, cut_video_filename, lang, True),
+                  inputs=[orig_mp4_filename], outputs=[cut_video_filename, youtube_id], resource=pipeline.NETWORK)
+        else:
+            p.add('mkv', pipeline.ffmpeg_step(_cut_orig_mp4_cmd, orig_mp4_filename, cut_video_filename, lang),
+                  inputs=[orig_mp4_filename], outputs=[cut_video_filename], resource=pipeline.DISK)
+        p.add('mp3', pipeline.ffmpeg_step(_encode_orig_mp3_cmd, orig_mp4_filename, lang),
+              inputs=[orig_mp4_filename], outputs=[mp3_filename], resource=pipeline.CPU)
+    if not stream_upload:
+        p.add('upload', lambda progress: _upload_orig_mp4(orig_mp4_filename, cut_video_filename, lang, progress),
+              inputs=[cut_video_filename], outputs=[youtube_id], resource=pipeline.NETWORK)
+    return p
+
+
+def _cut_orig_mp4_cmd(orig_mp4_filename, cut_mp4_filename, lang, streamable=False):
     # title.make_mp4_with_title(orig_mp4_filename, lang)
-    cmd = ['ffmpeg', '-y',
-           '-i', orig_mp4_filename,
-           '-c', 'copy']
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename,
+            '-c', 'copy']
     cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
-    cmd += ffmpeg.ss_args(orig_mp4_filename)
-    cmd += ffmpeg.to_args(orig_mp4_filename)
+    cmd += output_seek_args
+    if streamable:
+        cmd += ffmpeg.streamable_args()
     cmd += [cut_mp4_filename]
-    _run_ffmpeg_at_line(cmd, line, 'mkv')
-
-
-def _upload_orig_mp4(orig_mp4_filename, cut_video_filename, lang, line):
-    def run(callback):
-        title = meta.get_youtube_title(orig_mp4_filename, lang)
-        description = meta.get_youtube_description_orig(orig_mp4_filename, lang)
-        youtube_id = my_youtube.upload(
-            cut_video_filename,
-            title=title,
-            description=description,
-            lang=lang,
-            update=callback)
-        meta.update_yaml(orig_mp4_filename, 'youtube_id_orig', youtube_id)
-    run_with_progressbar(line, run, 'upload')
-
-
-def run_with_progressbar(line, run, name):
-    colorama.init()
-    bar = None
-
-    def callback(curr_value, max_value):
-        nonlocal bar, line
-        cursor_down(line)
-        if bar is None:
-            bar = progressbar.ProgressBar(
-                widgets=[name, ': ', progressbar.Bar(), ' ', progressbar.ETA()],
-                max_value=max_value)
-        bar.update(curr_value)
-        cursor_up(line)
-
-    run(callback)
-
-    cursor_down(line)
-    bar.finish()
-    cursor_up(line + 1)
-
-
-def _cut_orig_m4a(orig_mp4_filename, lang, line):
-    cmd = ['ffmpeg', '-y',
-           '-i', orig_mp4_filename]
+    return cmd
+
+
+def _cut_orig_all_cmd(orig_mp4_filename, cut_mp4_filename, lang, streamable=False):
+    """Cut m4a and mkv and encode mp3 in a single ffmpeg run (each output picks its own streams)"""
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename]
     cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
-    cmd += ffmpeg.ss_args(orig_mp4_filename)
-    cmd += ffmpeg.to_args(orig_mp4_filename)
+    cmd += output_seek_args
     cmd += ['-c:a', 'copy', '-vn',
             meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.m4a')]
-    _run_ffmpeg_at_line(cmd, line, 'm4a')
-
-
-def cursor_down(line):
-    print('\x1b[%dB' % line, end='')
-
-
-def cursor_up(line):
-    print('\x1b[%dA' % line, end='')
 
+    cmd += ['-c', 'copy']
+    cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
+    cmd += output_seek_args
+    if streamable:
+        cmd += ffmpeg.streamable_args()
+    cmd += [cut_mp4_filename]
 
-def _run_ffmpeg_at_line(cmd, line, name):
-    def run(callback):
-        ffmpegrunner.run(cmd, callback)
-    run_with_progressbar(line, run, name)
+    cmd += ['-vn', '-ac', '1',
+            '-codec:a', 'mp3', '-b:a', '96k']
+    cmd += output_seek_args
+    cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
+    cmd += [meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mp3')]
+    return cmd
+
+
+def _upload_orig_mp4(orig_mp4_filename, cut_video_filename, lang, progress, media=None):
+    title = meta.get_youtube_title(orig_mp4_filename, lang)
+    description = meta.get_youtube_description_orig(orig_mp4_filename, lang)
+    youtube_id = my_youtube.upload(
+        cut_video_filename,
+        title=title,
+        description=description,
+        lang=lang,
+        update=progress,
+        media=media)
+    meta.update_yaml(orig_mp4_filename, 'youtube_id_orig', youtube_id)
+
+
+def _cut_orig_m4a_cmd(orig_mp4_filename, lang):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename]
+    cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
+    cmd += output_seek_args
+    cmd += ['-c:a', 'copy', '-vn',
+            meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.m4a')]
+    return cmd
 
 
-def _encode_orig_mp3(orig_mp4_filename, lang, line):
-    cmd = ['ffmpeg', '-y',
-           '-i', orig_mp4_filename,
-           '-ac', '1',
-           '-codec:a', 'mp3', '-b:a', '96k']
-    cmd += ffmpeg.ss_args(orig_mp4_filename)
-    cmd += ffmpeg.to_args(orig_mp4_filename)
+def _encode_orig_mp3_cmd(orig_mp4_filename, lang):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename,
+            '-ac', '1',
+            '-codec:a', 'mp3', '-b:a', '96k']
+    cmd += output_seek_args
     cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
     cmd += [meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mp3')]
-    _run_ffmpeg_at_line(cmd, line, 'mp3')
+    return cmd
 
 
 def main():
     try:
-        orig_mp4_filename = sys.argv[1]
-        if not os.path.isfile(orig_mp4_filename):
-            print('file "%s" not found' % orig_mp4_filename)
-            print('')
-            usage_and_exit()
-        orig(orig_mp4_filename)
-    except (IndexError, KeyboardInterrupt):
+        single_pass = '--single-pass' in sys.argv
+        stream_upload = '--stream-upload' in sys.argv
+        orig_mp4_filename = [arg for arg in sys.argv[1:] if arg not in ('--single-pass', '--stream-upload')][0]
+    except IndexError:
+        usage_and_exit()
+    if not os.path.isfile(orig_mp4_filename):
+        print('file "%s" not found' % orig_mp4_filename)
+        print('')
         usage_and_exit()
+    try:
+        orig(orig_mp4_filename, single_pass=single_pass, stream_upload=stream_upload)
+    except KeyboardInterrupt:
+        print('interrupted, run it again to resume')
+        sys.exit(130)
 
 if __name__ == '__main__':
     main()
@@ -1,13 +1,11 @@
 import sys
 import os
-import multiprocessing
-import progressbar
-import colorama
 
+import checkpoints
 import ffmpeg
 import meta
 import my_youtube
-import ffmpegrunner
+import pipeline
 import title
 
 
@@ -20,118 +18,85 @@ usage: mux "yyyy-mm-dd goswamimj.mp4"
 
 def orig_titled(orig_mp4_filename):
     """Prepare all files in original language: m4a, mp4, mp3"""
-    lang = meta.get_lang(orig_mp4_filename)
-
-    # first we cut m4a and mp4 version sequentially because these are
-    # IO-bound tasks on the single drive, so running them in parallel
-    # doesn't make much sense.
-    _cut_orig_m4a(orig_mp4_filename, lang, line=0)
-    cut_video_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + ' titled.mkv')
-    _cut_orig_mp4_titled(orig_mp4_filename, cut_video_filename, lang, line=1)
-
-    # And now we run two long-running tasks (uploading to youtube
-    # and encoding mp3) in parallel
-
-    p_upload_orig_mp4 = multiprocessing.Process(
-        target=_upload_orig_mp4,
-        kwargs={'orig_mp4_filename': orig_mp4_filename, 'cut_video_filename': cut_video_filename, 'lang': lang, 'line': 2})
-    p_upload_orig_mp4.start()
+    pipeline.run(make_pipeline(orig_mp4_filename))
 
-    p_encode_orig_mp3 = multiprocessing.Process(
-        target=_encode_orig_mp3,
-        kwargs={'orig_mp4_filename': orig_mp4_filename, 'lang': lang, 'line': 3})
-    p_encode_orig_mp3.start()
 
-    p_upload_orig_mp4.join()
-    p_encode_orig_mp3.join()
+def make_pipeline(orig_mp4_filename) -> pipeline.Pipeline:
+    lang = meta.get_lang(orig_mp4_filename)
+    m4a_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.m4a')
+    cut_video_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + ' titled.mkv')
+    mp3_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mp3')
+
+    p = pipeline.Pipeline('orig_titled', journal=checkpoints.Journal(orig_mp4_filename))
+    p.add('m4a', pipeline.ffmpeg_step(_cut_orig_m4a_cmd, orig_mp4_filename, lang),
+          inputs=[orig_mp4_filename], outputs=[m4a_filename], resource=pipeline.DISK)
+    # only the title is encoded, the rest is copied, so it's mostly reading the source;
+    # the title depends on the .yml too, title.make_mp4_with_title() itself skips it if it's up to date
+    p.add('mkv', lambda progress: _cut_orig_mp4_titled(orig_mp4_filename, cut_video_filename, lang),
+          inputs=[orig_mp4_filename], outputs=[cut_video_filename], resource=pipeline.DISK, checkpoint=False)
+    p.add('mp3', pipeline.ffmpeg_step(_encode_orig_mp3_cmd, orig_mp4_filename, lang),
+          inputs=[orig_mp4_filename], outputs=[mp3_filename], resource=pipeline.CPU)
+    p.add('upload', lambda progress: _upload_orig_mp4(orig_mp4_filename, cut_video_filename, lang, progress),
+          inputs=[cut_video_filename], outputs=[pipeline.yaml_artifact(orig_mp4_filename, 'youtube_id_orig')],
+          resource=pipeline.NETWORK)
+    return p
+
+
+def _cut_orig_mp4_titled(orig_mp4_filename, cut_mp4_filename, lang):
+    title.make_mp4_with_title(orig_mp4_filename, lang, cut_mp4_filename)
 
 
-def _cut_orig_mp4_titled(orig_mp4_filename, cut_mp4_filename, lang, line):
-    title.make_mp4_with_title(orig_mp4_filename, lang, cut_mp4_filename)
+def _upload_orig_mp4(orig_mp4_filename, cut_video_filename, lang, progress):
+    title = meta.get_youtube_title(orig_mp4_filename, lang)
+    description = meta.get_youtube_description_orig(orig_mp4_filename, lang)
+    youtube_id = my_youtube.upload(
+        cut_video_filename,
+        title=title,
+        description=description,
+        lang=lang,
+        update=progress)
+    meta.update_yaml(orig_mp4_filename, 'youtube_id_orig', youtube_id)
 
 
-def _upload_orig_mp4(orig_mp4_filename, cut_video_filename, lang, line):
-    def run(callback):
-        title = meta.get_youtube_title(orig_mp4_filename, lang)
-        description = meta.get_youtube_description_orig(orig_mp4_filename, lang)
-        youtube_id = my_youtube.upload(
-            cut_video_filename,
-            title=title,
-            description=description,
-            lang=lang,
-            update=callback)
-        meta.update_yaml(orig_mp4_filename, 'youtube_id_orig', youtube_id)
-    run_with_progressbar(line, run, 'upload')
-
-
-def run_with_progressbar(line, run, name):
-    colorama.init()
-    bar = None
-
-    def callback(curr_value, max_value):
-        nonlocal bar, line
-        cursor_down(line)
-        if bar is None:
-            bar = progressbar.ProgressBar(
-                widgets=[name, ': ', progressbar.Bar(), ' ', progressbar.ETA()],
-                max_value=max_value)
-        bar.update(curr_value)
-        cursor_up(line)
-
-    run(callback)
-
-    cursor_down(line)
-    bar.finish()
-    cursor_up(line + 1)
-
-
-def _cut_orig_m4a(orig_mp4_filename, lang, line):
-    cmd = ['ffmpeg', '-y',
-           '-i', orig_mp4_filename]
+def _cut_orig_m4a_cmd(orig_mp4_filename, lang):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename]
     cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
-    cmd += ffmpeg.ss_args(orig_mp4_filename)
-    cmd += ffmpeg.to_args(orig_mp4_filename)
+    cmd += output_seek_args
     cmd += ['-c:a', 'copy', '-vn',
             meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.m4a')]
-    _run_ffmpeg_at_line(cmd, line, 'm4a')
-
+    return cmd
 
-def cursor_down(line):
-    print('\x1b[%dB' % line, end='')
 
-
-def cursor_up(line):
-    print('\x1b[%dA' % line, end='')
-
-
-def _run_ffmpeg_at_line(cmd, line, name):
-    def run(callback):
-        ffmpegrunner.run(cmd, callback)
-    run_with_progressbar(line, run, name)
-
-
-def _encode_orig_mp3(orig_mp4_filename, lang, line):
-    cmd = ['ffmpeg', '-y',
-           '-i', orig_mp4_filename,
-           '-ac', '1',
-           '-codec:a', 'mp3', '-b:a', '96k']
-    cmd += ffmpeg.ss_args(orig_mp4_filename)
-    cmd += ffmpeg.to_args(orig_mp4_filename)
+def _encode_orig_mp3_cmd(orig_mp4_filename, lang):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename,
+            '-ac', '1',
+            '-codec:a', 'mp3', '-b:a', '96k']
+    cmd += output_seek_args
     cmd += ffmpeg.meta_args(orig_mp4_filename, lang)
     cmd += [meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mp3')]
-    _run_ffmpeg_at_line(cmd, line, 'mp3')
+    return cmd
 
 
 def main():
     try:
         orig_mp4_filename = sys.argv[1]
-        if not os.path.isfile(orig_mp4_filename):
-            print('file "%s" not found' % orig_mp4_filename)
-            print('')
-            usage_and_exit()
-        orig_titled(orig_mp4_filename)
-    except (IndexError, KeyboardInterrupt):
+    except IndexError:
+        usage_and_exit()
+    if not os.path.isfile(orig_mp4_filename):
+        print('file "%s" not found' % orig_mp4_filename)
+        print('')
         usage_and_exit()
+    try:
+        orig_titled(orig_mp4_filename)
+    except KeyboardInterrupt:
+        print('interrupted, run it again to resume')
+        sys.exit(130)
 
 if __name__ == '__main__':
     main()
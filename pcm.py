@@ -0,0 +1,235 @@
+"""
+Decoded audio as a stream of NumPy blocks, for the analysis that needs the samples themselves
+(levels of a mixdown, silences around a lecture, waveforms).
+
+blocks() pipes raw float samples out of ffmpeg and yields them in blocks of a fixed size, so
+memory stays the same however long the recording is. Reducers (Peak, Clipping, Envelope,
+Silence) fold the blocks into their result with vectorized operations only; analyze() runs
+any of them over a file in a single decode:
+
+    peak, envelope = pcm.analyze(filename, [pcm.Peak(), pcm.Envelope(window_seconds=1)])
+"""
+import collections
+import subprocess
+import threading
+
+import numpy as np
+
+# plenty for levels and silences and about 5 times less to decode and move than 44.1 kHz stereo
+SAMPLE_RATE = 8000
+BLOCK_SECONDS = 10
+# quieter than this (dBFS) is silence
+SILENCE_DB = -45.0
+# last lines of ffmpeg's stderr kept for the error
+STDERR_LINES = 20
+
+
+def decode_cmd(filename, sample_rate=SAMPLE_RATE, channels=1, start=None, duration=None, stream='0:a:0'):
+    """ffmpeg command writing the audio as 32-bit float samples to stdout (start and duration in seconds)"""
+    cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+    if start:
+        cmd += ['-ss', str(start)]
+    if duration is not None:
+        cmd += ['-t', str(duration)]
+    cmd += ['-i', filename,
+            '-map', stream, '-vn',
+            '-ac', str(channels), '-ar', str(sample_rate),
+            '-c:a', 'pcm_f32le', '-f', 'f32le', 'pipe:1']
+    return cmd
+
+
+def blocks(filename, sample_rate=SAMPLE_RATE, channels=1, block_seconds=BLOCK_SECONDS, start=None, duration=None,
+           stream='0:a:0'):
+    """
+    Generator of float32 arrays of shape (frames, channels), block_seconds long (the last one may be shorter).
+    The block is only valid until the next one is asked for: they all share the same buffer.
+    Raises subprocess.CalledProcessError if ffmpeg fails.
+    """
+    cmd = decode_cmd(filename, sample_rate, channels, start, duration, stream)
+    frame_size = 4 * channels
+    buffer = bytearray(max(1, int(sample_rate * block_seconds)) * frame_size)
+    samples = np.frombuffer(buffer, dtype=np.float32).reshape(-1, channels)
+    p = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # stderr is read all along: a damaged recording may make ffmpeg log more errors than the pipe holds
+    stderr_tail = collections.deque(maxlen=STDERR_LINES)
+    stderr_thread = threading.Thread(target=stderr_tail.extend, args=(p.stderr,), daemon=True)
+    stderr_thread.start()
+    try:
+        while True:
+            size = _read_into(p.stdout, buffer)
+            frames = size // frame_size
+            if frames:
+                yield samples[:frames]
+            if size < len(buffer):
+                break
+        if p.wait():
+            stderr_thread.join()
+            stderr = b''.join(stderr_tail).decode('utf-8', 'replace')
+            raise subprocess.CalledProcessError(p.returncode, cmd, stderr=stderr)
+    finally:
+        if p.poll() is None:
+            # the caller has stopped early
+            p.kill()
+        p.wait()
+        stderr_thread.join()
+        p.stdout.close()
+        p.stderr.close()
+
+
+def analyze(filename, reducers, sample_rate=SAMPLE_RATE, channels=1, block_seconds=BLOCK_SECONDS, start=None,
+            duration=None, stream='0:a:0'):
+    """Decode the audio once, feed every block to every reducer and return their results"""
+    for reducer in reducers:
+        reducer.start(sample_rate, channels)
+    for block in blocks(filename, sample_rate, channels, block_seconds, start, duration, stream):
+        for reducer in reducers:
+            reducer.feed(block)
+    return [reducer.result() for reducer in reducers]
+
+
+def to_db(value):
+    """dBFS of an amplitude (an array too), -inf for 0"""
+    with np.errstate(divide='ignore'):
+        return 20 * np.log10(value)
+
+
+class Reducer:
+    def start(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def feed(self, block):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+
+class Peak(Reducer):
+    """Largest absolute sample of each channel (1.0 is full scale)"""
+    def start(self, sample_rate, channels):
+        super().start(sample_rate, channels)
+        self._peak = np.zeros(channels, dtype=np.float32)
+
+    def feed(self, block):
+        np.maximum(self._peak, np.abs(block).max(axis=0), out=self._peak)
+
+    def result(self):
+        return self._peak
+
+
+class Clipping(Reducer):
+    """How many samples of each channel are at full scale (clipped when the level was set too high)"""
+    def __init__(self, threshold=0.999):
+        self.threshold = threshold
+
+    def start(self, sample_rate, channels):
+        super().start(sample_rate, channels)
+        self._count = np.zeros(channels, dtype=np.int64)
+
+    def feed(self, block):
+        self._count += np.count_nonzero(np.abs(block) >= self.threshold, axis=0)
+
+    def result(self):
+        return self._count
+
+
+class _Windowed(Reducer):
+    """Cuts the blocks into windows of window_seconds and passes on the mean square of each (channels mixed)"""
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+
+    def start(self, sample_rate, channels):
+        super().start(sample_rate, channels)
+        self.window = max(1, int(round(sample_rate * self.window_seconds)))
+        # squares of the frames that don't make a whole window yet
+        self._carry = np.empty(0, dtype=np.float32)
+
+    def feed(self, block):
+        squares = np.square(block).mean(axis=1)
+        if len(self._carry):
+            squares = np.concatenate((self._carry, squares))
+        whole = len(squares) // self.window * self.window
+        self._carry = squares[whole:].copy()
+        if whole:
+            self.feed_windows(squares[:whole].reshape(-1, self.window).mean(axis=1))
+
+    def result(self):
+        if len(self._carry):
+            # the last window is shorter
+            self.feed_windows(self._carry.mean(keepdims=True))
+            self._carry = self._carry[:0]
+        return self.windows_result()
+
+    def feed_windows(self, mean_squares):
+        raise NotImplementedError
+
+    def windows_result(self):
+        raise NotImplementedError
+
+
+class Envelope(_Windowed):
+    """RMS of every window_seconds of the audio, float32 array (use to_db() for dBFS)"""
+    def __init__(self, window_seconds=0.1):
+        super().__init__(window_seconds)
+
+    def start(self, sample_rate, channels):
+        super().start(sample_rate, channels)
+        self._parts = []
+
+    def feed_windows(self, mean_squares):
+        self._parts.append(np.sqrt(mean_squares))
+
+    def windows_result(self):
+        return np.concatenate(self._parts) if self._parts else np.empty(0, dtype=np.float32)
+
+
+class Silence(_Windowed):
+    """[(start, end)] in seconds of the runs of at least min_seconds quieter than threshold_db"""
+    def __init__(self, threshold_db=SILENCE_DB, min_seconds=1.0, window_seconds=0.1):
+        super().__init__(window_seconds)
+        self.threshold_db = threshold_db
+        self.min_seconds = min_seconds
+
+    def start(self, sample_rate, channels):
+        super().start(sample_rate, channels)
+        self._threshold = 10 ** (self.threshold_db / 10)
+        self._windows = 0
+        # first window of the run that goes on at the end of the last block, None if it's loud there
+        self._run_start = None
+        self._runs = []
+
+    def feed_windows(self, mean_squares):
+        quiet = (mean_squares < self._threshold).view(np.int8)
+        edges = np.diff(quiet, prepend=np.int8(self._run_start is not None))
+        starts = list(np.flatnonzero(edges == 1) + self._windows)
+        ends = list(np.flatnonzero(edges == -1) + self._windows)
+        if self._run_start is not None:
+            starts.insert(0, self._run_start)
+        self._run_start = starts.pop() if len(starts) > len(ends) else None
+        for start, end in zip(starts, ends):
+            self._add(start, end)
+        self._windows += len(mean_squares)
+
+    def windows_result(self):
+        if self._run_start is not None:
+            self._add(self._run_start, self._windows)
+            self._run_start = None
+        return self._runs
+
+    def _add(self, start, end):
+        seconds = self.window / self.sample_rate
+        if (end - start) * seconds >= self.min_seconds:
+            self._runs.append((float(start * seconds), float(end * seconds)))
+
+
+def _read_into(f, buffer):
+    """Fill the buffer from the pipe, return how many bytes were read (less only at the end)"""
+    view = memoryview(buffer)
+    size = 0
+    while size < len(buffer):
+        n = f.readinto(view[size:])
+        if not n:
+            break
+        size += n
+    return size
@@ -0,0 +1,440 @@
+"""
+Declarative pipelines of ffmpeg/upload steps.
+
+A script describes its work as a Pipeline of steps. Every step names the files (or other
+artifacts, e.g. youtube id saved to the .yml, see yaml_artifact()) it reads and makes and the resource it mostly uses:
+DISK (remuxing big files on the single drive), CPU (encoding) or NETWORK (uploads).
+A step starts as soon as the steps making its inputs are done and a slot of its
+resource is free, so several pipelines (e.g. orig and rus of the same lecture) can be
+run together on the same limits and overlap wherever their steps don't depend on each other.
+
+Step functions are called as run(progress), where progress(curr, total) reports how far
+the step is. Coroutine functions run on the event loop, plain functions in worker threads.
+
+When more steps are ready than a resource has slots, the one heading the longest remaining
+chain of work (by Pipeline.cost, e.g. duration of the lecture) goes first, so that a batch of
+lectures doesn't end with a single long encode running alone.
+
+A pipeline may keep a journal of finished steps (see checkpoints.py): then a rerun after
+a crash or Ctrl+C skips the steps that have finished and whose outputs are still intact.
+"""
+import asyncio
+import heapq
+import importlib
+import itertools
+import os
+import sys
+import threading
+import time
+
+import colorama
+
+import artifacts
+import checkpoints
+import ffmpegrunner
+import growingfile
+
+SCRIPTS = ['orig', 'orig_norm', 'orig_titled', 'rus', 'rus_titled']
+
+DISK = 'disk'
+CPU = 'cpu'
+NETWORK = 'network'
+
+
+def usage_and_exit():
+    print("""run pipelines of several scripts together, so that their steps overlap
+usage: pipeline script [script ...] "yyyy-mm-dd goswamimj.mp4"
+scripts: """ + ', '.join(SCRIPTS) + """
+e.g.: pipeline orig rus "2016-10-07 goswamimj.mp4\"""")
+    exit()
+
+
+def default_limits():
+    """How many steps of each resource may run at once"""
+    return {DISK: 1, CPU: os.cpu_count() or 1, NETWORK: 2}
+
+
+class PipelineError(Exception):
+    def __init__(self, failed):
+        # step -> exception
+        self.failed = failed
+        super().__init__('failed: ' + ', '.join(step.label for step in failed))
+
+
+class Step:
+    def __init__(self, pipeline, name, run, inputs, outputs, resource, fingerprint=None, checkpoint=True):
+        if resource not in (DISK, CPU, NETWORK):
+            raise ValueError('Unknown resource: "' + str(resource) + '"')
+        self.pipeline = pipeline
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.resource = resource
+        # fingerprint() returns what else the result depends on besides the inputs
+        self.fingerprint = fingerprint or getattr(run, 'fingerprint', None)
+        self.checkpoint = checkpoint
+
+    @property
+    def label(self):
+        if self.pipeline.name:
+            return self.pipeline.name + ': ' + self.name
+        return self.name
+
+
+class Pipeline:
+    def __init__(self, name=None, journal=None, cost=1.0):
+        self.name = name
+        self.steps = []
+        # checkpoints.Journal or None
+        self.journal = journal
+        # how long each of its steps takes relative to other pipelines', only used to order them
+        self.cost = cost
+
+    def add(self, name, run, inputs=(), outputs=(), resource=CPU, fingerprint=None, checkpoint=True) -> Step:
+        """
+        Add a step that reads `inputs` and makes `outputs` (filenames or other artifact names)
+        :param fingerprint: fingerprint() -> str, what else the outputs depend on (e.g. command line)
+        :param checkpoint: False for steps that must always run (e.g. those checking their outputs themselves)
+        """
+        step = Step(self, name, run, inputs, outputs, resource, fingerprint, checkpoint)
+        self.steps.append(step)
+        return step
+
+
+def dependencies(steps) -> dict:
+    """
+    Return {step: [steps making its inputs]} for all the steps.
+    Inputs that no step makes are expected to exist already.
+    """
+    makers = {}
+    for step in steps:
+        for output in step.outputs:
+            key = _artifact_key(output)
+            if key in makers:
+                raise ValueError('"{}" is made by both "{}" and "{}"'.format(output, makers[key].label, step.label))
+            makers[key] = step
+    deps = {}
+    for step in steps:
+        deps[step] = []
+        for input_name in step.inputs:
+            maker = makers.get(_artifact_key(input_name))
+            if maker is not None and maker is not step and maker not in deps[step]:
+                deps[step].append(maker)
+    _check_cycles(deps)
+    return deps
+
+
+def priorities(deps) -> dict:
+    """
+    Return {step: cost of the step and of the longest chain of steps waiting for it}
+    :param deps: see dependencies()
+    """
+    dependents = {step: [] for step in deps}
+    for step, step_deps in deps.items():
+        for dep in step_deps:
+            dependents[dep].append(step)
+    result = {}
+    # dependents come after their dependencies in the topological order
+    for step in reversed(_topological_order(deps)):
+        result[step] = step.pipeline.cost + max((result[s] for s in dependents[step]), default=0)
+    return result
+
+
+def run(pipelines, limits=None, view=None):
+    """Run steps of one or several pipelines, see run_async()"""
+    asyncio.run(run_async(pipelines, limits, view))
+
+
+async def run_async(pipelines, limits=None, view=None):
+    """
+    Run steps of the pipelines respecting their dependencies and per-resource limits.
+    If a step fails, steps depending on it are skipped, the rest still runs;
+    PipelineError is raised in the end.
+    :param limits: {resource: count}, see default_limits()
+    :param view: object with update(step, state, curr, total) to show the progress, ProgressView() by default
+    """
+    if isinstance(pipelines, Pipeline):
+        pipelines = [pipelines]
+    steps = [step for p in pipelines for step in p.steps]
+    deps = dependencies(steps)
+    step_priorities = priorities(deps)
+    limits = dict(default_limits(), **(limits or {}))
+    slots = {resource: _Slots(limit) for resource, limit in limits.items()}
+    if view is None:
+        view = ProgressView(steps)
+    loop = asyncio.get_event_loop()
+    tasks = {}
+    failed = {}
+
+    async def run_step(step):
+        dep_results = await asyncio.gather(*[tasks[dep] for dep in deps[step]])
+        if not all(dep_results):
+            view.update(step, 'skipped')
+            return False
+        journal = step.pipeline.journal if step.checkpoint else None
+        if journal is not None:
+            step_fingerprint = _fingerprint(step)
+            if step_fingerprint is not None and journal.is_done(step.label, step_fingerprint, step.outputs):
+                view.update(step, 'done before')
+                return True
+        await slots[step.resource].acquire(step_priorities[step])
+        try:
+            view.update(step, 'running')
+
+            def progress(curr, total):
+                # may be called from a worker thread
+                view.update(step, 'running', curr, total)
+            try:
+                if asyncio.iscoroutinefunction(step.run):
+                    await step.run(progress)
+                else:
+                    await loop.run_in_executor(None, step.run, progress)
+            except Exception as e:
+                failed[step] = e
+                view.update(step, 'failed')
+                return False
+            if journal is not None and step_fingerprint is not None:
+                journal.record(step.label, step_fingerprint, step.outputs)
+        finally:
+            slots[step.resource].release()
+        view.update(step, 'done')
+        return True
+
+    for step in _topological_order(deps):
+        tasks[step] = asyncio.ensure_future(run_step(step))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        view.close()
+    if failed:
+        raise PipelineError(failed) from next(iter(failed.values()))
+
+
+async def run_ffmpeg(cmd, progress=None, inputs=(), outputs=None):
+    """Run ffmpeg from a step (unless its outputs are up to date, see artifacts.py)"""
+    async def run_cmd(cmd):
+        await ffmpegrunner.run_async(cmd, progress, check=True)
+    await artifacts.run_async(cmd, run_cmd, inputs=inputs, outputs=outputs)
+
+
+def yaml_artifact(filename, key):
+    """Name of the artifact "value of the key in the .yml of the lecture" for step inputs/outputs"""
+    return os.path.abspath(filename) + '#' + key
+
+
+def ffmpeg_step(make_cmd, *args):
+    """Step function running the ffmpeg command returned by make_cmd(*args) (made when the step starts)"""
+    async def run(progress):
+        await run_ffmpeg(make_cmd(*args), progress)
+    run.fingerprint = lambda: artifacts.get_key(make_cmd(*args))
+    return run
+
+
+def ffmpeg_upload_step(upload, output_filename, make_cmd, *args):
+    """
+    Step function running the ffmpeg command returned by make_cmd(*args) and uploading the
+    output_filename it writes at the same time: upload(media, progress) is called in a worker
+    thread with a growingfile.GrowingFileUpload of it. The command must only append to the
+    file, see ffmpeg.streamable_args().
+    """
+    return ffmpeg_uploads_step([(upload, output_filename)], make_cmd, *args)
+
+
+def ffmpeg_uploads_step(uploads, make_cmd, *args):
+    """
+    ffmpeg_upload_step() for a command writing several outputs that are uploaded at the same time
+    :param uploads: [(upload, output_filename)], the progress shows them all together
+    """
+    async def run(progress):
+        cmd = make_cmd(*args)
+        up_to_date = artifacts.is_up_to_date(cmd)
+        sizes = {}
+
+        def upload_progress(output_filename):
+            def update(curr, total):
+                sizes[output_filename] = (curr, total)
+                progress(sum(curr for curr, total in sizes.values()), sum(total for curr, total in sizes.values()))
+            return update
+
+        medias = []
+        upload_futures = []
+        for upload, output_filename in uploads:
+            if not up_to_date and os.path.exists(output_filename):
+                # or the old file could be uploaded before ffmpeg truncates it
+                os.remove(output_filename)
+            media = growingfile.GrowingFileUpload(output_filename)
+            medias.append(media)
+            upload_futures.append(asyncio.get_event_loop().run_in_executor(
+                None, upload, media, upload_progress(output_filename)))
+        try:
+            await run_ffmpeg(cmd)
+        except BaseException:
+            for media, upload_future in zip(medias, upload_futures):
+                media.abort()
+                upload_future.cancel()
+            raise
+        for media in medias:
+            media.finish()
+        await asyncio.gather(*upload_futures)
+    run.fingerprint = lambda: artifacts.get_key(make_cmd(*args))
+    return run
+
+
+def _fingerprint(step):
+    """Fingerprint of the step for the journal, None if it can't be made now (e.g. an input is missing)"""
+    try:
+        step_fingerprint = step.fingerprint() if step.fingerprint is not None else None
+        return checkpoints.fingerprint(step_fingerprint, step.inputs)
+    except Exception:
+        return None
+
+
+class _Slots:
+    """Semaphore letting the waiter with the highest priority in first"""
+    def __init__(self, limit):
+        self.free = limit
+        self.waiters = []
+        self.counter = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self.free > 0 and not self.waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over already
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+
+class ProgressView:
+    """Keeps a line per step in the console: its state and progress"""
+    def __init__(self, steps, out=None, interval=0.2):
+        self.steps = list(steps)
+        self.out = out or sys.stdout
+        self.interval = interval
+        self.states = {step: ['waiting', None, None] for step in self.steps}
+        self.lock = threading.Lock()
+        self.last_draw_time = None
+        self.drawn_lines = 0
+        colorama.init()
+
+    def update(self, step, state, curr=None, total=None):
+        with self.lock:
+            self.states[step] = [state, curr, total]
+            now = time.monotonic()
+            if curr is not None and self.last_draw_time is not None and now - self.last_draw_time < self.interval:
+                return
+            self.last_draw_time = now
+            self._draw()
+
+    def close(self):
+        with self.lock:
+            self._draw()
+
+    def lines(self) -> list:
+        if not self.steps:
+            return []
+        width = max(len(step.label) for step in self.steps)
+        lines = []
+        for step in self.steps:
+            state, curr, total = self.states[step]
+            lines.append('{label:<{width}}  {state}'.format(label=step.label, width=width, state=state) +
+                         percent(state, curr, total))
+        return lines
+
+    def _draw(self):
+        lines = self.lines()
+        if not lines and not self.drawn_lines:
+            return
+        # blank the lines left from a longer previous drawing
+        lines += [''] * (self.drawn_lines - len(lines))
+        if self.drawn_lines:
+            self.out.write('\x1b[%dA' % self.drawn_lines)
+        self.out.write(''.join('\r' + line + '\x1b[K\n' for line in lines))
+        self.out.flush()
+        self.drawn_lines = len(lines)
+
+
+def percent(state, curr, total) -> str:
+    """' 42%' for a running step that reports progress, '' otherwise"""
+    if state == 'running' and curr is not None and total:
+        return ' {:3.0f}%'.format(100.0 * min(curr, total) / total)
+    return ''
+
+
+def _artifact_key(name):
+    if os.sep in name or '/' in name:
+        return os.path.normcase(os.path.abspath(name))
+    return name
+
+
+def _topological_order(deps):
+    order = []
+    seen = set()
+
+    def visit(step):
+        if step in seen:
+            return
+        seen.add(step)
+        for dep in deps[step]:
+            visit(dep)
+        order.append(step)
+    for step in deps:
+        visit(step)
+    return order
+
+
+def _check_cycles(deps):
+    # 0 - not visited, 1 - in progress, 2 - done
+    marks = {step: 0 for step in deps}
+
+    def visit(step, path):
+        if marks[step] == 1:
+            raise ValueError('Steps depend on each other: ' + ' -> '.join(s.label for s in path + [step]))
+        if marks[step] == 2:
+            return
+        marks[step] = 1
+        for dep in deps[step]:
+            visit(dep, path + [step])
+        marks[step] = 2
+    for step in deps:
+        visit(step, [])
+
+
+def main():
+    try:
+        scripts = sys.argv[1:-1]
+        orig_mp4_filename = sys.argv[-1]
+        if not scripts or any(script not in SCRIPTS for script in scripts):
+            usage_and_exit()
+    except IndexError:
+        usage_and_exit()
+    if not os.path.isfile(orig_mp4_filename):
+        print('file "%s" not found' % orig_mp4_filename)
+        print('')
+        usage_and_exit()
+    try:
+        run([importlib.import_module(script).make_pipeline(orig_mp4_filename) for script in scripts])
+    except KeyboardInterrupt:
+        print('interrupted, run it again to resume')
+        sys.exit(130)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Cached ffprobe results.
+
+ffprobe runs once per source file (-show_format -show_streams). The parsed json is
+kept in memory and in a sidecar next to other work files (temp/<name>.probe.json),
+both keyed on the source size and mtime, so later runs and other scripts reuse it too.
+"""
+import json
+import os
+import subprocess
+from typing import Optional
+
+import meta
+
+# absolute filename -> (source identity, parsed ffprobe json)
+_cache = {}
+
+
+def probe(filename, persist=True) -> dict:
+    """
+    Return parsed `ffprobe -show_format -show_streams` json of the file (cached), {} if ffprobe fails
+    :param persist: write the sidecar (and its temp/ directory), otherwise it's only cached in memory
+    """
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    identity = [st.st_size, st.st_mtime_ns]
+    try:
+        cached_identity, probe_data = _cache[filename]
+        if cached_identity == identity:
+            return probe_data
+    except KeyError:
+        pass
+
+    sidecar_filename = meta.get_work_filename(filename, '.probe.json')
+    probe_data = _read_sidecar(sidecar_filename, identity)
+    if probe_data is None:
+        probe_data = _run_ffprobe(filename)
+        if probe_data is None:
+            # not cached: the file may be incomplete yet, we'll try again next time
+            return {}
+        if persist:
+            _write_sidecar(sidecar_filename, identity, probe_data)
+    _cache[filename] = (identity, probe_data)
+    return probe_data
+
+
+def get_video_size(filename) -> Optional[list]:
+    """[width, height] of the first video stream"""
+    stream = _first_stream(filename, 'video')
+    try:
+        return [int(stream['width']), int(stream['height'])]
+    except (KeyError, TypeError):
+        return None
+
+
+def get_h264_profile_and_level(filename) -> Optional[list]:
+    """e.g. ['high', '4.0'] for the first video stream"""
+    stream = _first_stream(filename, 'video')
+    try:
+        profile = str.lower(stream['profile'])
+        major, minor = divmod(int(stream['level']), 10)
+        return [profile, '{}.{}'.format(major, minor)]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_duration(filename, persist=True) -> Optional[float]:
+    """Duration of the container in seconds (see probe() for persist)"""
+    try:
+        return float(probe(filename, persist)['format']['duration'])
+    except (KeyError, ValueError):
+        return None
+
+
+def get_start_time(filename) -> float:
+    """Start time of the container in seconds (input -ss is relative to it), 0 if unknown"""
+    try:
+        return float(probe(filename)['format']['start_time'])
+    except (KeyError, ValueError):
+        return 0.0
+
+
+def get_fps(filename) -> Optional[float]:
+    """Frame rate of the first video stream, e.g. 29.97"""
+    stream = _first_stream(filename, 'video')
+    if stream is None:
+        return None
+    for key in ['avg_frame_rate', 'r_frame_rate']:
+        try:
+            num, den = stream[key].split('/')
+            if int(den):
+                return int(num) / int(den)
+        except (KeyError, ValueError):
+            pass
+    return None
+
+
+def get_audio_layout(filename) -> Optional[list]:
+    """[channels, channel_layout] of the first audio stream, e.g. [2, 'stereo']"""
+    stream = _first_stream(filename, 'audio')
+    try:
+        return [int(stream['channels']), stream.get('channel_layout')]
+    except (KeyError, TypeError):
+        return None
+
+
+def _first_stream(filename, codec_type) -> Optional[dict]:
+    for stream in probe(filename).get('streams', []):
+        if stream.get('codec_type') == codec_type:
+            return stream
+    return None
+
+
+def _run_ffprobe(filename) -> Optional[dict]:
+    """Parsed json, None if ffprobe fails (it prints why to stderr)"""
+    cmd = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', filename]
+    res = subprocess.run(cmd, stdout=subprocess.PIPE)
+    if res.returncode:
+        return None
+    try:
+        return json.loads(res.stdout.decode('utf-8'))
+    except ValueError:
+        return None
+
+
+def _read_sidecar(sidecar_filename, identity) -> Optional[dict]:
+    try:
+        with open(sidecar_filename, 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+        if sidecar['source'] == identity:
+            return sidecar['probe']
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _write_sidecar(sidecar_filename, identity, probe_data):
+    os.makedirs(os.path.dirname(sidecar_filename), exist_ok=True)
+    tmp_filename = sidecar_filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump({'source': identity, 'probe': probe_data}, f)
+    os.replace(tmp_filename, sidecar_filename)
@@ -1,60 +1,182 @@
 import sys
 import os
-import subprocess
-import multiprocessing
 
+import checkpoints
 import ffmpeg
 import meta
 import my_youtube
+import pipeline
 
 
 def usage_and_exit():
     print("""echo mux en/ru audio files into a Goswami Maharaj's video
-echo usage: mux "yyyy-mm-dd goswamimj.mp4"
-echo (or drag and drop the file onto me)""")
+echo usage: mux [--single-pass] [--stream-upload] "yyyy-mm-dd goswamimj.mp4"
+echo (or drag and drop the file onto me)
+echo --single-pass: read the source and the mixdown only once and write all m4a, mkv and mp3 files from the same ffmpeg run
+echo --stream-upload: upload the videos while they are being written""")
     exit()
 
 
-def create_and_upload_ru_files(orig_mp4_filename):
-    p1 = multiprocessing.Process(target=_create_and_upload_ru_mono_video, args=(orig_mp4_filename,))
-    p1.start()
-    p2 = multiprocessing.Process(target=_create_and_upload_ru_stereo_video, args=(orig_mp4_filename,))
-    p2.start()
-    p3 = multiprocessing.Process(target=_create_mp3_ru_mono, args=(orig_mp4_filename,))
-    p3.start()
-    p4 = multiprocessing.Process(target=_create_mp3_ru_stereo, args=(orig_mp4_filename,))
-    p4.start()
+def create_and_upload_ru_files(orig_mp4_filename, stream_upload=False, single_pass=False):
+    pipeline.run(make_pipeline(orig_mp4_filename, stream_upload, single_pass))
 
-    p1.join()
-    p2.join()
-    p3.join()
-    p4.join()
 
+def make_pipeline(orig_mp4_filename, stream_upload=False, single_pass=False) -> pipeline.Pipeline:
+    mixdown_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav')
+    ru_mono_m4a_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono.m4a')
+    ru_mono_video_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono.mkv')
+    ru_stereo_video_filename = meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mkv')
+    mono_youtube_id = pipeline.yaml_artifact(orig_mp4_filename, 'youtube_id_rus_mono')
+    stereo_youtube_id = pipeline.yaml_artifact(orig_mp4_filename, 'youtube_id_rus_stereo')
+
+    p = pipeline.Pipeline('rus', journal=checkpoints.Journal(orig_mp4_filename))
+    if single_pass:
+        # one ffmpeg reads the source and the mixdown once and feeds the decoded mixdown
+        # to all four audio encoders
+        outputs = [ru_mono_m4a_filename, ru_mono_video_filename, ru_stereo_video_filename,
+                   meta.get_work_filename(orig_mp4_filename, ' ru_mono.mp3'),
+                   meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mp3')]
+        if stream_upload:
+            uploads = [(lambda media, progress: _upload_ru_mono_video(orig_mp4_filename, progress, media),
+                        ru_mono_video_filename),
+                       (lambda media, progress: _upload_ru_stereo_video(orig_mp4_filename, progress, media),
+                        ru_stereo_video_filename)]
+            p.add('m4a+mkv+mp3+upload', pipeline.ffmpeg_uploads_step(uploads, _ru_all_cmd, orig_mp4_filename, True),
+                  inputs=[orig_mp4_filename, mixdown_filename], outputs=outputs + [mono_youtube_id, stereo_youtube_id],
+                  resource=pipeline.NETWORK)
+        else:
+            p.add('m4a+mkv+mp3', pipeline.ffmpeg_step(_ru_all_cmd, orig_mp4_filename),
+                  inputs=[orig_mp4_filename, mixdown_filename], outputs=outputs, resource=pipeline.CPU)
+            p.add('mono upload', lambda progress: _upload_ru_mono_video(orig_mp4_filename, progress),
+                  inputs=[ru_mono_video_filename], outputs=[mono_youtube_id], resource=pipeline.NETWORK)
+            p.add('stereo upload', lambda progress: _upload_ru_stereo_video(orig_mp4_filename, progress),
+                  inputs=[ru_stereo_video_filename], outputs=[stereo_youtube_id], resource=pipeline.NETWORK)
+        return p
+
+    p.add('mono m4a', pipeline.ffmpeg_step(_ru_mono_m4a_cmd, orig_mp4_filename),
+          inputs=[mixdown_filename], outputs=[ru_mono_m4a_filename], resource=pipeline.CPU)
+    if stream_upload:
+        # the videos are uploaded while they are being written, which takes as long as the upload
+        def upload_mono(media, progress):
+            _upload_ru_mono_video(orig_mp4_filename, progress, media)
+
+        def upload_stereo(media, progress):
+            _upload_ru_stereo_video(orig_mp4_filename, progress, media)
+        p.add('mono mkv+upload',
+              pipeline.ffmpeg_upload_step(upload_mono, ru_mono_video_filename,
+                                          _ru_mono_video_cmd, orig_mp4_filename, True),
+              inputs=[orig_mp4_filename, ru_mono_m4a_filename], outputs=[ru_mono_video_filename, mono_youtube_id],
+              resource=pipeline.NETWORK)
+        p.add('stereo mkv+upload',
+              pipeline.ffmpeg_upload_step(upload_stereo, ru_stereo_video_filename,
+                                          _ru_stereo_video_cmd, orig_mp4_filename, True),
+              inputs=[orig_mp4_filename, mixdown_filename], outputs=[ru_stereo_video_filename, stereo_youtube_id],
+              resource=pipeline.NETWORK)
+    else:
+        p.add('mono mkv', pipeline.ffmpeg_step(_ru_mono_video_cmd, orig_mp4_filename),
+              inputs=[orig_mp4_filename, ru_mono_m4a_filename], outputs=[ru_mono_video_filename],
+              resource=pipeline.DISK)
+        p.add('mono upload', lambda progress: _upload_ru_mono_video(orig_mp4_filename, progress),
+              inputs=[ru_mono_video_filename], outputs=[mono_youtube_id], resource=pipeline.NETWORK)
+        p.add('stereo mkv', pipeline.ffmpeg_step(_ru_stereo_video_cmd, orig_mp4_filename),
+              inputs=[orig_mp4_filename, mixdown_filename], outputs=[ru_stereo_video_filename],
+              resource=pipeline.CPU)
+        p.add('stereo upload', lambda progress: _upload_ru_stereo_video(orig_mp4_filename, progress),
+              inputs=[ru_stereo_video_filename], outputs=[stereo_youtube_id], resource=pipeline.NETWORK)
+    p.add('mono mp3', pipeline.ffmpeg_step(_ru_mono_mp3_cmd, orig_mp4_filename),
+          inputs=[mixdown_filename], outputs=[meta.get_work_filename(orig_mp4_filename, ' ru_mono.mp3')],
+          resource=pipeline.CPU)
+    p.add('stereo mp3', pipeline.ffmpeg_step(_ru_stereo_mp3_cmd, orig_mp4_filename),
+          inputs=[mixdown_filename], outputs=[meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mp3')],
+          resource=pipeline.CPU)
+    return p
+
+
+def _ru_all_cmd(orig_mp4_filename, streamable=False):
+    """
+    Mono m4a and mkv, stereo mkv, mono and stereo mp3 in a single ffmpeg run: the mixdown is
+    decoded once, the mono aac is encoded once for both its containers (tee muxer) and the
+    video is copied once per mkv
+    """
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['D:\\video\\GoswamiMj-videos\\ffmpeg-hi8-heaac.exe', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename]
+    cmd += input_seek_args
+    cmd += ['-i', meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav')]
+
+    cmd += ['-map', '0:v',
+            '-map', '1:a',
+            '-c:v', 'copy',
+            '-c:a', 'libfdk_aac', '-ac', '1', '-b:a', '128k',
+            # the encoder can't see that the tee slaves need global headers (libfdk_aac would write ADTS,
+            # and a live=1 matroska can't add CodecPrivate afterwards)
+            '-flags:a', '+global_header',
+            '-metadata:s:a:0', 'language=rus']
+    cmd += ffmpeg.meta_args_ru_mono(orig_mp4_filename)
+    cmd += output_seek_args
+    cmd += ['-f', 'tee', ffmpeg.tee_output([
+        (meta.get_work_filename(orig_mp4_filename, ' ru_mono.mkv'), 'f=matroska:live=1' if streamable else 'f=matroska'),
+        (meta.get_work_filename(orig_mp4_filename, ' ru_mono.m4a'), 'f=ipod:select=a')])]
+
+    cmd += ['-map', '0:v',
+            '-map', '1:a',
+            '-c:v', 'copy',
+            '-c:a', 'libfdk_aac', '-b:a', '192k',
+            '-metadata:s:a:0', 'language=rus']
+    cmd += ffmpeg.meta_args_ru_stereo(orig_mp4_filename)
+    cmd += output_seek_args
+    if streamable:
+        cmd += ffmpeg.streamable_args()
+    cmd += [meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mkv')]
+
+    cmd += ['-map', '1:a',
+            '-codec:a', 'mp3', '-ac', '1', '-b:a', '96k']
+    cmd += output_seek_args
+    cmd += ffmpeg.meta_args_ru_mono(orig_mp4_filename)
+    cmd += [meta.get_work_filename(orig_mp4_filename, ' ru_mono.mp3')]
 
-def _create_and_upload_ru_stereo_video(orig_mp4_filename):
+    cmd += ['-map', '1:a',
+            '-codec:a', 'mp3', '-b:a', '128k']
+    cmd += output_seek_args
+    cmd += ffmpeg.meta_args_ru_stereo(orig_mp4_filename)
+    cmd += [meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mp3')]
+    return cmd
+
+
+def _ru_stereo_video_cmd(orig_mp4_filename, streamable=False):
     ru_stereo_video_filename = meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mkv')
-    cmd = ['D:\\video\\GoswamiMj-videos\\ffmpeg-hi8-heaac.exe', '-y',
-           '-i', orig_mp4_filename,
-           '-i', meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav'),
-           '-map', '0:v',
-           '-c:v', 'copy',
-           '-map', '1:a',
-           '-c:a:0', 'libfdk_aac',
-           '-b:a', '192k',
-           '-metadata:s:a:0', 'language=rus']
+    # both inputs are seeked to the same keyframe of the video so they stay in sync
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['D:\\video\\GoswamiMj-videos\\ffmpeg-hi8-heaac.exe', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename]
+    cmd += input_seek_args
+    cmd += ['-i', meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav'),
+            '-map', '0:v',
+            '-c:v', 'copy',
+            '-map', '1:a',
+            '-c:a:0', 'libfdk_aac',
+            '-b:a', '192k',
+            '-metadata:s:a:0', 'language=rus']
     cmd += ffmpeg.meta_args_ru_stereo(orig_mp4_filename)
-    cmd += ffmpeg.ss_args(orig_mp4_filename)
-    cmd += ffmpeg.to_args(orig_mp4_filename)
+    cmd += output_seek_args
+    if streamable:
+        cmd += ffmpeg.streamable_args()
     cmd += [ru_stereo_video_filename]
-    subprocess.run(cmd, check=True)
+    return cmd
+
 
+def _upload_ru_stereo_video(orig_mp4_filename, progress, media=None):
+    ru_stereo_video_filename = meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mkv')
     title = meta.get_youtube_title_ru_stereo(orig_mp4_filename)
     description = meta.get_youtube_description_ru_stereo(orig_mp4_filename)
-    youtube_id = my_youtube.upload(ru_stereo_video_filename, title=title, description=description, lang='ru')
+    youtube_id = my_youtube.upload(ru_stereo_video_filename, title=title, description=description, lang='ru',
+                                   update=progress, media=media)
     meta.update_yaml(orig_mp4_filename, 'youtube_id_rus_stereo', youtube_id)
 
 
-def _create_and_upload_ru_mono_video(orig_mp4_filename):
+def _ru_mono_m4a_cmd(orig_mp4_filename):
     ru_mono_m4a_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono.m4a')
     cmd = ['D:\\video\\GoswamiMj-videos\\ffmpeg-hi8-heaac.exe', '-y',
            '-i', meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav'),
@@ -62,62 +184,81 @@ def _create_and_upload_ru_mono_video(orig_mp4_filename):
            '-metadata:s:a:0', 'language=rus']
     cmd += ffmpeg.meta_args_ru_mono(orig_mp4_filename)
     cmd += [ru_mono_m4a_filename]
-    subprocess.run(cmd, check=True)
+    return cmd
+
 
+def _ru_mono_video_cmd(orig_mp4_filename, streamable=False):
+    ru_mono_m4a_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono.m4a')
     ru_mono_video_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono.mkv')
-    cmd = ['ffmpeg', '-y',
-           '-i', orig_mp4_filename,
-           '-i', ru_mono_m4a_filename,
-           '-map', '0:v',
-           '-map', '1:a',
-           '-c', 'copy']
+    input_seek_args, output_seek_args = ffmpeg.seek_args(orig_mp4_filename, video_filename=orig_mp4_filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename]
+    cmd += input_seek_args
+    cmd += ['-i', ru_mono_m4a_filename,
+            '-map', '0:v',
+            '-map', '1:a',
+            '-c', 'copy']
     cmd += ffmpeg.meta_args_ru_mono(orig_mp4_filename)
-    cmd += ffmpeg.ss_args(orig_mp4_filename)
-    cmd += ffmpeg.to_args(orig_mp4_filename)
+    cmd += output_seek_args
+    if streamable:
+        cmd += ffmpeg.streamable_args()
     cmd += [ru_mono_video_filename]
-    subprocess.run(cmd, check=True)
+    return cmd
+
 
+def _upload_ru_mono_video(orig_mp4_filename, progress, media=None):
+    ru_mono_video_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono.mkv')
     title = meta.get_youtube_title_ru_mono(orig_mp4_filename)
     description = meta.get_youtube_description_ru_mono(orig_mp4_filename)
-    youtube_id = my_youtube.upload(ru_mono_video_filename, title=title, description=description, lang='ru')
+    youtube_id = my_youtube.upload(ru_mono_video_filename, title=title, description=description, lang='ru',
+                                   update=progress, media=media)
     meta.update_yaml(orig_mp4_filename, 'youtube_id_rus_mono', youtube_id)
 
 
-def _create_mp3_ru_mono(filename):
-    cmd = ['ffmpeg', '-y',
-           '-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
-           '-codec:a', 'mp3',
-           '-ac', '1',
-           '-b:a', '96k']
-    cmd += ffmpeg.ss_args(filename)
-    cmd += ffmpeg.to_args(filename)
+def _ru_mono_mp3_cmd(filename):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
+            '-codec:a', 'mp3',
+            '-ac', '1',
+            '-b:a', '96k']
+    cmd += output_seek_args
     cmd += ffmpeg.meta_args_ru_mono(filename)
     cmd += [meta.get_work_filename(filename, ' ru_mono.mp3')]
-    subprocess.run(cmd, check=True)
+    return cmd
 
 
-def _create_mp3_ru_stereo(filename):
-    cmd = ['ffmpeg', '-y',
-           '-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
-           '-codec:a', 'mp3',
-           '-b:a', '128k']
-    cmd += ffmpeg.ss_args(filename)
-    cmd += ffmpeg.to_args(filename)
+def _ru_stereo_mp3_cmd(filename):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
+            '-codec:a', 'mp3',
+            '-b:a', '128k']
+    cmd += output_seek_args
     cmd += ffmpeg.meta_args_ru_stereo(filename)
     cmd += [meta.get_work_filename(filename, ' ru_stereo.mp3')]
-    subprocess.run(cmd, check=True)
+    return cmd
 
 
 def main():
     try:
-        orig_mp4_filename = sys.argv[1]
-        if not os.path.isfile(orig_mp4_filename):
-            print('file "%s" not found' % orig_mp4_filename)
-            print('')
-            usage_and_exit()
-        create_and_upload_ru_files(orig_mp4_filename)
+        single_pass = '--single-pass' in sys.argv
+        stream_upload = '--stream-upload' in sys.argv
+        orig_mp4_filename = [arg for arg in sys.argv[1:] if arg not in ('--single-pass', '--stream-upload')][0]
     except IndexError:
         usage_and_exit()
+    if not os.path.isfile(orig_mp4_filename):
+        print('file "%s" not found' % orig_mp4_filename)
+        print('')
+        usage_and_exit()
+    try:
+        create_and_upload_ru_files(orig_mp4_filename, stream_upload=stream_upload, single_pass=single_pass)
+    except KeyboardInterrupt:
+        print('interrupted, run it again to resume')
+        sys.exit(130)
 
 if __name__ == '__main__':
     main()
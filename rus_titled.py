@@ -1,43 +1,131 @@
 import sys
 import os
-import subprocess
-import multiprocessing
 
+import checkpoints
 import ffmpeg
 import meta
 import my_youtube
+import pipeline
 import title
 
 
 def usage_and_exit():
     print("""echo mux en/ru audio files into a Goswami Maharaj's video
-echo usage: mux "yyyy-mm-dd goswamimj.mp4"
-echo (or drag and drop the file onto me)""")
+echo usage: mux [--single-pass] "yyyy-mm-dd goswamimj.mp4"
+echo (or drag and drop the file onto me)
+echo --single-pass: read the source and the mixdown only once and write both videos and mp3s from the same ffmpeg run""")
     exit()
 
 
-def create_and_upload_ru_files(orig_mp4_filename):
-    ts_title_filename, ts_rest_filename = title.make_ts_files_with_title_and_rest(orig_mp4_filename, 'ru')
-    p1 = multiprocessing.Process(target=_create_and_upload_ru_mono_video, args=(orig_mp4_filename, ts_title_filename, ts_rest_filename, ))
-    p1.start()
-    p2 = multiprocessing.Process(target=_create_and_upload_ru_stereo_video, args=(orig_mp4_filename, ts_title_filename, ts_rest_filename, ))
-    p2.start()
-    p3 = multiprocessing.Process(target=_create_mp3_ru_mono, args=(orig_mp4_filename,))
-    p3.start()
-    p4 = multiprocessing.Process(target=_create_mp3_ru_stereo, args=(orig_mp4_filename,))
-    p4.start()
+def create_and_upload_ru_files(orig_mp4_filename, single_pass=False):
+    pipeline.run(make_pipeline(orig_mp4_filename, single_pass))
 
-    p1.join()
-    p2.join()
-    p3.join()
-    p4.join()
 
+def make_pipeline(orig_mp4_filename, single_pass=False) -> pipeline.Pipeline:
+    mixdown_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav')
+    ts_title_filename = meta.get_work_filename(orig_mp4_filename, ' ru_title.ts')
+    ru_mono_titled_mp4_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono titled.mkv')
+    ru_stereo_titled_mp4_filename = meta.get_work_filename(orig_mp4_filename, ' ru_stereo titled.mkv')
+
+    p = pipeline.Pipeline('rus_titled', journal=checkpoints.Journal(orig_mp4_filename))
+    # the title depends on the .yml too, title.make_title_ts() itself skips it if it's up to date
+    p.add('title', lambda progress: title.make_title_ts_and_get_rest_start(orig_mp4_filename, 'ru'),
+          inputs=[orig_mp4_filename], outputs=[ts_title_filename], resource=pipeline.CPU, checkpoint=False)
+    # titled videos are piped through title.run_with_title_piped(), so they run in worker threads
+    if single_pass:
+        # one ffmpeg gets the piped video and reads the mixdown once for all four audio encoders
+        p.add('mkv+mp3', lambda progress: _create_ru_files(orig_mp4_filename, ts_title_filename),
+              inputs=[orig_mp4_filename, ts_title_filename, mixdown_filename],
+              outputs=[ru_mono_titled_mp4_filename, ru_stereo_titled_mp4_filename,
+                       meta.get_work_filename(orig_mp4_filename, ' ru_mono.mp3'),
+                       meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mp3')],
+              resource=pipeline.CPU, fingerprint=_piped_fingerprint(_ru_all_cmd, orig_mp4_filename, ts_title_filename))
+    else:
+        p.add('mono mkv', lambda progress: _create_ru_mono_video(orig_mp4_filename, ts_title_filename),
+              inputs=[orig_mp4_filename, ts_title_filename, mixdown_filename], outputs=[ru_mono_titled_mp4_filename],
+              resource=pipeline.CPU,
+              fingerprint=_piped_fingerprint(_ru_mono_video_cmd, orig_mp4_filename, ts_title_filename))
+        p.add('stereo mkv', lambda progress: _create_ru_stereo_video(orig_mp4_filename, ts_title_filename),
+              inputs=[orig_mp4_filename, ts_title_filename, mixdown_filename], outputs=[ru_stereo_titled_mp4_filename],
+              resource=pipeline.CPU,
+              fingerprint=_piped_fingerprint(_ru_stereo_video_cmd, orig_mp4_filename, ts_title_filename))
+        p.add('mono mp3', pipeline.ffmpeg_step(_ru_mono_mp3_cmd, orig_mp4_filename),
+              inputs=[mixdown_filename], outputs=[meta.get_work_filename(orig_mp4_filename, ' ru_mono.mp3')],
+              resource=pipeline.CPU)
+        p.add('stereo mp3', pipeline.ffmpeg_step(_ru_stereo_mp3_cmd, orig_mp4_filename),
+              inputs=[mixdown_filename], outputs=[meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mp3')],
+              resource=pipeline.CPU)
+    p.add('mono upload', lambda progress: _upload_ru_mono_video(orig_mp4_filename, progress),
+          inputs=[ru_mono_titled_mp4_filename],
+          outputs=[pipeline.yaml_artifact(orig_mp4_filename, 'youtube_id_rus_mono')],
+          resource=pipeline.NETWORK)
+    p.add('stereo upload', lambda progress: _upload_ru_stereo_video(orig_mp4_filename, progress),
+          inputs=[ru_stereo_titled_mp4_filename],
+          outputs=[pipeline.yaml_artifact(orig_mp4_filename, 'youtube_id_rus_stereo')],
+          resource=pipeline.NETWORK)
+    return p
+
+
+def _piped_fingerprint(make_cmd, orig_mp4_filename, ts_title_filename):
+    """Fingerprint of a step piping the title through make_cmd(orig): its command, the piped rest and the inputs"""
+    return lambda: title.piped_key(make_cmd(orig_mp4_filename), orig_mp4_filename, ts_title_filename)
+
+
+def _create_ru_files(orig_mp4_filename, ts_title_filename):
+    """Both titled videos and both mp3s in a single ffmpeg run, see _ru_all_cmd()"""
+    title_end_time = title.get_title_end_time(orig_mp4_filename)
+    title.run_with_title_piped_cached(_ru_all_cmd(orig_mp4_filename), orig_mp4_filename, ts_title_filename,
+                                      title_end_time)
+
+
+def _ru_all_cmd(orig_mp4_filename):
+    """The video comes through stdin (see title.run_with_title_piped()), the mixdown is decoded once"""
+    # the piped video starts at the skip time, so the mixdown is always seeked there like in _ru_mono_video_cmd()
+    input_seek_args = ffmpeg.ss_args(orig_mp4_filename)
+    mp3_input_seek_args, mp3_output_seek_args = ffmpeg.seek_args(orig_mp4_filename)
+    if input_seek_args and not mp3_input_seek_args:
+        # seek_args() couldn't parse skip/cut (or skip is 0) and would seek the output instead
+        mp3_output_seek_args = ffmpeg.to_args(orig_mp4_filename)
+    cmd = ['D:\\video\\GoswamiMj-videos\\ffmpeg-hi8-heaac.exe', '-y',
+           '-f', 'mpegts', '-i', 'pipe:0']
+    cmd += input_seek_args
+    cmd += ['-i', meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav')]
 
-def _create_and_upload_ru_stereo_video(orig_mp4_filename, ts_title_filename, ts_rest_filename):
-    concat_str = _get_concat_args(ts_title_filename, ts_rest_filename)
+    for mono, filename in [(True, ' ru_mono titled.mkv'), (False, ' ru_stereo titled.mkv')]:
+        cmd += ['-map', '0:v', '-map', '1:a',
+                '-c:v', 'copy',
+                '-c:a', 'libfdk_aac']
+        if mono:
+            cmd += ['-ac', '1']
+        cmd += ffmpeg.to_args(orig_mp4_filename)
+        cmd += ['-shortest']
+        cmd += [meta.get_work_filename(orig_mp4_filename, filename)]
+
+    cmd += ['-map', '1:a',
+            '-codec:a', 'mp3', '-ac', '1', '-b:a', '96k']
+    cmd += mp3_output_seek_args
+    cmd += ffmpeg.meta_args_ru_mono(orig_mp4_filename)
+    cmd += [meta.get_work_filename(orig_mp4_filename, ' ru_mono.mp3')]
+
+    cmd += ['-map', '1:a',
+            '-codec:a', 'mp3', '-b:a', '128k']
+    cmd += mp3_output_seek_args
+    cmd += ffmpeg.meta_args_ru_stereo(orig_mp4_filename)
+    cmd += [meta.get_work_filename(orig_mp4_filename, ' ru_stereo.mp3')]
+    return cmd
+
+
+def _create_ru_stereo_video(orig_mp4_filename, ts_title_filename):
+    title_end_time = title.get_title_end_time(orig_mp4_filename)
+    title.run_with_title_piped_cached(_ru_stereo_video_cmd(orig_mp4_filename), orig_mp4_filename, ts_title_filename,
+                                      title_end_time)
+
+
+def _ru_stereo_video_cmd(orig_mp4_filename):
     ru_stereo_titled_mp4_filename = meta.get_work_filename(orig_mp4_filename, ' ru_stereo titled.mkv')
+    # video (title + the rest of the source) comes through stdin, see title.run_with_title_piped()
     cmd = ['D:\\video\\GoswamiMj-videos\\ffmpeg-hi8-heaac.exe', '-y',
-           '-i', concat_str]
+           '-f', 'mpegts', '-i', 'pipe:0']
     cmd += ffmpeg.ss_args(orig_mp4_filename)
     cmd += ['-i', meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav')]
     cmd += ['-c:v', 'copy']
@@ -46,27 +134,29 @@ def _create_and_upload_ru_stereo_video(orig_mp4_filename, ts_title_filename, ts_
     cmd += ffmpeg.to_args(orig_mp4_filename)
     cmd += ['-shortest']
     cmd += [ru_stereo_titled_mp4_filename]
-    os.chdir('D:\\video\GoswamiMj-videos')
-    subprocess.run(cmd, check=True)
-    os.chdir('C:\\Users\\ashutosh\\Dropbox\\Reference\S\scripts')
+    return cmd
+
 
-    title = meta.get_youtube_title_ru_stereo(orig_mp4_filename)
+def _upload_ru_stereo_video(orig_mp4_filename, progress):
+    ru_stereo_titled_mp4_filename = meta.get_work_filename(orig_mp4_filename, ' ru_stereo titled.mkv')
+    title_ru = meta.get_youtube_title_ru_stereo(orig_mp4_filename)
     description = meta.get_youtube_description_ru_stereo(orig_mp4_filename)
-    youtube_id = my_youtube.upload(ru_stereo_titled_mp4_filename, title=title, description=description, lang='ru')
+    youtube_id = my_youtube.upload(ru_stereo_titled_mp4_filename, title=title_ru, description=description, lang='ru',
+                                   update=progress)
     meta.update_yaml(orig_mp4_filename, 'youtube_id_rus_stereo', youtube_id)
 
 
-def _get_concat_args(filename1, filename2):
-    arg1 = 'temp\\' + os.path.basename(filename1)
-    arg2 = 'temp\\' + os.path.basename(filename2)
-    return 'concat:' + arg1 + '|' + arg2
+def _create_ru_mono_video(orig_mp4_filename, ts_title_filename):
+    title_end_time = title.get_title_end_time(orig_mp4_filename)
+    title.run_with_title_piped_cached(_ru_mono_video_cmd(orig_mp4_filename), orig_mp4_filename, ts_title_filename,
+                                      title_end_time)
 
 
-def _create_and_upload_ru_mono_video(orig_mp4_filename, ts_title_filename, ts_rest_filename):
-    concat_str = _get_concat_args(ts_title_filename, ts_rest_filename)
+def _ru_mono_video_cmd(orig_mp4_filename):
     ru_mono_titled_mp4_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono titled.mkv')
+    # video (title + the rest of the source) comes through stdin, see title.run_with_title_piped()
     cmd = ['D:\\video\\GoswamiMj-videos\\ffmpeg-hi8-heaac.exe', '-y',
-           '-i', concat_str]
+           '-f', 'mpegts', '-i', 'pipe:0']
     cmd += ffmpeg.ss_args(orig_mp4_filename)
     cmd += ['-i', meta.get_work_filename(orig_mp4_filename, ' ru_mixdown.wav')]
     cmd += ['-c:v', 'copy']
@@ -75,51 +165,60 @@ def _create_and_upload_ru_mono_video(orig_mp4_filename, ts_title_filename, ts_re
     cmd += ffmpeg.to_args(orig_mp4_filename)
     cmd += ['-shortest']
     cmd += [ru_mono_titled_mp4_filename]
-    os.chdir('D:\\video\GoswamiMj-videos')
-    subprocess.run(cmd, check=True)
-    os.chdir('C:\\Users\\ashutosh\\Dropbox\\Reference\S\scripts')
+    return cmd
+
 
-    title = meta.get_youtube_title_ru_mono(orig_mp4_filename)
+def _upload_ru_mono_video(orig_mp4_filename, progress):
+    ru_mono_titled_mp4_filename = meta.get_work_filename(orig_mp4_filename, ' ru_mono titled.mkv')
+    title_ru = meta.get_youtube_title_ru_mono(orig_mp4_filename)
     description = meta.get_youtube_description_ru_mono(orig_mp4_filename)
-    youtube_id = my_youtube.upload(ru_mono_titled_mp4_filename, title=title, description=description, lang='ru')
+    youtube_id = my_youtube.upload(ru_mono_titled_mp4_filename, title=title_ru, description=description, lang='ru',
+                                   update=progress)
     meta.update_yaml(orig_mp4_filename, 'youtube_id_rus_mono', youtube_id)
 
 
-def _create_mp3_ru_mono(filename):
-    cmd = ['ffmpeg', '-y',
-           '-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
-           '-codec:a', 'mp3',
-           '-ac', '1',
-           '-b:a', '96k']
-    cmd += ffmpeg.ss_args(filename)
-    cmd += ffmpeg.to_args(filename)
+def _ru_mono_mp3_cmd(filename):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
+            '-codec:a', 'mp3',
+            '-ac', '1',
+            '-b:a', '96k']
+    cmd += output_seek_args
     cmd += ffmpeg.meta_args_ru_mono(filename)
     cmd += [meta.get_work_filename(filename, ' ru_mono.mp3')]
-    subprocess.run(cmd, check=True)
+    return cmd
 
 
-def _create_mp3_ru_stereo(filename):
-    cmd = ['ffmpeg', '-y',
-           '-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
-           '-codec:a', 'mp3',
-           '-b:a', '128k']
-    cmd += ffmpeg.ss_args(filename)
-    cmd += ffmpeg.to_args(filename)
+def _ru_stereo_mp3_cmd(filename):
+    input_seek_args, output_seek_args = ffmpeg.seek_args(filename)
+    cmd = ['ffmpeg', '-y']
+    cmd += input_seek_args
+    cmd += ['-i', (meta.get_work_filename(filename, ' ru_mixdown.wav')),
+            '-codec:a', 'mp3',
+            '-b:a', '128k']
+    cmd += output_seek_args
     cmd += ffmpeg.meta_args_ru_stereo(filename)
     cmd += [meta.get_work_filename(filename, ' ru_stereo.mp3')]
-    subprocess.run(cmd, check=True)
+    return cmd
 
 
 def main():
     try:
-        orig_mp4_filename = sys.argv[1]
-        if not os.path.isfile(orig_mp4_filename):
-            print('file "%s" not found' % orig_mp4_filename)
-            print('')
-            usage_and_exit()
-        create_and_upload_ru_files(orig_mp4_filename)
+        single_pass = '--single-pass' in sys.argv
+        orig_mp4_filename = [arg for arg in sys.argv[1:] if arg != '--single-pass'][0]
     except IndexError:
         usage_and_exit()
+    if not os.path.isfile(orig_mp4_filename):
+        print('file "%s" not found' % orig_mp4_filename)
+        print('')
+        usage_and_exit()
+    try:
+        create_and_upload_ru_files(orig_mp4_filename, single_pass=single_pass)
+    except KeyboardInterrupt:
+        print('interrupted, run it again to resume')
+        sys.exit(130)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,207 @@
+"""
+Parallel re-encoding of a video by segments.
+
+libx264 in a single ffmpeg process doesn't keep all cores busy, so we split the source
+at keyframes into chunks, encode every chunk in its own ffmpeg process (as many at once
+as there are cores) and then join the encoded chunks with the concat demuxer without
+re-encoding. The audio of the source is copied as is.
+"""
+import bisect
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import progressbar
+
+import ffmpeg
+import keyframes
+import meta
+import probe
+import title
+
+
+def usage_and_exit():
+    print("""re-encode a video using all cores
+usage: segments "input.mp4" "output.mp4" [jobs]""")
+    exit()
+
+
+def encode(input_filename, output_filename, video_args=None, encoding_options=None, jobs=None, callback=None):
+    """
+    Re-encode the video stream of input_filename into output_filename, copy the audio.
+    :param video_args: additional output args for every chunk, e.g. ['-vf', 'hflip']
+    :param encoding_options: video encoder args, by default libx264 with the profile and level of the source
+    :param jobs: number of chunks encoded at once, cores count by default
+    :param callback: callback(curr_value, max_value), seconds of the source encoded so far
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if encoding_options is None:
+        encoding_options = _video_encoding_options(input_filename)
+    duration = probe.get_duration(input_filename)
+    chunks = split(keyframes.get_keyframes(input_filename), duration, jobs)
+    frame_duration = 1 / (probe.get_fps(input_filename) or 25)
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+
+    chunks_dir = meta.get_work_filename(output_filename, '.chunks')
+    os.makedirs(chunks_dir, exist_ok=True)
+    try:
+        chunk_filenames = []
+        cmds = []
+        for i, (start, end) in enumerate(chunks):
+            chunk_filename = os.path.join(chunks_dir, 'chunk{:04d}.mp4'.format(i))
+            chunk_filenames.append(chunk_filename)
+            cmds.append(_chunk_cmd(input_filename, chunk_filename, start, end, frame_duration,
+                                   video_args or [], encoding_options, threads))
+
+        done = 0
+        processes = _Processes()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            # each thread just waits for its ffmpeg process
+            futures = {executor.submit(processes.run, cmd): chunk for cmd, chunk in zip(cmds, chunks)}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+                    start, end = futures[future]
+                    done += (end if end is not None else duration or start) - start
+                    if callback is not None and duration:
+                        callback(min(done, duration), duration)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                # otherwise leaving the executor would wait for the running chunks to be encoded to the end
+                processes.stop()
+                raise
+
+        concat(chunk_filenames, input_filename, output_filename)
+    finally:
+        shutil.rmtree(chunks_dir, ignore_errors=True)
+
+
+def split(keyframe_timestamps, duration, count):
+    """
+    Split the video into up to `count` chunks of about the same duration, each starting at a keyframe
+    :return: list of (start, end) in seconds, end of the last chunk is None (till the end)
+    """
+    starts = [0.0]
+    if duration and len(keyframe_timestamps) > 1:
+        for i in range(1, count):
+            j = bisect.bisect_left(keyframe_timestamps, duration * i / count)
+            if j == len(keyframe_timestamps):
+                break
+            # nearest keyframe to the ideal split point
+            if j > 0 and duration * i / count - keyframe_timestamps[j - 1] < keyframe_timestamps[j] - duration * i / count:
+                j -= 1
+            if keyframe_timestamps[j] > starts[-1]:
+                starts.append(keyframe_timestamps[j])
+    ends = starts[1:] + [None]
+    return list(zip(starts, ends))
+
+
+def concat(chunk_filenames, audio_filename, output_filename):
+    """Join encoded chunks without re-encoding and add the audio of audio_filename"""
+    list_filename = os.path.join(os.path.dirname(chunk_filenames[0]), 'chunks.txt')
+    with open(list_filename, 'w', encoding='utf-8') as f:
+        for chunk_filename in chunk_filenames:
+            f.write("file '{}'\n".format(chunk_filename.replace('\\', '/').replace("'", "'\\''")))
+    cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error',
+           '-f', 'concat', '-safe', '0', '-i', list_filename,
+           '-i', audio_filename,
+           '-map', '0:v', '-map', '1:a?',
+           '-c', 'copy',
+           output_filename]
+    subprocess.run(cmd, check=True)
+
+
+def _chunk_cmd(input_filename, chunk_filename, start, end, frame_duration, video_args, encoding_options, threads):
+    cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error']
+    if start > 0:
+        cmd += ['-ss', ffmpeg.seconds_arg(start)]
+    cmd += ['-i', input_filename]
+    if end is not None:
+        # stop half a frame before the next chunk's keyframe, so it's neither lost nor duplicated
+        cmd += ['-t', ffmpeg.seconds_arg(end - start - frame_duration / 2)]
+    cmd += ['-map', '0:v:0', '-an']
+    cmd += video_args
+    cmd += encoding_options
+    cmd += ['-threads', str(threads), chunk_filename]
+    return cmd
+
+
+def _video_encoding_options(filename):
+    options = title.get_ffmpeg_encoding_options_from_video_file(filename)
+    i = options.index('-c:a')
+    return options[:i] + options[i + 2:]
+
+
+class _Processes:
+    """Runs the ffmpegs of the chunks (from several threads) and stops all of them at once"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = set()
+        self._stopped = False
+
+    def run(self, cmd):
+        """Like subprocess.run(cmd, check=True), doesn't start anything after stop()"""
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('stopped')
+            p = subprocess.Popen(cmd)
+            self._running.add(p)
+        try:
+            if p.wait():
+                raise subprocess.CalledProcessError(p.returncode, cmd)
+        finally:
+            with self._lock:
+                self._running.discard(p)
+
+    def stop(self, grace_period=5):
+        """Terminate the running processes, kill those still running after grace_period seconds"""
+        with self._lock:
+            self._stopped = True
+            running = list(self._running)
+        for p in running:
+            p.terminate()
+        for p in running:
+            try:
+                p.wait(grace_period)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def main():
+    try:
+        input_filename = sys.argv[1]
+        output_filename = sys.argv[2]
+        jobs = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        if not os.path.isfile(input_filename):
+            print('file "%s" not found' % input_filename)
+            print('')
+            usage_and_exit()
+    except (IndexError, ValueError):
+        usage_and_exit()
+
+    bar = None
+
+    def callback(curr_value, max_value):
+        nonlocal bar
+        if bar is None:
+            bar = progressbar.ProgressBar(
+                widgets=['encode: ', progressbar.Bar(), ' ', progressbar.ETA()],
+                max_value=max_value)
+        bar.update(curr_value)
+
+    try:
+        encode(input_filename, output_filename, jobs=jobs, callback=callback)
+    except KeyboardInterrupt:
+        print('interrupted')
+        sys.exit(130)
+    if bar is not None:
+        bar.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+from unittest import TestCase
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+import align
+import ffmpeg
+import probe
+
+
+class TestAlign(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.orig_filename = os.path.join(self.tmp_dir.name, 'orig.wav')
+        self.translation_filename = os.path.join(self.tmp_dir.name, 'translation.m4a')
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'anoisesrc=r=8000:c=pink:a=0.3:d=200:seed=1',
+                        self.orig_filename], check=True)
+        probe._cache.clear()
+
+    def tearDown(self):
+        probe._cache.clear()
+        self.tmp_dir.cleanup()
+
+    def make_translation(self, graph):
+        # the original as heard in the translator's mic, under the translator's own voice
+        cmd = ['ffmpeg', '-v', 'error', '-y', '-i', self.orig_filename,
+               '-f', 'lavfi', '-i', 'anoisesrc=r=8000:a=0.1:d=210:seed=2',
+               '-filter_complex', '[0:a]' + graph + '[a];[a][1:a]amix=inputs=2:duration=shortest',
+               '-c:a', 'aac', self.translation_filename]
+        subprocess.run(cmd, check=True)
+
+    def test_translation_starts_later(self):
+        # the translator's recorder started 7.25 s after the camera and its clock runs 200 ppm slow
+        self.make_translation('asetrate=8001.6,aresample=8000,adelay=7250:all=1')
+        alignment = align.align(self.orig_filename, self.translation_filename)
+        self.assertEqual(align.PROBES, len(alignment.matches))
+        self.assertAlmostEqual(-7.25 * 1.0002, alignment.offset, delta=0.02)
+        self.assertAlmostEqual(200e-6, alignment.drift, delta=100e-6)
+        self.assertEqual(([], ['-ss', ffmpeg.seconds_arg(-alignment.offset)]), alignment.seek_args())
+
+    def test_translation_starts_earlier(self):
+        self.make_translation('atrim=start=12.5,asetpts=PTS-STARTPTS')
+        alignment = align.align(self.orig_filename, self.translation_filename)
+        self.assertAlmostEqual(12.5, alignment.offset, delta=0.02)
+        self.assertAlmostEqual(0, alignment.drift, delta=100e-6)
+        self.assertEqual('-ss', alignment.seek_args()[0][0])
+        self.assertEqual([], alignment.seek_args()[1])
+
+    def test_not_found(self):
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'anullsrc=r=8000:cl=mono:d=60',
+                        '-c:a', 'aac', self.translation_filename], check=True)
+        with self.assertRaises(align.AlignmentError):
+            align.align(self.orig_filename, self.translation_filename)
+
+    def test_correlate(self):
+        rng = np.random.default_rng(1)
+        haystack = rng.standard_normal(10000).astype(np.float32)
+        lag, score = align.correlate(0.5 * haystack[1234:3234], haystack)
+        self.assertAlmostEqual(1234, lag, places=3)
+        self.assertAlmostEqual(1.0, score, places=3)
+        self.assertIsNone(align.correlate(np.zeros(100, dtype=np.float32), haystack))
+        self.assertIsNone(align.correlate(haystack, haystack[:100]))
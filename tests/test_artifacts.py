@@ -0,0 +1,98 @@
+from unittest import TestCase
+import asyncio
+import os
+import subprocess
+import tempfile
+
+import artifacts
+
+
+class TestArtifacts(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_filename = os.path.join(self.tmp_dir.name, 'input.wav')
+        cmd = ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'sine=r=8000:d=1', self.input_filename]
+        subprocess.run(cmd, check=True)
+        self.output_filename = os.path.join(self.tmp_dir.name, 'temp', 'output.mp3')
+        os.makedirs(os.path.dirname(self.output_filename))
+        self.runs = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def cmd(self, bitrate='32k'):
+        return ['ffmpeg', '-v', 'error', '-y', '-i', self.input_filename,
+                '-codec:a', 'mp3', '-b:a', bitrate, '-metadata', 'title=Test', self.output_filename]
+
+    def run_cmd(self, cmd):
+        self.runs.append(cmd)
+        subprocess.run(cmd, check=True)
+
+    def test_parse_cmd(self):
+        cmd = ['ffmpeg', '-y', '-ss', '7', '-i', self.input_filename, '-f', 'lavfi', '-i', 'sine',
+               '-c:a', 'copy', '-vn', 'a.m4a',
+               '-c', 'copy', '-map', '0', 'b.mkv',
+               '-f', 'mpegts', 'pipe:1']
+        self.assertEqual(([self.input_filename], ['a.m4a', 'b.mkv']), artifacts._parse_cmd(cmd))
+        cmd = ['ffmpeg', '-y', '-f', 'wav', '-i', self.input_filename,
+               '-f', 'tee', '[f=matroska:live=1]a.mkv|[f=ipod:select=a]a.m4a', 'b.mp3']
+        self.assertEqual(([self.input_filename], ['a.mkv', 'a.m4a', 'b.mp3']), artifacts._parse_cmd(cmd))
+
+    def test_second_run_is_skipped(self):
+        self.assertTrue(artifacts.run(self.cmd(), self.run_cmd))
+        self.assertFalse(artifacts.run(self.cmd(), self.run_cmd))
+        self.assertEqual(1, len(self.runs))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, 'temp', artifacts.MANIFEST_FILENAME)))
+
+    def test_changes_are_rebuilt(self):
+        artifacts.run(self.cmd(), self.run_cmd)
+        # other arguments
+        self.assertTrue(artifacts.run(self.cmd(bitrate='48k'), self.run_cmd))
+        # input has changed
+        with open(self.input_filename, 'ab') as f:
+            f.write(b'\0\0')
+        self.assertTrue(artifacts.run(self.cmd(bitrate='48k'), self.run_cmd))
+        # output was overwritten by something else
+        with open(self.output_filename, 'ab') as f:
+            f.write(b'\0')
+        self.assertTrue(artifacts.run(self.cmd(bitrate='48k'), self.run_cmd))
+        self.assertFalse(artifacts.run(self.cmd(bitrate='48k'), self.run_cmd))
+        self.assertEqual(4, len(self.runs))
+
+    def test_failed_run_is_not_recorded(self):
+        artifacts.run(self.cmd(), self.run_cmd)
+
+        def fail(cmd):
+            raise subprocess.CalledProcessError(1, cmd)
+        with self.assertRaises(subprocess.CalledProcessError):
+            artifacts.run(self.cmd(bitrate='48k'), fail)
+        self.assertFalse(artifacts.is_up_to_date(self.cmd()))
+        self.assertFalse(artifacts.is_up_to_date(self.cmd(bitrate='48k')))
+
+    def test_extra_inputs(self):
+        cmd = ['ffmpeg', '-v', 'error', '-y', '-f', 'wav', '-i', 'pipe:0', self.output_filename]
+
+        def run_piped(cmd):
+            with open(self.input_filename, 'rb') as f:
+                subprocess.run(cmd, stdin=f, check=True)
+        self.assertTrue(artifacts.run(cmd, run_piped, inputs=[self.input_filename]))
+        self.assertFalse(artifacts.run(cmd, run_piped, inputs=[self.input_filename]))
+        os.utime(self.input_filename, ns=(0, 0))
+        self.assertTrue(artifacts.run(cmd, run_piped, inputs=[self.input_filename]))
+
+    def test_extra_key(self):
+        cmd = ['ffmpeg', '-v', 'error', '-y', '-f', 'wav', '-i', 'pipe:0', self.output_filename]
+
+        def run_piped(cmd):
+            with open(self.input_filename, 'rb') as f:
+                subprocess.run(cmd, stdin=f, check=True)
+        self.assertTrue(artifacts.run(cmd, run_piped, extra_key=['cat', 'a.wav']))
+        self.assertFalse(artifacts.run(cmd, run_piped, extra_key=['cat', 'a.wav']))
+        # what feeds the pipe has changed
+        self.assertTrue(artifacts.run(cmd, run_piped, extra_key=['cat', 'b.wav']))
+        self.assertFalse(artifacts.is_up_to_date(cmd))
+
+    def test_run_async(self):
+        self.assertTrue(asyncio.run(artifacts.run_async(self.cmd())))
+        self.assertFalse(asyncio.run(artifacts.run_async(self.cmd())))
+        self.assertTrue(artifacts.is_up_to_date(self.cmd()))
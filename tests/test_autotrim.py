@@ -0,0 +1,69 @@
+from unittest import TestCase
+import datetime
+import os
+import subprocess
+import tempfile
+
+import autotrim
+import meta
+import probe
+
+# voice-like: a gliding pitch with harmonics, syllables 4 times a second
+SPEECH = ("aevalsrc='0.3*(0.5+0.5*sin(2*PI*4*t))*(sin(2*PI*150*t-42.9*cos(2*PI*0.7*t))"
+          "+0.5*sin(4*PI*150*t-85.7*cos(2*PI*0.7*t))+0.3*sin(6*PI*150*t-128.6*cos(2*PI*0.7*t)))':s=44100:d={}")
+TONE = 'sine=f=1000:r=44100:d={},volume=3'
+APPLAUSE = 'anoisesrc=r=44100:a=0.3:d={}'
+SILENCE = 'anullsrc=r=44100:cl=mono:d={}'
+
+
+class TestAutotrim(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, '2020-01-01 goswamimj.m4a')
+        # countdown, pause, applause, the lecture, applause again and silence until the recording stops
+        self.make_audio([(TONE, 5), (SILENCE, 3), (APPLAUSE, 6), (SPEECH, 30), (SILENCE, 2), (APPLAUSE, 5),
+                         (SILENCE, 4)])
+        probe._cache.clear()
+
+    def tearDown(self):
+        probe._cache.clear()
+        self.tmp_dir.cleanup()
+
+    def make_audio(self, parts):
+        cmd = ['ffmpeg', '-v', 'error', '-y']
+        for source, seconds in parts:
+            cmd += ['-f', 'lavfi', '-i', source.format(seconds)]
+        graph = ''.join('[{}:a]aformat=channel_layouts=mono[a{}];'.format(i, i) for i in range(len(parts)))
+        graph += ''.join('[a{}]'.format(i) for i in range(len(parts)))
+        graph += 'concat=n={}:v=0:a=1'.format(len(parts))
+        cmd += ['-filter_complex', graph, '-c:a', 'aac', self.filename]
+        subprocess.run(cmd, check=True)
+
+    def test_classify(self):
+        classes = list(autotrim.classify(self.filename, 0, 20))
+        self.assertEqual([autotrim.TONE] * 5 + [autotrim.SILENCE] * 3 + [autotrim.NOISE] * 6 + [autotrim.SPEECH] * 6,
+                         classes)
+
+    def test_suggest(self):
+        # the speech is from 14s to 44s
+        self.assertEqual((13, 45), autotrim.suggest(self.filename))
+
+    def test_write_suggestions(self):
+        meta.update_yaml(self.filename, 'cut', '0:50')
+        self.assertEqual((13, 45), autotrim.write_suggestions(self.filename))
+        self.assertEqual('0:00:13', meta.get_skip_time(self.filename))
+        # set by hand
+        self.assertEqual('0:50', meta.get_cut_time(self.filename))
+        autotrim.write_suggestions(self.filename, force=True)
+        self.assertEqual('0:00:45', meta.get_cut_time(self.filename))
+
+    def test_explicit_zero_skip_is_kept(self):
+        meta.update_yaml(self.filename, 'skip', 0)
+        self.assertEqual((13, 45), autotrim.write_suggestions(self.filename))
+        self.assertEqual(datetime.timedelta(), meta.get_skip_time_timedelta(self.filename))
+        self.assertEqual('0:00:45', meta.get_cut_time(self.filename))
+
+    def test_speech_from_the_start(self):
+        self.make_audio([(SPEECH, 20)])
+        probe._cache.clear()
+        self.assertEqual((None, None), autotrim.suggest(self.filename))
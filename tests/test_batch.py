@@ -0,0 +1,57 @@
+from unittest import TestCase, mock
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+
+import batch
+import pipeline
+
+
+class TestBatch(TestCase):
+    def test_find_lectures(self):
+        lectures = batch.find_lectures(['tests/files'])
+        self.assertEqual(['2016-10-07 goswamimj.mp4', '2016-10-12 brmadhusudan.mp4', '2016-10-17 avadhutmj.mp4'],
+                         [os.path.basename(filename) for filename in lectures])
+        self.assertEqual(['tests/files/one_sec.mp4'], batch.find_lectures(['tests/files/one_sec.mp4']))
+        with self.assertRaises(FileNotFoundError):
+            batch.find_lectures(['tests/files/missing.mp4'])
+
+    def test_make_pipelines(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for ext in ('.mp4', '.yml'):
+            shutil.copy('tests/files/2016-10-07 goswamimj' + ext, tmp_dir)
+        pipelines = batch.make_pipelines(batch.find_lectures([tmp_dir]), ['orig', 'rus'])
+        self.assertEqual(['orig', 'rus'], [p.name for p in pipelines])
+        self.assertEqual({'2016-10-07 goswamimj'}, set(pipelines.values()))
+        for p in pipelines:
+            self.assertGreater(p.cost, 0)
+        # orig and rus of the same lecture are planned together without clashes
+        pipeline.dependencies([step for p in pipelines for step in p.steps])
+
+    def test_clashing_scripts(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for ext in ('.mp4', '.yml'):
+            shutil.copy('tests/files/2016-10-07 goswamimj' + ext, tmp_dir)
+        out = io.StringIO()
+        with mock.patch('sys.argv', ['batch', 'orig', 'orig_norm', tmp_dir]), \
+                mock.patch('pipeline.run') as run, contextlib.redirect_stdout(out), self.assertRaises(SystemExit):
+            batch.main()
+        run.assert_not_called()
+        self.assertIn('is made by both "orig: m4a" and "orig_norm: m4a"', out.getvalue())
+        self.assertIn('usage: batch', out.getvalue())
+
+    def test_view(self):
+        p = pipeline.Pipeline('orig')
+        mkv = p.add('mkv', None, outputs=['a.mkv'])
+        upload = p.add('upload', None, inputs=['a.mkv'])
+        view = batch.BatchView({p: 'lecture'}, out=io.StringIO())
+        view.update(mkv, 'done')
+        view.update(upload, 'running', 1, 4)
+        self.assertEqual(['lectures: 0/1 done, steps: 1 done, 1 running', '  lecture orig: upload  running  25%'],
+                         view.lines())
+        view.update(upload, 'done')
+        self.assertEqual(['lectures: 1/1 done, steps: 2 done'], view.lines())
@@ -0,0 +1,112 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+import checkpoints
+import meta
+import pipeline
+
+
+class TestCheckpoints(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.orig = os.path.join(self.tmp_dir, '2016-10-07 goswamimj.mp4')
+        shutil.copy('tests/files/2016-10-07 goswamimj.yml', self.tmp_dir)
+        self.output = os.path.join(self.tmp_dir, 'out.mkv')
+        self.write(self.output, b'video')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, filename, data):
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    def test_recorded_step_is_done(self):
+        journal = checkpoints.Journal(self.orig)
+        self.assertFalse(journal.is_done('mkv', 'fp', [self.output]))
+        journal.record('mkv', 'fp', [self.output])
+        journal = checkpoints.Journal(self.orig)
+        self.assertTrue(journal.is_done('mkv', 'fp', [self.output]))
+        self.assertFalse(journal.is_done('mkv', 'other fp', [self.output]))
+        journal.forget('mkv')
+        self.assertFalse(checkpoints.Journal(self.orig).is_done('mkv', 'fp', [self.output]))
+
+    def test_truncated_last_line_is_ignored(self):
+        journal = checkpoints.Journal(self.orig)
+        journal.record('mkv', 'fp', [self.output])
+        with open(journal.filename, 'a', encoding='utf-8') as f:
+            f.write('{"step": "mp3", "finger')
+        journal = checkpoints.Journal(self.orig)
+        self.assertTrue(journal.is_done('mkv', 'fp', [self.output]))
+        self.assertFalse(journal.is_done('mp3', 'fp'))
+
+    def test_changed_or_missing_output_is_not_done(self):
+        journal = checkpoints.Journal(self.orig)
+        journal.record('mkv', 'fp', [self.output])
+        self.write(self.output, b'other')
+        self.assertFalse(journal.is_done('mkv', 'fp', [self.output]))
+        os.remove(self.output)
+        self.assertFalse(journal.is_done('mkv', 'fp', [self.output]))
+
+    def test_touched_output_is_checked_by_digest(self):
+        journal = checkpoints.Journal(self.orig)
+        journal.record('mkv', 'fp', [self.output])
+        st = os.stat(self.output)
+        os.utime(self.output, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertTrue(journal.is_done('mkv', 'fp', [self.output]))
+
+    def test_yaml_output(self):
+        youtube_id = pipeline.yaml_artifact(self.orig, 'youtube_id_orig')
+        journal = checkpoints.Journal(self.orig)
+        meta.update_yaml(self.orig, 'youtube_id_orig', 'abc')
+        journal.record('upload', None, [youtube_id])
+        self.assertTrue(journal.is_done('upload', None, [youtube_id]))
+        meta.update_yaml(self.orig, 'youtube_id_orig', 'def')
+        self.assertFalse(journal.is_done('upload', None, [youtube_id]))
+
+    def test_fingerprint_covers_inputs(self):
+        fingerprint = checkpoints.fingerprint('cmd', [self.output])
+        self.assertEqual(fingerprint, checkpoints.fingerprint('cmd', [self.output]))
+        self.assertNotEqual(fingerprint, checkpoints.fingerprint('other cmd', [self.output]))
+        self.write(self.output, b'longer video')
+        self.assertNotEqual(fingerprint, checkpoints.fingerprint('cmd', [self.output]))
+
+    def test_pipeline_resumes_after_failure(self):
+        runs = []
+        mkv = os.path.join(self.tmp_dir, 'a.mkv')
+        mp3 = os.path.join(self.tmp_dir, 'a.mp3')
+
+        def make_pipeline(fail):
+            def make_mkv(progress):
+                runs.append('mkv')
+                self.write(mkv, b'mkv')
+
+            def make_mp3(progress):
+                runs.append('mp3')
+                if fail:
+                    raise RuntimeError('mp3')
+                self.write(mp3, b'mp3')
+            p = pipeline.Pipeline('p', journal=checkpoints.Journal(self.orig))
+            p.add('mkv', make_mkv, inputs=[self.output], outputs=[mkv])
+            p.add('mp3', make_mp3, inputs=[mkv], outputs=[mp3])
+            return p
+
+        view = _View()
+        with self.assertRaises(pipeline.PipelineError):
+            pipeline.run(make_pipeline(fail=True), view=view)
+        pipeline.run(make_pipeline(fail=False), view=view)
+        self.assertEqual(['mkv', 'mp3', 'mp3'], runs)
+        self.assertEqual({'p: mkv': 'done before', 'p: mp3': 'done'}, view.states)
+
+
+class _View:
+    def __init__(self):
+        self.states = {}
+
+    def update(self, step, state, curr=None, total=None):
+        self.states[step.label] = state
+
+    def close(self):
+        pass
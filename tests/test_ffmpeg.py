@@ -1,6 +1,10 @@
 from unittest import TestCase
+import subprocess
+import tempfile
 
+import artifacts
 import ffmpeg
+import keyframes
 
 import os
 
@@ -26,6 +30,89 @@ class test_ffmpeg(TestCase):
         filename = self.get_test_filename('2016-10-17 avadhutmj.mp4')
         self.assertEqual(ffmpeg.to_args(filename), ['-to', '1:02:03'])
 
+    def test_plan_seek(self):
+        self.assertEqual((['-ss', '6'], ['-ss', '1.5', '-to', '19']), ffmpeg.plan_seek(7.5, 25, 6))
+        self.assertEqual(([], ['-to', '25']), ffmpeg.plan_seek(0, 25, 0))
+        self.assertEqual((['-ss', '7'], []), ffmpeg.plan_seek(7, None, 7))
+        self.assertEqual(([], ['-ss', '7']), ffmpeg.plan_seek(7, None, 0))
+
+    def test_seek_args_audio_only(self):
+        filename = self.get_test_filename('2016-10-17 avadhutmj.mp4')
+        self.assertEqual((['-ss', '7'], ['-to', '3716']), ffmpeg.seek_args(filename))
+
+    def test_seek_args_unparsable_times(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, '2016-01-01 seek.mp4')
+            with open(os.path.join(tmp_dir, '2016-01-01 seek.yml'), 'w') as f:
+                f.write('skip: 5 sec\ncut: 0:11\n')
+            self.assertEqual(([], ['-ss', '5 sec', '-to', '0:11']), ffmpeg.seek_args(filename, video_filename=filename))
+            with open(os.path.join(tmp_dir, '2016-01-01 seek.yml'), 'w') as f:
+                f.write('skip: 0:05\ncut: till the end\n')
+            self.assertEqual(([], ['-ss', '0:05', '-to', 'till the end']), ffmpeg.seek_args(filename))
+
+    def test_seek_args_start_where_ss_args_do(self):
+        self.check_seek_args_start_where_ss_args_do([])
+
+    def test_seek_args_with_start_time(self):
+        # timestamps of the source start at about 5s (the audio a bit earlier than the video),
+        # -ss and the .yml times are relative to that
+        self.check_seek_args_start_where_ss_args_do(['-output_ts_offset', '5'])
+
+    def check_seek_args_start_where_ss_args_do(self, source_args):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, '2016-01-01 seek.mp4')
+            subprocess.run(['ffmpeg', '-v', 'error', '-y',
+                            '-f', 'lavfi', '-i', 'testsrc=s=160x90:r=25:d=12',
+                            '-f', 'lavfi', '-i', 'sine=r=44100:d=12',
+                            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', '50', '-sc_threshold', '0',
+                            '-c:a', 'aac'] + source_args + [filename], check=True)
+            with open(os.path.join(tmp_dir, '2016-01-01 seek.yml'), 'w') as f:
+                f.write('skip: 0:05\ncut: 0:11\n')
+            try:
+                input_seek_args, output_seek_args = ffmpeg.seek_args(filename, video_filename=filename)
+                if source_args:
+                    self.assertEqual('-ss', input_seek_args[0])
+                    self.assertAlmostEqual(4, float(input_seek_args[1]), delta=0.1)
+                else:
+                    self.assertEqual(['-ss', '4'], input_seek_args)
+                # stream copy must give the very same packets, re-encoded audio must start at the same time
+                # (the samples differ a bit since the decoder starts from another packet)
+                for codec_args, ext, fields in [(['-c', 'copy'], '.mkv', 6), (['-vn', '-c:a', 'mp3'], '.mp3', 4)]:
+                    old_filename = os.path.join(tmp_dir, 'old' + ext)
+                    cmd = ['ffmpeg', '-v', 'error', '-y', '-i', filename] + codec_args
+                    cmd += ffmpeg.ss_args(filename) + ffmpeg.to_args(filename) + [old_filename]
+                    subprocess.run(cmd, check=True)
+
+                    new_filename = os.path.join(tmp_dir, 'new' + ext)
+                    cmd = ['ffmpeg', '-v', 'error', '-y'] + input_seek_args + ['-i', filename] + codec_args
+                    cmd += output_seek_args + [new_filename]
+                    subprocess.run(cmd, check=True)
+
+                    self.assertEqual(self.packets(old_filename, fields), self.packets(new_filename, fields))
+            finally:
+                keyframes._close(os.path.abspath(filename))
+
+    def test_tee_output(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = [os.path.join(tmp_dir, "it's [1].m4a"), os.path.join(tmp_dir, 'a|b.mka')]
+            cmd = ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'sine=r=8000:d=1',
+                   '-map', '0:a', '-c:a', 'aac',
+                   '-f', 'tee', ffmpeg.tee_output([(filenames[0], 'f=ipod'), (filenames[1], 'f=matroska')])]
+            subprocess.run(cmd, check=True)
+            self.assertTrue(all(os.path.getsize(filename) > 0 for filename in filenames))
+            self.assertEqual(filenames, artifacts._parse_cmd(cmd)[1])
+
+    @staticmethod
+    def packets(filename, fields):
+        """
+        first `fields` columns of framecrc of all the packets in the file:
+        stream, dts, pts, duration, size, checksum
+        """
+        cmd = ['ffmpeg', '-v', 'error', '-i', filename, '-c', 'copy', '-f', 'framecrc', '-']
+        res = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+        lines = [line for line in res.stdout.decode('utf-8').splitlines() if not line.startswith('#')]
+        return [[field.strip() for field in line.split(',')[:fields]] for line in lines]
+
     @staticmethod
     def get_test_filename(base_filename):
         directory = os.path.dirname(__file__)
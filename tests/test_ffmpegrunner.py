@@ -1,7 +1,12 @@
 import unittest
+import asyncio
 import os
 import contextlib
 import io
+import shutil
+import subprocess
+import tempfile
+import time
 
 import ffmpegrunner
 import win
@@ -71,3 +76,114 @@ class TestFfmpegrunner(unittest.TestCase):
         self.assertEqual('', out.getvalue(), 'should not print anything during ffmpeg run')
         self.assertEqual('', stderr.getvalue(), 'should not print anything to stderr during ffmpeg run')
         self.assertNotEqual(0, callback_count, 'callback should have been called at least once')
+
+    def test_run_progress_result(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mp4_filename = os.path.join(tmp_dir, 'one_sec.mp4')
+            shutil.copy(os.path.join(os.path.dirname(__file__), 'files', 'one_sec.mp4'), mp4_filename)
+            cmd = ['ffmpeg', '-i', mp4_filename, '-c', 'copy', os.path.join(tmp_dir, 'one_sec.mkv')]
+            calls = []
+            records = []
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                result = ffmpegrunner.run_progress(cmd, lambda curr, total: calls.append((curr, total)),
+                                                   records.append)
+            # the input is probed for the total, but no sidecar is left next to it
+            self.assertEqual(['one_sec.mkv', 'one_sec.mp4'], sorted(os.listdir(tmp_dir)))
+        self.assertEqual('', out.getvalue(), 'should not print anything during ffmpeg run')
+        self.assertEqual(0, result.returncode)
+        self.assertLess(0, result.wall_time)
+        self.assertLessEqual(0, result.cpu_time)
+        self.assertTrue(result.progress.done)
+        self.assertAlmostEqual(1.0, result.progress.out_time, delta=0.1)
+        self.assertLess(0, result.progress.total_size)
+        self.assertNotEqual(0, len(calls), 'callback should have been called at least once')
+        self.assertAlmostEqual(1.0, calls[-1][0], delta=0.1)
+        self.assertIs(result.progress, records[-1])
+        for curr, total in calls:
+            self.assertAlmostEqual(2.0, total, delta=0.1, msg='total is the input duration + 1 like in run()')
+        self.assertEqual(calls[-1][1], records[0].total, 'the first record has the total too')
+
+    def test_run_progress_throttles_callbacks(self):
+        cmd = ['ffmpeg', '-stats_period', '0.01', '-f', 'lavfi', '-i', 'testsrc=s=640x360:d=20', '-f', 'null', '-']
+        every_record = []
+        ffmpegrunner.run_progress(cmd, progress_callback=every_record.append, interval=0, check=True)
+        throttled = []
+        ffmpegrunner.run_progress(cmd, progress_callback=throttled.append, interval=3600, check=True)
+        # the first and the last record
+        self.assertEqual(2, len(throttled))
+        self.assertTrue(throttled[-1].done)
+        self.assertLess(2, len(every_record))
+
+    def test_run_progress_failure(self):
+        cmd = ['ffmpeg', '-i', 'no such file.mp4', '-c', 'copy', 'test_ffmpegrunner_tmp.mkv']
+        result = ffmpegrunner.run_progress(cmd, stderr_lines=1)
+        self.assertNotEqual(0, result.returncode)
+        self.assertIsNone(result.progress)
+        self.assertEqual(1, len(result.stderr_tail))
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            ffmpegrunner.run_progress(cmd, check=True)
+        self.assertIn('no such file', cm.exception.stderr)
+
+    def test_run_async(self):
+        cmds = [['ffmpeg', '-f', 'lavfi', '-i', 'testsrc=s=160x90:d={}'.format(seconds), '-f', 'null', '-']
+                for seconds in [1, 2, 3]]
+        calls = []
+
+        async def run_all():
+            return await asyncio.gather(*[
+                ffmpegrunner.run_async(cmd, lambda curr, total: calls.append(curr), check=True) for cmd in cmds])
+        results = asyncio.run(run_all())
+        self.assertEqual([0, 0, 0], [result.returncode for result in results])
+        self.assertEqual([1, 2, 3], [round(result.progress.out_time) for result in results])
+        self.assertNotEqual(0, len(calls), 'callback should have been called at least once')
+
+    def test_cpu_time_is_per_process(self):
+        # a long encode and a quick one at the same time, each gets only its own cpu time
+        heavy = ['ffmpeg', '-f', 'lavfi', '-i', 'testsrc=s=640x360:d=30', '-c:v', 'mpeg4', '-f', 'null', '-']
+        light = ['ffmpeg', '-f', 'lavfi', '-i', 'testsrc=s=160x90:d=1', '-f', 'null', '-']
+
+        async def run_both():
+            return await asyncio.gather(ffmpegrunner.run_async(heavy, check=True),
+                                        ffmpegrunner.run_async(light, check=True))
+        heavy_result, light_result = asyncio.run(run_both())
+        if not os.path.exists('/proc'):
+            self.assertIsNone(light_result.cpu_time)
+            return
+        self.assertLess(0, heavy_result.cpu_time)
+        self.assertLess(light_result.cpu_time, heavy_result.cpu_time / 2)
+        if hasattr(os, 'wait4'):
+            result = ffmpegrunner.run_progress(light, check=True)
+            self.assertLessEqual(result.cpu_time, result.wall_time + 0.1)
+
+    def test_proc_cpu_time(self):
+        self.assertIsNone(ffmpegrunner._proc_cpu_time(-1))
+        if os.path.exists('/proc'):
+            self.assertLess(0, ffmpegrunner._proc_cpu_time(os.getpid()))
+
+    def test_run_async_timeout_and_cancel(self):
+        # -re reads the input in real time, so it would run for a minute
+        cmd = ['ffmpeg', '-re', '-f', 'lavfi', '-i', 'testsrc=s=160x90:d=60', '-f', 'null', '-']
+
+        async def run_with_timeout():
+            started = time.monotonic()
+            with self.assertRaises(subprocess.TimeoutExpired):
+                await ffmpegrunner.run_async(cmd, timeout=0.5)
+            return time.monotonic() - started
+
+        async def run_and_cancel():
+            task = asyncio.ensure_future(ffmpegrunner.run_async(cmd))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.assertLess(asyncio.run(run_with_timeout()), 10)
+        asyncio.run(run_and_cancel())
+
+    def test_run_async_failure(self):
+        cmd = ['ffmpeg', '-i', 'no such file.mp4', '-c', 'copy', 'test_ffmpegrunner_tmp.mkv']
+        result = asyncio.run(ffmpegrunner.run_async(cmd))
+        self.assertNotEqual(0, result.returncode)
+        with self.assertRaises(subprocess.CalledProcessError):
+            asyncio.run(ffmpegrunner.run_async(cmd, check=True))
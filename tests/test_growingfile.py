@@ -0,0 +1,111 @@
+from unittest import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import googleapiclient.http
+
+import fake_upload_server
+import ffmpeg
+import growingfile
+import my_youtube
+import pipeline
+
+CHUNK_SIZE = growingfile.CHUNK_SIZE_ALIGNMENT
+
+
+def make_request(server, media):
+    return googleapiclient.http.HttpRequest(
+        googleapiclient.http.build_http(), lambda resp, content: json.loads(content.decode('utf-8')),
+        server.url + fake_upload_server.UPLOAD_PATH + '?uploadType=resumable', method='POST', body='{}',
+        headers={'content-type': 'application/json'}, resumable=media)
+
+
+class TestGrowingFileUpload(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'a.mkv')
+        self.server = fake_upload_server.FakeUploadServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def write_slowly(self, media, block_sizes, fail=False):
+        requests_before_finish = []
+
+        def write():
+            with open(self.filename, 'wb') as f:
+                for block_size in block_sizes:
+                    f.write(os.urandom(block_size))
+                    f.flush()
+                    time.sleep(0.05)
+            requests_before_finish.append(len(self.server.requests))
+            if fail:
+                media.abort()
+            else:
+                media.finish()
+        thread = threading.Thread(target=write)
+        thread.start()
+        return thread, requests_before_finish
+
+    def upload(self, media):
+        return my_youtube._resumable_upload(make_request(self.server, media), self.filename, lambda curr, total: None)
+
+    def test_uploads_while_writing(self):
+        media = growingfile.GrowingFileUpload(self.filename, chunksize=CHUNK_SIZE, poll_interval=0.01)
+        thread, requests_before_finish = self.write_slowly(media, [CHUNK_SIZE // 2] * 7)
+        video_id = self.upload(media)
+        thread.join()
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), self.server.videos[video_id])
+        # POST and the first chunks were sent before the file was complete
+        self.assertGreater(requests_before_finish[0], 2)
+        content_ranges = [content_range for method, path, content_range in self.server.requests if method == 'PUT']
+        self.assertEqual('bytes 0-{}/*'.format(CHUNK_SIZE - 1), content_ranges[0])
+        self.assertEqual('bytes {}-{}/{}'.format(3 * CHUNK_SIZE, 7 * CHUNK_SIZE // 2 - 1, 7 * CHUNK_SIZE // 2),
+                         content_ranges[-1])
+
+    def test_size_multiple_of_chunk_size(self):
+        media = growingfile.GrowingFileUpload(self.filename, chunksize=CHUNK_SIZE, poll_interval=0.01)
+        thread, _ = self.write_slowly(media, [CHUNK_SIZE] * 2)
+        video_id = self.upload(media)
+        thread.join()
+        self.assertEqual(2 * CHUNK_SIZE, len(self.server.videos[video_id]))
+
+    def test_writer_failure_fails_upload(self):
+        media = growingfile.GrowingFileUpload(self.filename, chunksize=CHUNK_SIZE, poll_interval=0.01)
+        thread, _ = self.write_slowly(media, [CHUNK_SIZE // 2] * 3, fail=True)
+        with self.assertRaises(growingfile.WriterFailed):
+            self.upload(media)
+        thread.join()
+        self.assertEqual({}, self.server.videos)
+
+    def test_ffmpeg_upload_step(self):
+        uploaded = []
+
+        def make_cmd():
+            cmd = ['ffmpeg', '-v', 'error', '-y', '-nostdin',
+                   '-f', 'lavfi', '-i', 'testsrc2=s=320x240:r=25:d=4', '-f', 'lavfi', '-i', 'sine=d=4',
+                   '-c:v', 'libx264', '-c:a', 'aac']
+            return cmd + ffmpeg.streamable_args() + [self.filename]
+
+        def upload(media, progress):
+            uploaded.append(my_youtube._resumable_upload(make_request(self.server, media), self.filename, progress))
+        p = pipeline.Pipeline()
+        p.add('mkv+upload', pipeline.ffmpeg_upload_step(upload, self.filename, make_cmd),
+              outputs=[self.filename], resource=pipeline.NETWORK)
+        pipeline.run(p, view=_View())
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), self.server.videos[uploaded[0]])
+
+
+class _View:
+    def update(self, step, state, curr=None, total=None):
+        pass
+
+    def close(self):
+        pass
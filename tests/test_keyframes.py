@@ -0,0 +1,66 @@
+from unittest import TestCase
+import os
+import subprocess
+import tempfile
+
+import keyframes
+
+
+class TestKeyframes(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.video_filename = os.path.join(self.tmp_dir.name, 'keyframes.mp4')
+
+    def tearDown(self):
+        keyframes._close(os.path.abspath(self.video_filename))
+        self.tmp_dir.cleanup()
+
+    def make_video(self, seconds, output_args=()):
+        # a keyframe every 2 seconds
+        cmd = ['ffmpeg', '-v', 'error', '-y',
+               '-f', 'lavfi', '-i', 'testsrc=s=160x90:r=25:d=' + str(seconds),
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', '50', '-sc_threshold', '0']
+        cmd += list(output_args) + [self.video_filename]
+        subprocess.run(cmd, check=True)
+
+    def test_parse_packets(self):
+        csv_str = '0.000000,K__\n0.160000,___\n0.080000,___\n2.000000,K_\nN/A,K__\n1.000000,KD_\n'
+        self.assertEqual([0.0, 1.0, 2.0], keyframes._parse_packets(csv_str))
+        self.assertEqual([-1.5, -0.5, 0.5], keyframes._parse_packets(csv_str, 1.5))
+
+    def test_index_roundtrip(self):
+        index_filename = os.path.join(self.tmp_dir.name, 'temp', 'keyframes.keyframes')
+        keyframes._write_index(index_filename, [0.0, 2.0, 4.5], (123, 456))
+        self.assertEqual((123, 456), keyframes._read_header(index_filename))
+        m, timestamps = keyframes._map_index(index_filename)
+        self.assertEqual([0.0, 2.0, 4.5], list(timestamps))
+        timestamps.release()
+        m.close()
+
+    def test_invalid_index(self):
+        index_filename = os.path.join(self.tmp_dir.name, 'broken.keyframes')
+        self.assertIsNone(keyframes._read_header(index_filename))
+        with open(index_filename, 'wb') as f:
+            f.write(b'qwe')
+        self.assertIsNone(keyframes._read_header(index_filename))
+
+    def test_next_and_prev_keyframe(self):
+        self.make_video(7)
+        self.assertEqual([0.0, 2.0, 4.0, 6.0], list(keyframes.get_keyframes(self.video_filename)))
+        self.assertEqual(2.0, keyframes.next_keyframe(self.video_filename, 2.0))
+        self.assertEqual(4.0, keyframes.next_keyframe(self.video_filename, 2.01))
+        self.assertIsNone(keyframes.next_keyframe(self.video_filename, 6.5))
+        self.assertEqual(2.0, keyframes.prev_keyframe(self.video_filename, 3.99))
+        self.assertEqual(0.0, keyframes.prev_keyframe(self.video_filename, 0.0))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, 'temp', 'keyframes.keyframes')))
+
+    def test_timestamps_are_relative_to_start_time(self):
+        self.make_video(5, ['-output_ts_offset', '10'])
+        self.assertEqual([0.0, 2.0, 4.0], list(keyframes.get_keyframes(self.video_filename)))
+        self.assertEqual(2.0, keyframes.prev_keyframe(self.video_filename, 3.0))
+
+    def test_index_is_rebuilt_when_source_changes(self):
+        self.make_video(3)
+        self.assertEqual([0.0, 2.0], list(keyframes.get_keyframes(self.video_filename)))
+        self.make_video(5)
+        self.assertEqual([0.0, 2.0, 4.0], list(keyframes.get_keyframes(self.video_filename)))
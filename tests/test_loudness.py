@@ -0,0 +1,73 @@
+from unittest import TestCase, mock
+import asyncio
+import os
+import subprocess
+import tempfile
+
+import ffmpegrunner
+import loudness
+
+
+class TestLoudness(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'lecture.wav')
+        self.make_wav(self.filename, 0.1)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def make_wav(filename, amplitude, af=None):
+        cmd = ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'sine=r=44100:d=5,volume={}'.format(amplitude)]
+        if af:
+            cmd += ['-af', af]
+        subprocess.run(cmd + [filename], check=True)
+
+    def measure(self, filename):
+        return asyncio.run(loudness.measure(filename))
+
+    def test_gain_reaches_target(self):
+        measured = self.measure(self.filename)
+        self.assertLess(measured['i'], loudness.TARGET_I)
+        normalized_filename = os.path.join(self.tmp_dir.name, 'normalized.wav')
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-i', self.filename,
+                        '-af', loudness.volume_filter(self.filename), normalized_filename], check=True)
+        self.assertAlmostEqual(loudness.TARGET_I, self.measure(normalized_filename)['i'], delta=0.5)
+
+    def test_measured_once(self):
+        runs = []
+        run_async = ffmpegrunner.run_async
+
+        async def counted(cmd, *args, **kwargs):
+            runs.append(cmd)
+            return await run_async(cmd, *args, **kwargs)
+        with mock.patch('ffmpegrunner.run_async', counted):
+            first = self.measure(self.filename)
+            self.assertEqual(first, self.measure(self.filename))
+            self.assertEqual(1, len(runs))
+            # another audio in place of the old one
+            self.make_wav(self.filename, 0.5)
+            second = self.measure(self.filename)
+            self.assertEqual(2, len(runs))
+        self.assertGreater(second['i'], first['i'])
+
+    def test_volume_filter_needs_measurement(self):
+        with self.assertRaises(RuntimeError):
+            loudness.volume_filter(self.filename)
+
+    def test_gain(self):
+        self.assertAlmostEqual(6.0, loudness.gain({'i': -22.0, 'lra': 5.0, 'tp': -10.0, 'threshold': -32.0}))
+        self.assertAlmostEqual(-4.0, loudness.gain({'i': -12.0, 'lra': 5.0, 'tp': -2.0, 'threshold': -22.0}))
+        # the peak doesn't let it get any louder
+        self.assertAlmostEqual(2.0, loudness.gain({'i': -22.0, 'lra': 5.0, 'tp': -3.0, 'threshold': -32.0}))
+        self.assertEqual(0.0, loudness.gain({'i': float('-inf'), 'lra': 0.0, 'tp': float('-inf'), 'threshold': -70.0}))
+
+    def test_parse_loudnorm_output(self):
+        lines = ['[Parsed_loudnorm_0 @ 0x1] ', '{',
+                 '\t"input_i" : "-27.61",', '\t"input_tp" : "-4.47",', '\t"input_lra" : "18.06",',
+                 '\t"input_thresh" : "-39.20",', '\t"output_i" : "-16.58",', '\t"target_offset" : "0.58"', '}']
+        self.assertEqual({'i': -27.61, 'lra': 18.06, 'tp': -4.47, 'threshold': -39.2},
+                         loudness.parse_loudnorm_output(lines))
+        with self.assertRaises(ValueError):
+            loudness.parse_loudnorm_output(['size=N/A time=00:00:05.00'])
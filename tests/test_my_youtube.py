@@ -1,7 +1,20 @@
 from unittest import TestCase
+from unittest import mock
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 
+import googleapiclient.http
+
+import fake_upload_server
 import my_youtube
 
+CHUNK_SIZE = 256 * 1024
+
 
 class Test_my_youtube(TestCase):
     def test_compose_upload_body(self):
@@ -20,3 +33,337 @@ class Test_my_youtube(TestCase):
     def test_compose_upload_body_ru_lang_from_filename(self):
         body = my_youtube._compose_upload_body(filename='2016-07-05 goswamimj ru.mp4')
         self.assertEqual('ru', body['snippet']['defaultLanguage'])
+
+
+class TestChunkSizer(TestCase):
+    def test_grows_at_most_twice(self):
+        sizer = my_youtube.ChunkSizer(CHUNK_SIZE, chunk_seconds=10)
+        self.assertEqual(2 * CHUNK_SIZE, sizer.succeeded(CHUNK_SIZE, 0.01))
+        self.assertEqual(4 * CHUNK_SIZE, sizer.succeeded(2 * CHUNK_SIZE, 0.01))
+
+    def test_follows_throughput(self):
+        sizer = my_youtube.ChunkSizer(16 * CHUNK_SIZE, chunk_seconds=10)
+        # 1 chunk per second: 10 chunks in the next 10 seconds
+        self.assertEqual(10 * CHUNK_SIZE, sizer.succeeded(16 * CHUNK_SIZE, 16))
+        # rounded down to the alignment
+        self.assertEqual(5 * CHUNK_SIZE, sizer.succeeded(10 * CHUNK_SIZE, 19))
+
+    def test_shrinks_after_failure(self):
+        sizer = my_youtube.ChunkSizer(4 * CHUNK_SIZE)
+        self.assertEqual(2 * CHUNK_SIZE, sizer.failed())
+        self.assertEqual(CHUNK_SIZE, sizer.failed())
+        self.assertEqual(my_youtube.MIN_CHUNK_SIZE, sizer.failed())
+
+    def test_limits(self):
+        sizer = my_youtube.ChunkSizer(4 * CHUNK_SIZE, min_size=2 * CHUNK_SIZE, max_size=6 * CHUNK_SIZE)
+        self.assertEqual(6 * CHUNK_SIZE, sizer.succeeded(4 * CHUNK_SIZE, 0.01))
+        self.assertEqual(2 * CHUNK_SIZE, sizer.succeeded(CHUNK_SIZE, 100))
+
+
+class _Crash(Exception):
+    pass
+
+
+class TestResumableUpload(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'a.mkv')
+        with open(self.filename, 'wb') as f:
+            f.write(os.urandom(5 * CHUNK_SIZE + 1000))
+        self.body = my_youtube._compose_upload_body(self.filename)
+        self.server = fake_upload_server.FakeUploadServer().start()
+        # no sleeping between retries
+        patcher = mock.patch('random.random', return_value=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def upload(self, update=None, sizer=None, telemetry=None):
+        media = my_youtube._FileUpload(self.filename, chunksize=CHUNK_SIZE, resumable=True)
+        insert_request = googleapiclient.http.HttpRequest(
+            googleapiclient.http.build_http(), lambda resp, content: json.loads(content.decode('utf-8')),
+            self.server.url + fake_upload_server.UPLOAD_PATH + '?uploadType=resumable', method='POST',
+            body=json.dumps(self.body), headers={'content-type': 'application/json'}, resumable=media)
+        state = my_youtube._UploadState(self.filename, self.body)
+        return my_youtube._resumable_upload(insert_request, self.filename, update or (lambda curr, total: None), state,
+                                            sizer, telemetry)
+
+    def uploaded(self, video_id):
+        with open(self.filename, 'rb') as f:
+            return f.read() == self.server.videos[video_id]
+
+    def crash_after(self, size):
+        def update(curr, total):
+            if curr >= size:
+                raise _Crash()
+        with self.assertRaises(_Crash):
+            self.upload(update)
+
+    def test_resumes_after_restart(self):
+        self.crash_after(2 * CHUNK_SIZE)
+        self.assertTrue(os.path.isfile(self.filename + my_youtube.UPLOAD_STATE_SUFFIX))
+        video_id = self.upload()
+        self.assertTrue(self.uploaded(video_id))
+        self.assertEqual(1, len(self.server.sessions))
+        content_ranges = [content_range for method, path, content_range in self.server.requests if method == 'PUT']
+        self.assertEqual('bytes */{}'.format(os.path.getsize(self.filename)), content_ranges[2])
+        self.assertEqual('bytes {}-{}/{}'.format(2 * CHUNK_SIZE, 3 * CHUNK_SIZE - 1, os.path.getsize(self.filename)),
+                         content_ranges[3])
+        self.assertFalse(os.path.exists(self.filename + my_youtube.UPLOAD_STATE_SUFFIX))
+
+    def test_dropped_connection(self):
+        self.crash_after(CHUNK_SIZE)
+        # the next chunk is cut short, the upload goes on from what the server has got
+        self.server.drop_after = 1000
+        video_id = self.upload()
+        self.assertTrue(self.uploaded(video_id))
+        self.assertEqual(1, len(self.server.sessions))
+        content_range = 'bytes {}-{}/{}'.format(CHUNK_SIZE + 1000, 2 * CHUNK_SIZE + 999, os.path.getsize(self.filename))
+        self.assertIn(('PUT', '/session/1', content_range), self.server.requests)
+
+    def test_expired_session(self):
+        self.crash_after(CHUNK_SIZE)
+        self.server.sessions.clear()
+        video_id = self.upload()
+        self.assertTrue(self.uploaded(video_id))
+
+    def test_changed_file_starts_over(self):
+        self.crash_after(CHUNK_SIZE)
+        with open(self.filename, 'ab') as f:
+            f.write(b'more')
+        video_id = self.upload()
+        self.assertTrue(self.uploaded(video_id))
+        self.assertEqual(2, len(self.server.sessions))
+
+    def test_adaptive_chunks_telemetry(self):
+        log_filename = os.path.join(self.tmp_dir, 'upload.log')
+        telemetry = my_youtube.UploadTelemetry(log_filename)
+        self.server.drop_after = 1000
+        video_id = self.upload(sizer=my_youtube.ChunkSizer(CHUNK_SIZE), telemetry=telemetry)
+        self.assertTrue(self.uploaded(video_id))
+        chunks = telemetry.chunks
+        self.assertEqual(os.path.getsize(self.filename), sum(chunk['size'] for chunk in chunks))
+        # the dropped chunk is retried once, then the local link lets the chunks grow
+        self.assertEqual(1, chunks[0]['retries'])
+        self.assertEqual([2 * CHUNK_SIZE, 4 * CHUNK_SIZE], [chunk['next_chunk_size'] for chunk in chunks[:2]])
+        self.assertTrue(all(chunk['bytes_per_second'] for chunk in chunks))
+        with open(log_filename, encoding='utf-8') as f:
+            self.assertEqual(chunks, [json.loads(line) for line in f])
+
+
+class _Credentials:
+    def __init__(self, expired):
+        self.access_token_expired = expired
+        self.refreshed = 0
+
+    def refresh(self, http):
+        self.access_token_expired = False
+        self.refreshed += 1
+
+    def authorize(self, http):
+        return http
+
+
+class TestService(TestCase):
+    def setUp(self):
+        self.server = fake_upload_server.FakeUploadServer().start()
+        my_youtube.use_base_url(self.server.url)
+
+    def tearDown(self):
+        my_youtube.use_base_url(None)
+        self.server.stop()
+
+    def test_cached(self):
+        youtube = my_youtube._get_authenticated_service()
+        self.assertIs(youtube, my_youtube._get_authenticated_service())
+        my_youtube.use_base_url(self.server.url)
+        self.assertIsNot(youtube, my_youtube._get_authenticated_service())
+
+    def test_refreshes_expired_credentials_only(self):
+        credentials = _Credentials(expired=False)
+        my_youtube.use_base_url(self.server.url, credentials)
+        my_youtube._get_authenticated_service()
+        self.assertEqual(0, credentials.refreshed)
+        credentials.access_token_expired = True
+        my_youtube._get_authenticated_service()
+        my_youtube._get_authenticated_service()
+        self.assertEqual(1, credentials.refreshed)
+
+    def test_upload(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, '2016-07-05 a.mkv')
+            with open(filename, 'wb') as f:
+                f.write(os.urandom(my_youtube.INITIAL_CHUNK_SIZE + 1000))
+            video_id = my_youtube.upload(filename, title='a', update=lambda curr, total: None)
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), self.server.videos[video_id])
+        method, path, content_range = self.server.requests[0]
+        self.assertEqual(('POST', fake_upload_server.UPLOAD_PATH), (method, path.split('?')[0]))
+
+
+class TestUploadsIndex(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = fake_upload_server.FakeUploadServer().start()
+        my_youtube.use_base_url(self.server.url)
+        self.index = my_youtube.UploadsIndex(os.path.join(self.tmp_dir, 'uploads.sqlite3'))
+
+    def tearDown(self):
+        my_youtube.use_base_url(None)
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def playlist_requests(self):
+        requests = [path for method, path, content_range in self.server.requests if '/playlistItems' in path]
+        self.server.requests.clear()
+        return len(requests)
+
+    def test_sync(self):
+        for i in range(5):
+            self.server.add_video('title {}'.format(i))
+        self.assertEqual(5, self.index.sync(page_size=2))
+        self.assertEqual(3, self.playlist_requests())
+        self.assertEqual('video3', self.index.video_id('title 2'))
+        self.assertIsNone(self.index.video_id('title 5'))
+        self.assertEqual(['video5', 'video4'], [video['id'] for video in self.index.videos(2)])
+
+    def test_nothing_changed(self):
+        self.server.add_video('a')
+        self.index.sync()
+        self.playlist_requests()
+        self.assertEqual(0, self.index.sync())
+        self.assertEqual(1, self.playlist_requests())
+        self.assertEqual('video1', self.index.video_id('a'))
+
+    def test_incremental(self):
+        for i in range(5):
+            self.server.add_video('title {}'.format(i))
+        self.index.sync(page_size=2)
+        self.playlist_requests()
+        self.server.add_video('new')
+        self.server.rename_video('video5', 'renamed')
+        self.assertEqual(2, self.index.sync(page_size=2))
+        # the second page has a known video, the older pages aren't read
+        self.assertEqual(2, self.playlist_requests())
+        self.assertEqual('video6', self.index.video_id('new'))
+        self.assertEqual('video5', self.index.video_id('renamed'))
+        self.assertIsNone(self.index.video_id('title 4'))
+
+    def test_full_sync_forgets_deleted(self):
+        self.server.add_video('a')
+        self.server.add_video('b')
+        self.index.sync()
+        del self.server.channel[0]
+        self.index.sync(full=True)
+        self.assertEqual(['video1'], [video['id'] for video in self.index.videos()])
+
+    def test_full_sync_now_and_then(self):
+        for i in range(5):
+            self.server.add_video('title {}'.format(i))
+        self.index.sync(page_size=2)
+        self.server.rename_video('video2', 'renamed')
+        # the oldest one
+        del self.server.channel[-1]
+        self.index.sync(page_size=2)
+        # older pages weren't read
+        self.assertEqual('video2', self.index.video_id('title 1'))
+        self.assertEqual('video1', self.index.video_id('title 0'))
+        last_full_sync = datetime.datetime.now(datetime.timezone.utc) - my_youtube.UPLOADS_FULL_SYNC_INTERVAL
+        self.index._set('last_full_sync', (last_full_sync - datetime.timedelta(hours=1)).isoformat())
+        self.index.sync(page_size=2)
+        self.assertEqual('video2', self.index.video_id('renamed'))
+        self.assertIsNone(self.index.video_id('title 0'))
+        self.assertEqual(4, len(self.index.videos()))
+
+    def test_missing_russian(self):
+        self.server.add_video('en 1', lang='en', recording_date='2020-01-01T00:00:00Z')
+        self.server.add_video('ru 1', lang='ru', recording_date='2020-01-01T00:00:00Z')
+        self.server.add_video('en 2', lang='en', recording_date='2020-01-02T00:00:00Z')
+        self.server.add_video('no date', lang='en')
+        self.index.sync()
+        self.assertEqual([('en 2', '2020-01-02')],
+                         [(video['title'], video['recording_date']) for video in self.index.missing_russian()])
+
+    def test_uploaded_video(self):
+        filename = os.path.join(self.tmp_dir, '2016-07-05 a.mkv')
+        with open(filename, 'wb') as f:
+            f.write(b'video')
+        video_id = my_youtube.upload(filename, title='uploaded', update=lambda curr, total: None)
+        with mock.patch.object(my_youtube, 'UPLOADS_INDEX_FILENAME', self.index.filename):
+            self.assertEqual(video_id, my_youtube.get_recent_video_id('uploaded'))
+        self.assertEqual(['2016-07-05'], [video['recording_date'] for video in self.index.missing_russian()])
+
+
+class TestUploadScheduler(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = fake_upload_server.FakeUploadServer().start()
+        my_youtube.use_base_url(self.server.url)
+
+    def tearDown(self):
+        my_youtube.use_base_url(None)
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def upload(self, size):
+        filename = os.path.join(self.tmp_dir, 'a.mkv')
+        with open(filename, 'wb') as f:
+            f.write(os.urandom(size))
+        return my_youtube.upload(filename, update=lambda curr, total: None)
+
+    def test_quota_ledger(self):
+        filename = os.path.join(self.tmp_dir, 'quota.json')
+        ledger = my_youtube.QuotaLedger(filename, daily_quota=100)
+        ledger.spend(60)
+        with self.assertRaises(my_youtube.QuotaExceeded):
+            my_youtube.QuotaLedger(filename, daily_quota=100).spend(50)
+        self.assertEqual(60, ledger.spent())
+        my_youtube.QuotaLedger(filename, daily_quota=100).spend(40)
+        self.assertEqual(0, ledger.remaining())
+
+    def test_upload_stops_before_exceeding_quota(self):
+        quota = my_youtube.QuotaLedger(None, daily_quota=my_youtube.QUOTA_COST_INSERT + 1)
+        my_youtube.set_scheduler(my_youtube.UploadScheduler(quota=quota))
+        self.upload(1000)
+        self.assertEqual(my_youtube.QUOTA_COST_INSERT, quota.spent())
+        with self.assertRaises(my_youtube.QuotaExceeded):
+            self.upload(1000)
+        self.assertEqual(1, len(self.server.videos))
+        self.assertEqual(1, len(self.server.sessions))
+
+    def test_bandwidth(self):
+        # a second of burst, then 1 MiB/s
+        my_youtube.set_scheduler(my_youtube.UploadScheduler(bytes_per_second=2 ** 20, quota=my_youtube.QuotaLedger(None)))
+        start = time.monotonic()
+        self.upload(2 * 2 ** 20)
+        self.assertGreater(time.monotonic() - start, 0.9)
+
+    def test_concurrency(self):
+        scheduler = my_youtube.UploadScheduler(concurrency=2, quota=my_youtube.QuotaLedger(None))
+        running = []
+        most_running = []
+        started = []
+        lock = threading.Lock()
+
+        def upload(i):
+            with scheduler.slot():
+                with lock:
+                    started.append(i)
+                    running.append(i)
+                    most_running.append(len(running))
+                time.sleep(0.05)
+                with lock:
+                    running.remove(i)
+        threads = []
+        for i in range(5):
+            threads.append(threading.Thread(target=upload, args=(i,)))
+            threads[-1].start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, max(most_running))
+        # in turn
+        self.assertEqual(list(range(5)), started)
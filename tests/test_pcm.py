@@ -0,0 +1,91 @@
+from unittest import TestCase, mock
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+import pcm
+
+
+class TestPcm(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.filename = os.path.join(cls.tmp_dir.name, 'lecture.wav')
+        # 2s tone at half scale (sine is at 1/8), 3s of silence, 1s of a tone clipped by a too high level
+        cmd = ['ffmpeg', '-v', 'error', '-y',
+               '-f', 'lavfi', '-i', 'sine=f=440:r=8000:d=2,volume=4',
+               '-f', 'lavfi', '-i', 'anullsrc=r=8000:cl=mono:d=3',
+               '-f', 'lavfi', '-i', 'sine=f=440:r=8000:d=1,volume=32',
+               '-filter_complex', '[0:a][1:a][2:a]concat=n=3:v=0:a=1',
+               '-c:a', 'pcm_s16le', cls.filename]
+        subprocess.run(cmd, check=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_blocks(self):
+        sizes = [len(block) for block in pcm.blocks(self.filename, block_seconds=0.75)]
+        self.assertEqual(6 * 8000, sum(sizes))
+        self.assertEqual([6000] * 8, sizes)
+        stereo = next(pcm.blocks(self.filename, sample_rate=4000, channels=2, block_seconds=1))
+        self.assertEqual((4000, 2), stereo.shape)
+        self.assertEqual(np.float32, stereo.dtype)
+        part = sum(len(block) for block in pcm.blocks(self.filename, start=1, duration=2))
+        self.assertEqual(2 * 8000, part)
+
+    def test_stop_early(self):
+        for block in pcm.blocks(self.filename, block_seconds=0.1):
+            break
+
+    def test_missing_file(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(pcm.blocks(os.path.join(self.tmp_dir.name, 'missing.wav')))
+
+    def test_missing_file_error(self):
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            list(pcm.blocks(os.path.join(self.tmp_dir.name, 'missing.wav')))
+        self.assertIn('missing.wav', cm.exception.stderr)
+
+    def test_lots_of_errors(self):
+        # more on stderr than a pipe holds before any samples
+        cmd = [sys.executable, '-c',
+               'import sys; sys.stderr.write("error\\n" * 100000); sys.stdout.buffer.write(bytes(8000 * 4))']
+        blocks = []
+
+        def read():
+            blocks.extend(len(block) for block in pcm.blocks(self.filename))
+        with mock.patch('pcm.decode_cmd', return_value=cmd):
+            thread = threading.Thread(target=read, daemon=True)
+            thread.start()
+            thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([8000], blocks)
+
+    def test_analyze(self):
+        peak, clipping, envelope, silence = pcm.analyze(
+            self.filename, [pcm.Peak(), pcm.Clipping(), pcm.Envelope(window_seconds=0.5), pcm.Silence()],
+            block_seconds=0.3)
+        self.assertAlmostEqual(1.0, peak[0], places=3)
+        # the clipped tone is at full scale for most of its samples
+        self.assertGreater(clipping[0], 4000)
+        self.assertLess(clipping[0], 8000)
+        self.assertEqual(12, len(envelope))
+        db = pcm.to_db(envelope)
+        # rms of a sine is its amplitude / sqrt(2)
+        np.testing.assert_allclose(db[:4], pcm.to_db(0.5 / np.sqrt(2)), atol=0.1)
+        self.assertTrue(np.all(np.isneginf(db[4:10])))
+        self.assertEqual(1, len(silence))
+        np.testing.assert_allclose(silence[0], (2.0, 5.0), atol=0.1)
+
+    def test_silence_runs(self):
+        silence = pcm.Silence(min_seconds=0.3, window_seconds=0.1)
+        silence.start(10, 1)
+        # 1 sample per window: loud, quiet x3 (across blocks), loud, quiet x2 (too short), loud, quiet to the end
+        for values in ([1, 0, 0], [0], [1, 0, 0, 1], [0, 0, 0, 0]):
+            silence.feed(np.array(values, dtype=np.float32).reshape(-1, 1))
+        self.assertEqual([(0.1, 0.4), (0.8, 1.2)], [(round(a, 6), round(b, 6)) for a, b in silence.result()])
@@ -0,0 +1,159 @@
+from unittest import TestCase
+import asyncio
+import os
+import threading
+import time
+
+import artifacts
+import meta
+import orig
+import orig_norm
+import pipeline
+import rus
+import rus_titled
+
+
+class RecordingView:
+    def __init__(self):
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def update(self, step, state, curr=None, total=None):
+        with self.lock:
+            self.states[step.label] = state
+
+    def close(self):
+        pass
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        self.events = []
+        self.view = RecordingView()
+
+    def step(self, name, seconds=0.05, fail=False):
+        async def run(progress):
+            self.events.append(('start', name))
+            await asyncio.sleep(seconds)
+            progress(1, 1)
+            if fail:
+                raise RuntimeError(name)
+            self.events.append(('end', name))
+        return run
+
+    def test_dependencies_order_steps(self):
+        p = pipeline.Pipeline('p')
+        p.add('upload', self.step('upload'), inputs=['/tmp/a.mkv'], outputs=['/tmp/a#youtube_id'],
+              resource=pipeline.NETWORK)
+        p.add('mkv', self.step('mkv'), inputs=['/tmp/a.mp4'], outputs=['/tmp/a.mkv'], resource=pipeline.DISK)
+        pipeline.run(p, view=self.view)
+        self.assertEqual([('start', 'mkv'), ('end', 'mkv'), ('start', 'upload'), ('end', 'upload')], self.events)
+        self.assertEqual({'p: mkv': 'done', 'p: upload': 'done'}, self.view.states)
+
+    def test_resource_limits(self):
+        running = {pipeline.DISK: 0, pipeline.CPU: 0}
+        max_running = {pipeline.DISK: 0, pipeline.CPU: 0}
+
+        def make_run(resource):
+            async def run(progress):
+                running[resource] += 1
+                max_running[resource] = max(max_running[resource], running[resource])
+                await asyncio.sleep(0.05)
+                running[resource] -= 1
+            return run
+        p = pipeline.Pipeline()
+        for i in range(4):
+            p.add('disk%d' % i, make_run(pipeline.DISK), outputs=['disk%d' % i], resource=pipeline.DISK)
+            p.add('cpu%d' % i, make_run(pipeline.CPU), outputs=['cpu%d' % i], resource=pipeline.CPU)
+        pipeline.run(p, limits={pipeline.DISK: 1, pipeline.CPU: 3}, view=self.view)
+        self.assertEqual({pipeline.DISK: 1, pipeline.CPU: 3}, max_running)
+
+    def test_failure_skips_dependent_steps_only(self):
+        p = pipeline.Pipeline()
+        p.add('mkv', self.step('mkv', fail=True), outputs=['a.mkv'], resource=pipeline.DISK)
+        p.add('upload', self.step('upload'), inputs=['a.mkv'], resource=pipeline.NETWORK)
+        p.add('mp3', self.step('mp3', seconds=0.1), outputs=['a.mp3'])
+        with self.assertRaises(pipeline.PipelineError) as cm:
+            pipeline.run(p, view=self.view)
+        self.assertEqual(['mkv'], [step.name for step in cm.exception.failed])
+        self.assertEqual({'mkv': 'failed', 'upload': 'skipped', 'mp3': 'done'}, self.view.states)
+        self.assertIn(('end', 'mp3'), self.events)
+
+    def test_plain_functions_run_in_threads(self):
+        threads = []
+
+        def run(progress):
+            threads.append(threading.current_thread())
+            time.sleep(0.01)
+        p = pipeline.Pipeline()
+        p.add('a', run)
+        p.add('b', run)
+        pipeline.run(p, view=self.view)
+        self.assertEqual(2, len(threads))
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_longest_jobs_first(self):
+        short = pipeline.Pipeline('short', cost=1)
+        short.add('mkv', self.step('short mkv'), outputs=['short.mkv'], resource=pipeline.DISK)
+        long = pipeline.Pipeline('long', cost=10)
+        long.add('mkv', self.step('long mkv'), outputs=['long.mkv'], resource=pipeline.DISK)
+        chain = pipeline.Pipeline('chain', cost=4)
+        chain.add('mkv', self.step('chain mkv'), outputs=['chain.mkv'], resource=pipeline.DISK)
+        chain.add('mp3', self.step('chain mp3'), inputs=['chain.mkv'], outputs=['chain.mp3'], resource=pipeline.DISK)
+        chain.add('upload', self.step('chain upload'), inputs=['chain.mp3'], resource=pipeline.NETWORK)
+        deps = pipeline.dependencies(short.steps + long.steps + chain.steps)
+        self.assertEqual(12, pipeline.priorities(deps)[chain.steps[0]])
+        # the first step grabs the free slot, the rest wait for it and go by priority
+        pipeline.run([short, long, chain], limits={pipeline.DISK: 1}, view=self.view)
+        starts = [name for event, name in self.events if event == 'start']
+        self.assertEqual(['short mkv', 'chain mkv', 'long mkv', 'chain mp3', 'chain upload'], starts)
+
+    def test_invalid_graphs(self):
+        p = pipeline.Pipeline()
+        p.add('a', self.step('a'), inputs=['b'], outputs=['a'])
+        p.add('b', self.step('b'), inputs=['a'], outputs=['b'])
+        with self.assertRaises(ValueError):
+            pipeline.dependencies(p.steps)
+        p = pipeline.Pipeline()
+        p.add('a', self.step('a'), outputs=['/tmp/x.mkv'])
+        p.add('b', self.step('b'), outputs=['/tmp/../tmp/x.mkv'])
+        with self.assertRaises(ValueError):
+            pipeline.dependencies(p.steps)
+        with self.assertRaises(ValueError):
+            p.add('c', self.step('c'), resource='gpu')
+
+    def test_scripts_pipelines(self):
+        orig_mp4_filename = os.path.join(os.path.dirname(__file__), 'files', '2016-10-07 goswamimj.mp4')
+        orig_pipeline = orig.make_pipeline(orig_mp4_filename)
+        rus_pipeline = rus.make_pipeline(orig_mp4_filename)
+        deps = pipeline.dependencies(orig_pipeline.steps + rus_pipeline.steps)
+        labels = {step.label: [dep.label for dep in step_deps] for step, step_deps in deps.items()}
+        self.assertEqual(['orig: mkv'], labels['orig: upload'])
+        self.assertEqual([], labels['orig: mp3'])
+        self.assertEqual(['rus: mono m4a'], labels['rus: mono mkv'])
+        self.assertEqual(['rus: mono mkv'], labels['rus: mono upload'])
+        single_pass = orig.make_pipeline(orig_mp4_filename, single_pass=True)
+        self.assertEqual(['m4a+mkv+mp3', 'upload'], [step.name for step in single_pass.steps])
+        lang = meta.get_lang(orig_mp4_filename)
+        self.assertIn(meta.get_work_filename(orig_mp4_filename, ' ' + lang + '.mp3'), single_pass.steps[0].outputs)
+        stream_upload = orig.make_pipeline(orig_mp4_filename, stream_upload=True)
+        self.assertEqual(['m4a', 'mkv+upload', 'mp3'], [step.name for step in stream_upload.steps])
+        rus_stream_upload = rus.make_pipeline(orig_mp4_filename, stream_upload=True)
+        pipeline.dependencies(stream_upload.steps + rus_stream_upload.steps)
+        rus_single_pass = rus.make_pipeline(orig_mp4_filename, single_pass=True)
+        self.assertEqual(['m4a+mkv+mp3', 'mono upload', 'stereo upload'], [step.name for step in rus_single_pass.steps])
+        # the tee muxer's outputs are known to artifacts.py
+        self.assertEqual(sorted(rus_single_pass.steps[0].outputs),
+                         sorted(artifacts.output_filenames(rus._ru_all_cmd(orig_mp4_filename))))
+        rus_single_pass = rus.make_pipeline(orig_mp4_filename, stream_upload=True, single_pass=True)
+        self.assertEqual(['m4a+mkv+mp3+upload'], [step.name for step in rus_single_pass.steps])
+        rus_titled_single_pass = rus_titled.make_pipeline(orig_mp4_filename, single_pass=True)
+        self.assertEqual(['title', 'mkv+mp3', 'mono upload', 'stereo upload'],
+                         [step.name for step in rus_titled_single_pass.steps])
+        self.assertEqual(sorted(rus_titled_single_pass.steps[1].outputs),
+                         sorted(artifacts.output_filenames(rus_titled._ru_all_cmd(orig_mp4_filename))))
+        # every normalized output waits for the loudness to be measured
+        norm_deps = pipeline.dependencies(orig_norm.make_pipeline(orig_mp4_filename).steps)
+        labels = {step.label: [dep.label for dep in step_deps] for step, step_deps in norm_deps.items()}
+        for name in ('m4a', 'mkv', 'mp3'):
+            self.assertEqual(['orig_norm: loudness'], labels['orig_norm: ' + name])
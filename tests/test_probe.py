@@ -0,0 +1,79 @@
+from unittest import TestCase
+from unittest import mock
+import os
+import subprocess
+import tempfile
+
+import probe
+
+
+class TestProbe(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.video_filename = os.path.join(self.tmp_dir.name, 'probe.mp4')
+        cmd = ['ffmpeg', '-v', 'error', '-y',
+               '-f', 'lavfi', '-i', 'testsrc=s=320x180:r=25:d=2',
+               '-f', 'lavfi', '-i', 'sine=r=44100:d=2',
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-profile:v', 'main', '-level:v', '3.1',
+               '-c:a', 'aac', '-ac', '2',
+               self.video_filename]
+        subprocess.run(cmd, check=True)
+        probe._cache.clear()
+
+    def tearDown(self):
+        probe._cache.clear()
+        self.tmp_dir.cleanup()
+
+    def test_accessors(self):
+        self.assertEqual([320, 180], probe.get_video_size(self.video_filename))
+        self.assertEqual(['main', '3.1'], probe.get_h264_profile_and_level(self.video_filename))
+        self.assertAlmostEqual(2.0, probe.get_duration(self.video_filename), delta=0.1)
+        self.assertEqual(25.0, probe.get_fps(self.video_filename))
+        self.assertEqual([2, 'stereo'], probe.get_audio_layout(self.video_filename))
+
+    def test_ffprobe_runs_once(self):
+        with mock.patch('probe._run_ffprobe', wraps=probe._run_ffprobe) as run_ffprobe:
+            probe.get_video_size(self.video_filename)
+            probe.get_h264_profile_and_level(self.video_filename)
+            probe.get_fps(self.video_filename)
+            self.assertEqual(1, run_ffprobe.call_count)
+
+            # another process would find the sidecar
+            probe._cache.clear()
+            self.assertEqual([320, 180], probe.get_video_size(self.video_filename))
+            self.assertEqual(1, run_ffprobe.call_count)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, 'temp', 'probe.probe.json')))
+
+    def test_sidecar_is_ignored_when_source_changes(self):
+        probe.probe(self.video_filename)
+        with open(self.video_filename, 'ab') as f:
+            f.write(b'\0')
+        with mock.patch('probe._run_ffprobe', wraps=probe._run_ffprobe) as run_ffprobe:
+            probe.probe(self.video_filename)
+            self.assertEqual(1, run_ffprobe.call_count)
+
+    def test_missing_streams(self):
+        with mock.patch('probe._run_ffprobe', return_value={}):
+            filename = os.path.join(self.tmp_dir.name, 'empty.mp4')
+            open(filename, 'wb').close()
+            self.assertIsNone(probe.get_video_size(filename))
+            self.assertIsNone(probe.get_h264_profile_and_level(filename))
+            self.assertIsNone(probe.get_duration(filename))
+            self.assertIsNone(probe.get_fps(filename))
+            self.assertIsNone(probe.get_audio_layout(filename))
+
+    def test_failed_ffprobe_is_not_cached(self):
+        filename = os.path.join(self.tmp_dir.name, 'broken.mp4')
+        with open(filename, 'wb') as f:
+            f.write(b'not a video')
+        self.assertEqual({}, probe.probe(filename))
+        self.assertIsNone(probe.get_duration(filename))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, 'temp', 'broken.probe.json')))
+        # the same file written till the end
+        with open(self.video_filename, 'rb') as src, open(filename, 'r+b') as f:
+            f.write(src.read())
+        self.assertEqual([320, 180], probe.get_video_size(filename))
+
+    def test_not_persisted(self):
+        self.assertAlmostEqual(2.0, probe.get_duration(self.video_filename, persist=False), delta=0.1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, 'temp')))
@@ -0,0 +1,45 @@
+from unittest import TestCase
+import os
+import subprocess
+import tempfile
+
+import keyframes
+import meta
+import rus
+
+
+class TestRus(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.orig_mp4_filename = os.path.join(self.tmp_dir.name, '2016-10-07 goswamimj.mp4')
+        mixdown_filename = meta.get_work_filename(self.orig_mp4_filename, ' ru_mixdown.wav')
+        os.makedirs(os.path.dirname(mixdown_filename))
+        subprocess.run(['ffmpeg', '-v', 'error', '-y',
+                        '-f', 'lavfi', '-i', 'testsrc=s=160x90:r=25:d=4',
+                        '-f', 'lavfi', '-i', 'sine=r=44100:d=4',
+                        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', '25', '-c:a', 'aac',
+                        self.orig_mp4_filename], check=True)
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'sine=f=300:r=44100:d=4', '-ac', '2',
+                        mixdown_filename], check=True)
+        with open(os.path.splitext(self.orig_mp4_filename)[0] + '.yml', 'w', encoding='utf-8') as f:
+            f.write("title_en: Faith\ntitle_ru: Вера\nskip: '0:01'\ncut: '0:03'\n")
+
+    def tearDown(self):
+        keyframes._close(os.path.abspath(self.orig_mp4_filename))
+        self.tmp_dir.cleanup()
+
+    def test_tee_slaves_have_global_headers(self):
+        # the stock ffmpeg and aac encoder instead of the build with libfdk_aac
+        cmd = rus._ru_all_cmd(self.orig_mp4_filename, streamable=True)
+        cmd = ['ffmpeg', '-v', 'error'] + ['aac' if arg == 'libfdk_aac' else arg for arg in cmd[1:]]
+        self.assertIn('+global_header', cmd)
+        subprocess.run(cmd, check=True)
+        for name in (' ru_mono.mkv', ' ru_mono.m4a'):
+            res = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+                                  '-show_entries', 'stream=codec_name,extradata_size', '-of', 'csv=p=0',
+                                  meta.get_work_filename(self.orig_mp4_filename, name)],
+                                 stdout=subprocess.PIPE, check=True)
+            codec_name, extradata_size = res.stdout.decode('utf-8').strip().split(',')
+            self.assertEqual('aac', codec_name)
+            # AudioSpecificConfig in CodecPrivate/esds, not ADTS headers in the packets
+            self.assertLess(0, int(extradata_size))
@@ -0,0 +1,89 @@
+from unittest import TestCase, mock
+import datetime
+import os
+import tempfile
+
+import meta
+import pipeline
+import rus_titled
+
+
+class TestRusTitled(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.orig_mp4_filename = os.path.join(self.tmp_dir.name, '2020-01-01 goswamimj.mp4')
+        mixdown_filename = meta.get_work_filename(self.orig_mp4_filename, ' ru_mixdown.wav')
+        ts_title_filename = meta.get_work_filename(self.orig_mp4_filename, ' ru_title.ts')
+        os.makedirs(os.path.dirname(mixdown_filename))
+        for filename in (self.orig_mp4_filename, mixdown_filename, ts_title_filename):
+            with open(filename, 'wb') as f:
+                f.write(b'\0' * 1000)
+        meta.update_yaml(self.orig_mp4_filename, 'cut', '0:13')
+        self.runs = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fake_create(self, name, *filenames):
+        def create(orig_mp4_filename, ts_title_filename):
+            self.runs.append(name)
+            for filename in filenames:
+                with open(meta.get_work_filename(orig_mp4_filename, filename), 'wb') as f:
+                    f.write(b'out')
+        return create
+
+    def run_titled_steps(self, single_pass):
+        p = rus_titled.make_pipeline(self.orig_mp4_filename, single_pass)
+        p.steps = [step for step in p.steps if step.name in ('mono mkv', 'stereo mkv', 'mkv+mp3')]
+        view = _View()
+        with mock.patch('rus_titled._create_ru_mono_video', self.fake_create('mono mkv', ' ru_mono titled.mkv')), \
+                mock.patch('rus_titled._create_ru_stereo_video',
+                           self.fake_create('stereo mkv', ' ru_stereo titled.mkv')), \
+                mock.patch('rus_titled._create_ru_files',
+                           self.fake_create('mkv+mp3', ' ru_mono titled.mkv', ' ru_stereo titled.mkv',
+                                            ' ru_mono.mp3', ' ru_stereo.mp3')), \
+                mock.patch('title.get_title_end_time', return_value=datetime.timedelta(seconds=10)):
+            pipeline.run(p, view=view)
+        return view.states
+
+    def test_changed_cut_reruns_titled_videos(self):
+        self.run_titled_steps(single_pass=False)
+        states = self.run_titled_steps(single_pass=False)
+        self.assertEqual(['mono mkv', 'stereo mkv'], sorted(self.runs))
+        self.assertEqual({'rus_titled: mono mkv': 'done before', 'rus_titled: stereo mkv': 'done before'}, states)
+        meta.update_yaml(self.orig_mp4_filename, 'cut', '0:15')
+        states = self.run_titled_steps(single_pass=False)
+        self.assertEqual(4, len(self.runs))
+        self.assertEqual({'rus_titled: mono mkv': 'done', 'rus_titled: stereo mkv': 'done'}, states)
+
+    def test_changed_cut_reruns_single_pass(self):
+        self.run_titled_steps(single_pass=True)
+        self.assertEqual({'rus_titled: mkv+mp3': 'done before'}, self.run_titled_steps(single_pass=True))
+        meta.update_yaml(self.orig_mp4_filename, 'cut', '0:15')
+        self.assertEqual({'rus_titled: mkv+mp3': 'done'}, self.run_titled_steps(single_pass=True))
+        self.assertEqual(['mkv+mp3', 'mkv+mp3'], self.runs)
+
+    def test_single_pass_seeks_the_mixdown(self):
+        mixdown_filename = meta.get_work_filename(self.orig_mp4_filename, ' ru_mixdown.wav')
+        meta.update_yaml(self.orig_mp4_filename, 'skip', '0:05')
+        cmd = rus_titled._ru_all_cmd(self.orig_mp4_filename)
+        i = cmd.index(mixdown_filename)
+        self.assertEqual(['-ss', '0:05', '-i'], cmd[i - 3:i])
+        self.assertEqual(['-to', '8'], cmd[cmd.index('96k') + 1:cmd.index('96k') + 3])
+        # can't be parsed here, ffmpeg may still take it: the video is piped from there anyway
+        meta.update_yaml(self.orig_mp4_filename, 'skip', '5 sec')
+        cmd = rus_titled._ru_all_cmd(self.orig_mp4_filename)
+        i = cmd.index(mixdown_filename)
+        self.assertEqual(['-ss', '5 sec', '-i'], cmd[i - 3:i])
+        self.assertEqual(1, cmd.count('-ss'))
+
+
+class _View:
+    def __init__(self):
+        self.states = {}
+
+    def update(self, step, state, curr=None, total=None):
+        self.states[step.label] = state
+
+    def close(self):
+        pass
@@ -0,0 +1,72 @@
+from unittest import TestCase, mock
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import keyframes
+import probe
+import segments
+
+
+def _count_frames(filename):
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+           '-show_entries', 'stream=nb_read_packets', '-of', 'json', filename]
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+    return int(json.loads(res.stdout.decode('utf-8'))['streams'][0]['nb_read_packets'])
+
+
+class TestSegments(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.video_filename = os.path.join(self.tmp_dir.name, 'segments.mp4')
+        # a keyframe every second
+        cmd = ['ffmpeg', '-v', 'error', '-y',
+               '-f', 'lavfi', '-i', 'testsrc=s=160x90:r=25:d=6',
+               '-f', 'lavfi', '-i', 'sine=r=44100:d=6',
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-profile:v', 'main', '-level:v', '3.0',
+               '-g', '25', '-sc_threshold', '0',
+               '-c:a', 'aac',
+               self.video_filename]
+        subprocess.run(cmd, check=True)
+        probe._cache.clear()
+
+    def tearDown(self):
+        keyframes._close(os.path.abspath(self.video_filename))
+        probe._cache.clear()
+        self.tmp_dir.cleanup()
+
+    def test_split(self):
+        self.assertEqual([(0.0, None)], segments.split([0.0, 2.0, 4.0], 6.0, 1))
+        self.assertEqual([(0.0, 2.0), (2.0, 4.0), (4.0, None)], segments.split([0.0, 2.0, 4.0], 6.0, 3))
+        # nearest keyframes, never an empty chunk
+        self.assertEqual([(0.0, 4.0), (4.0, None)], segments.split([0.0, 4.0], 6.0, 3))
+        self.assertEqual([(0.0, 2.5), (2.5, None)], segments.split([0.0, 2.5, 5.5], 6.0, 2))
+        self.assertEqual([(0.0, None)], segments.split([0.0], 6.0, 4))
+
+    def test_encode(self):
+        output_filename = os.path.join(self.tmp_dir.name, 'encoded.mp4')
+        progress = []
+        segments.encode(self.video_filename, output_filename, jobs=3,
+                        callback=lambda curr, max_value: progress.append((curr, max_value)))
+        self.assertEqual(150, _count_frames(output_filename))
+        self.assertEqual(['main', '3.0'], probe.get_h264_profile_and_level(output_filename))
+        self.assertEqual(probe.get_audio_layout(self.video_filename), probe.get_audio_layout(output_filename))
+        self.assertAlmostEqual(6.0, probe.get_duration(output_filename), delta=0.1)
+        self.assertEqual(3, len(progress))
+        self.assertAlmostEqual(6.0, progress[-1][0], delta=0.1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, 'temp', 'encoded.chunks')))
+
+    def test_failed_chunk_stops_the_others(self):
+        # the first chunk would take a minute, the second one fails right away
+        long_cmd = ['ffmpeg', '-v', 'error', '-nostdin', '-re', '-f', 'lavfi', '-i', 'testsrc=s=160x90:d=60',
+                    '-f', 'null', '-']
+        failing_cmd = ['ffmpeg', '-v', 'error', '-nostdin', '-i', 'no such file.mp4', '-f', 'null', '-']
+        cmds = iter([long_cmd, failing_cmd])
+        output_filename = os.path.join(self.tmp_dir.name, 'encoded.mp4')
+        started = time.monotonic()
+        with mock.patch('segments._chunk_cmd', lambda *args: next(cmds)):
+            with self.assertRaises(subprocess.CalledProcessError):
+                segments.encode(self.video_filename, output_filename, jobs=2)
+        self.assertLess(time.monotonic() - started, 10)
@@ -0,0 +1,53 @@
+from unittest import TestCase, mock
+import datetime
+import os
+import tempfile
+
+import meta
+import title
+
+
+class TestTitle(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.orig_mp4_filename = os.path.join(self.tmp_dir.name, '2020-01-01 goswamimj.mp4')
+        self.ts_title_filename = meta.get_work_filename(self.orig_mp4_filename, ' en_title.ts')
+        self.titled_filename = meta.get_work_filename(self.orig_mp4_filename, ' en titled.mkv')
+        os.makedirs(os.path.dirname(self.ts_title_filename))
+        for filename in (self.orig_mp4_filename, self.ts_title_filename):
+            with open(filename, 'wb') as f:
+                f.write(b'\0' * 1000)
+        meta.update_yaml(self.orig_mp4_filename, 'cut', '0:13')
+        self.runs = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fake_run_with_title_piped(self, cmd, orig_mp4_filename, ts_title_filename, title_end_time):
+        self.runs.append(title._rest_ts_cmd(orig_mp4_filename, title_end_time))
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'mkv')
+
+    def run_cached(self, title_end_time=datetime.timedelta(seconds=10)):
+        cmd = ['ffmpeg', '-y', '-f', 'mpegts', '-i', 'pipe:0', '-c', 'copy', self.titled_filename]
+        with mock.patch('title.run_with_title_piped', self.fake_run_with_title_piped):
+            title.run_with_title_piped_cached(cmd, self.orig_mp4_filename, self.ts_title_filename, title_end_time)
+
+    def test_changed_cut_rebuilds_titled_video(self):
+        self.run_cached()
+        self.run_cached()
+        self.assertEqual(1, len(self.runs))
+        # neither the title ts nor the consumer command depend on the cut, the piped rest does
+        meta.update_yaml(self.orig_mp4_filename, 'cut', '0:15')
+        self.run_cached()
+        self.assertEqual(2, len(self.runs))
+        self.assertIn('5', self.runs[-1])
+        self.run_cached(datetime.timedelta(seconds=11))
+        self.assertEqual(3, len(self.runs))
+
+    def test_piped_key(self):
+        cmd = ['ffmpeg', '-y', '-f', 'mpegts', '-i', 'pipe:0', '-c', 'copy', self.titled_filename]
+        with mock.patch('title.get_title_end_time', return_value=datetime.timedelta(seconds=10)):
+            key = title.piped_key(cmd, self.orig_mp4_filename, self.ts_title_filename)
+            meta.update_yaml(self.orig_mp4_filename, 'cut', '0:15')
+            self.assertNotEqual(key, title.piped_key(cmd, self.orig_mp4_filename, self.ts_title_filename))
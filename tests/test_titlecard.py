@@ -0,0 +1,52 @@
+from unittest import TestCase
+from unittest import mock
+import os
+import tempfile
+
+from PIL import Image
+
+import titlecard
+
+
+class TestTitlecard(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_make_png(self):
+        png_filename = titlecard.make_png('Author', 'Title', 320, 180, self.tmp_dir.name)
+        with Image.open(png_filename) as image:
+            self.assertEqual('RGBA', image.mode)
+            self.assertEqual((320, 180), image.size)
+            self.assertEqual((0, 0, 0, 16), image.getpixel((0, 0)))
+            self.assertEqual((0, 255), image.getextrema()[0])
+            # title is above the center, author below
+            bbox_top = image.crop((0, 0, 320, 90)).getchannel('R').getbbox()
+            bbox_bottom = image.crop((0, 90, 320, 180)).getchannel('R').getbbox()
+            self.assertIsNotNone(bbox_top)
+            self.assertIsNotNone(bbox_bottom)
+
+    def test_cache(self):
+        with mock.patch('titlecard.render', wraps=titlecard.render) as render:
+            png_filename = titlecard.make_png('Author', 'Title', 320, 180, self.tmp_dir.name)
+            self.assertEqual(png_filename, titlecard.make_png('Author', 'Title', 320, 180, self.tmp_dir.name))
+            self.assertEqual(1, render.call_count)
+            other_filename = titlecard.make_png('Author', 'Other title', 320, 180, self.tmp_dir.name)
+            self.assertNotEqual(png_filename, other_filename)
+            titlecard.make_png('Author', 'Title', 640, 360, self.tmp_dir.name)
+            self.assertEqual(3, render.call_count)
+        self.assertEqual(3, len(os.listdir(self.tmp_dir.name)))
+
+    def test_wrap(self):
+        font = titlecard._font(40)
+        text = 'Srila Guru Maharaj on the nature of devotion and how to hear'
+        self.assertEqual([text], titlecard.wrap(text, font, 10000))
+        max_width = font.getlength(text) * 0.6
+        lines = titlecard.wrap(text, font, max_width)
+        self.assertEqual(2, len(lines))
+        self.assertEqual(text, ' '.join(lines))
+        widths = [font.getlength(line) for line in lines]
+        self.assertLessEqual(max(widths), max_width)
+        self.assertLess(abs(widths[0] - widths[1]), font.getlength('devotion '))
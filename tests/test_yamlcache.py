@@ -0,0 +1,67 @@
+from unittest import TestCase
+import contextlib
+import os
+
+import meta
+import win
+import yamlcache
+import yamlupdater
+
+
+class TestYamlCache(TestCase):
+    def setUp(self):
+        files_dir = os.path.join(os.path.dirname(__file__), 'files')
+        self.mp4_filename = os.path.join(files_dir, '2016-01-03 yamlcache.mp4')
+        self.filename = os.path.join(files_dir, '2016-01-03 yamlcache.yml')
+        with win.open(self.filename, 'w', encoding='utf-8') as f:
+            f.write('title_en: Test title\nlang: ru\n')
+        yamlcache.invalidate()
+        yamlcache.reset_stats()
+
+    def tearDown(self):
+        win.unlink(self.filename)
+        with contextlib.suppress(FileNotFoundError):
+            win.unlink(self.filename + '.lock')
+        yamlcache.invalidate()
+
+    def test_repeated_getters_parse_once(self):
+        self.assertEqual('Test title', meta.get_title_en(self.mp4_filename))
+        self.assertEqual('ru', meta.get_lang(self.mp4_filename))
+        meta.get_youtube_description_ru_stereo(self.mp4_filename)
+        stats = yamlcache.stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertLess(0, stats['hits'])
+
+    def test_update_yaml_invalidates(self):
+        self.assertEqual('ru', meta.get_lang(self.mp4_filename))
+        # same size as before, possibly within the same mtime tick
+        meta.update_yaml(self.mp4_filename, 'lang', 'en')
+        self.assertEqual('en', meta.get_lang(self.mp4_filename))
+        self.assertEqual(2, yamlcache.stats()['misses'])
+
+    def test_external_change_is_noticed(self):
+        self.assertEqual('Test title', meta.get_title_en(self.mp4_filename))
+        with win.open(self.filename, 'w', encoding='utf-8') as f:
+            f.write('title_en: Another, longer title\n')
+        self.assertEqual('Another, longer title', meta.get_title_en(self.mp4_filename))
+
+    def test_yamlupdater_set_invalidates(self):
+        yaml_data = yamlcache.load(self.filename)
+        self.assertNotIn('key', yaml_data)
+        yamlupdater.set(self.filename, 'key', 1)
+        self.assertEqual(1, yamlcache.load(self.filename)['key'])
+
+    def test_lru_eviction(self):
+        old_max = yamlcache.MAX_ENTRIES
+        yamlcache.MAX_ENTRIES = 1
+        try:
+            yamlcache.load(self.filename)
+            meta.get_lang('qwe')  # non-existing files are not cached
+            yamlcache.load(self.filename)
+            self.assertEqual(1, yamlcache.stats()['hits'])
+            other_filename = os.path.join(os.path.dirname(self.filename), '2016-10-17 avadhutmj.yml')
+            yamlcache.load(other_filename)
+            yamlcache.load(self.filename)
+            self.assertEqual(3, yamlcache.stats()['misses'])
+        finally:
+            yamlcache.MAX_ENTRIES = old_max
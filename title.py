@@ -1,23 +1,23 @@
+import contextlib
 import os
+import shutil
 import subprocess
 import sys
-import json
 import datetime
-import re
 
+import artifacts
 import meta
 import ffmpeg
+import keyframes
+import probe
+import titlecard
 
 
 def get_video_size(filename):
-    try:
-        cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', filename]
-        res = subprocess.run(cmd, stdout=subprocess.PIPE)
-        json_str = res.stdout.decode('utf-8')
-        json_obj = json.loads(json_str)
-        return [int(json_obj['streams'][0]['width']), int(json_obj['streams'][0]['height'])]
-    except KeyError:
+    size = probe.get_video_size(filename)
+    if size is None:
         return [1280, 720]
+    return size
 
 
 # return array of ffmpeg options to match the video in the given file (same h.264 profile, same level)
@@ -27,70 +27,18 @@ def get_ffmpeg_encoding_options_from_video_file(filename):
 
 
 def get_h264_profile_and_level(filename):
-    try:
-        cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', filename]
-        res = subprocess.run(cmd, stdout=subprocess.PIPE)
-        json_str = res.stdout.decode('utf-8')
-        json_obj = json.loads(json_str)
-        profile = str.lower(json_obj['streams'][0]['profile'])
-        level = str(json_obj['streams'][0]['level'])
-        level_dotted = level[0] + '.' + level[1]
-        return [profile, level_dotted]
-    except KeyError:
+    profile_and_level = probe.get_h264_profile_and_level(filename)
+    if profile_and_level is None:
         return 'main'
+    return profile_and_level
 
 
 def make_png(orig_mp4_filename, lang):
-    png_filename = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '_title.png')
-
     [width, height] = get_video_size(orig_mp4_filename)
-    scale = float(height) / 720
-
     authors = meta.get_artist(orig_mp4_filename, lang, 100)
-    author_srt = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '_author.srt')
-    with open(author_srt, 'w', encoding='utf8') as f:
-        f.write('1\n00:00:00,000 --> 09:59:59,990\n' + authors)
-    author_srt_escaped = author_srt.replace('\\', '/')
-    author_srt_escaped = author_srt_escaped.replace(':', '\\\\:')
-    f_author = ('subtitles=filename={srt}' +
-                ':force_style=\'FontName=Charis SIL,Fontsize={fontsize},' +
-                'Alignment=10,PlayResX={width},PlayResY={height},PrimaryColour=&Hffffff\''
-                ).format(srt=author_srt_escaped, fontsize=int(60*scale), width=width, height=height)
-    f_shift_down = ('crop={width}:{height}-{shift}:0:0,pad={width}:{height}:0:{shift}:color=black@0.0'
-                    ).format(shift=int(200*scale), width=width, height=height)
-
     title = meta.get_title(orig_mp4_filename, lang)
-    title_srt = meta.get_work_filename(orig_mp4_filename, ' ' + lang + '_title.srt')
-    with open(title_srt, 'w', encoding='utf8') as f:
-        f.write('1\n00:00:00,000 --> 09:59:59,990\n' + title)
-    title_srt_escaped = title_srt.replace('\\', '/')
-    title_srt_escaped = title_srt_escaped.replace(':', '\\\\:')
-    f_title = ('subtitles=filename={srt}' +
-               ':force_style=\'FontName=Charis SIL,Fontsize={fontsize},' +
-               'Alignment=10,PlayResX={width},PlayResY={height},PrimaryColour=&Hffffff\''
-               ).format(srt=title_srt_escaped, fontsize=int(108*scale), width=width, height=height)
-    f_shift_up = ('crop={width}:{height}-{shift}:0:{shift},pad={width}:{height}:0:0:color=black@0.0'
-                  ).format(shift=int(80*scale), width=width, height=height)
-
-    f_transparent = 'geq=r=r(X\,Y):a=if(r(X\,Y)\,r(X\,Y)\,16)'
-    filter_complex = ''
-    filter_complex += ',' + f_author
-    filter_complex += ',' + f_shift_down
-    filter_complex += ',' + f_title
-    filter_complex += ',' + f_shift_up
-    filter_complex += ',' + f_transparent
-    filter_complex = filter_complex[1:]
-    cmd = ['ffmpeg',
-            '-f', 'lavfi', '-i', 'color=c=black:s={width}x{height}:d=10,format=rgba'.format(width=width, height=height),
-            '-filter_complex', filter_complex,
-            '-frames:v', '1',
-            '-y', png_filename
-            ]
-    os.environ['FONTCONFIG_FILE'] = 'C:\\Users\\ashutosh\\Dropbox\\Reference\\S\\scripts\\fonts\\fonts.conf'
-    subprocess.run(cmd)
-    os.remove(author_srt)
-    os.remove(title_srt)
-    return png_filename
+    cache_dir = os.path.dirname(meta.get_work_filename(orig_mp4_filename, ''))
+    return titlecard.make_png(authors, title, width, height, cache_dir)
 
 
 def make_title_ts(orig_mp4_filename, lang, seconds):
@@ -111,63 +59,104 @@ def make_title_ts(orig_mp4_filename, lang, seconds):
     cmd += get_ffmpeg_encoding_options_from_video_file(orig_mp4_filename)
     cmd += [ts_title_filename]
     print(cmd)
-    subprocess.run(cmd)
+    artifacts.run(cmd)
     return ts_title_filename
 
 
-def make_rest_ts(orig_mp4_filename, lang, title_end_time):
-    ts_rest_filename = meta.get_work_filename(orig_mp4_filename, ' {lang}_rest.ts'.format(lang=lang))
-    cmd = ['ffmpeg', '-y',
-           '-i', orig_mp4_filename,
-           '-c', 'copy', '-bsf:v', 'h264_mp4toannexb']
-    cmd += ['-ss', str(title_end_time)]
-    cmd += ffmpeg.to_args(orig_mp4_filename)
-    cmd += [ts_rest_filename]
+def _rest_ts_cmd(orig_mp4_filename, title_end_time):
+    """ffmpeg command writing the source from title_end_time up to the cut time as mpegts to stdout"""
+    # title_end_time is a keyframe, so we can seek the input right to it
+    title_end = title_end_time.total_seconds()
+    cut_time = meta.get_cut_time_timedelta(orig_mp4_filename)
+    cut = cut_time.total_seconds() if cut_time is not None else None
+    input_seek_args, output_seek_args = ffmpeg.plan_seek(title_end, cut, title_end)
+    cmd = ['ffmpeg', '-nostats', '-loglevel', 'warning']
+    cmd += input_seek_args
+    cmd += ['-i', orig_mp4_filename,
+            '-c', 'copy', '-bsf:v', 'h264_mp4toannexb']
+    cmd += output_seek_args
+    cmd += ['-f', 'mpegts', 'pipe:1']
+    return cmd
+
+
+def run_with_title_piped(cmd, orig_mp4_filename, ts_title_filename, title_end_time):
+    """
+    Run ffmpeg cmd that reads its video from '-f mpegts -i pipe:0', feeding it the title ts
+    followed by the rest of the source. The rest is stream-copied on the fly by another ffmpeg,
+    so it never hits the disk.
+    """
+    rest_cmd = _rest_ts_cmd(orig_mp4_filename, title_end_time)
     print(cmd)
-    subprocess.run(cmd)
-    return ts_rest_filename
+    print(rest_cmd)
+    p = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    rest_returncode = 0
+    try:
+        with open(ts_title_filename, 'rb') as f:
+            shutil.copyfileobj(f, p.stdin)
+        p.stdin.flush()
+        rest_returncode = subprocess.run(rest_cmd, stdout=p.stdin).returncode
+    except BrokenPipeError:
+        # cmd has failed, we'll report its exit code below
+        pass
+    finally:
+        with contextlib.suppress(BrokenPipeError):
+            p.stdin.close()
+    p.wait()
+    if p.returncode:
+        raise subprocess.CalledProcessError(p.returncode, cmd)
+    if rest_returncode:
+        raise subprocess.CalledProcessError(rest_returncode, rest_cmd)
+
+
+def run_with_title_piped_cached(cmd, orig_mp4_filename, ts_title_filename, title_end_time):
+    """run_with_title_piped() unless the output of cmd is up to date (see artifacts.py)"""
+    # the rest piped into cmd ends at the cut time and starts at title_end_time,
+    # neither of them is seen in cmd itself or in the title ts
+    artifacts.run(cmd, lambda cmd: run_with_title_piped(cmd, orig_mp4_filename, ts_title_filename, title_end_time),
+                  inputs=[orig_mp4_filename, ts_title_filename],
+                  extra_key=_rest_ts_cmd(orig_mp4_filename, title_end_time))
+
+
+def piped_key(cmd, orig_mp4_filename, ts_title_filename):
+    """artifacts key of what run_with_title_piped_cached() makes with cmd, e.g. for a pipeline step fingerprint"""
+    title_end_time = get_title_end_time(orig_mp4_filename)
+    return artifacts.get_key(cmd, inputs=[orig_mp4_filename, ts_title_filename],
+                             extra_key=_rest_ts_cmd(orig_mp4_filename, title_end_time))
 
 
 def get_next_keyframe_timestamp(filename, start_time: datetime.timedelta):
-    cmd = ['ffprobe', '-select_streams', 'v', '-show_frames',
-           '-show_entries', 'frame=pict_type,best_effort_timestamp_time',
-           '-of','csv',
-           '-read_intervals', str(start_time)+'%+#500',
-           filename]
-    res = subprocess.run(cmd, stdout=subprocess.PIPE)
-    res_arr = res.stdout.decode('utf-8').splitlines()
-    for line in res_arr:
-        m = re.match('^frame,(\d+\.\d+),I$', line)
-        if m:
-            timestamp = datetime.timedelta(seconds=float(m.group(1)))
-            if timestamp >= start_time:
-                return timestamp
-    raise RuntimeError('Could not find next keyframe after ' + start_time)
-
-
-def concatenate_ts_to_mp4(filename_ts1, filename_ts2, filename_mp4):
-    print(filename_ts1, filename_ts2, filename_mp4)
-    cmd = ['ffmpeg', '-y',
-           '-i', 'concat:{}|{}'.format(filename_ts1, filename_ts2),
-           '-c', 'copy', '-bsf:a', 'aac_adtstoasc',
-           filename_mp4]
-    print(cmd)
-    subprocess.run(cmd)
+    keyframe_time = keyframes.next_keyframe(filename, start_time.total_seconds())
+    if keyframe_time is None:
+        raise RuntimeError('Could not find next keyframe after ' + str(start_time))
+    return datetime.timedelta(seconds=keyframe_time)
 
 
 def make_mp4_with_title(orig_mp4_filename, lang, cut_video_filename):
-    ts_title_filename, ts_rest_filename = make_ts_files_with_title_and_rest(orig_mp4_filename, lang)
-    concatenate_ts_to_mp4(ts_title_filename, ts_rest_filename, cut_video_filename)
+    ts_title_filename, title_end_time = make_title_ts_and_get_rest_start(orig_mp4_filename, lang)
+    cmd = ['ffmpeg', '-y',
+           '-f', 'mpegts', '-i', 'pipe:0',
+           '-c', 'copy', '-bsf:a', 'aac_adtstoasc',
+           cut_video_filename]
+    run_with_title_piped_cached(cmd, orig_mp4_filename, ts_title_filename, title_end_time)
 
 
-def make_ts_files_with_title_and_rest(orig_mp4_filename, lang):
+def make_title_ts_and_get_rest_start(orig_mp4_filename, lang):
+    """
+    Re-encode the first GOPs of the video with the title on top into a ts file.
+    :return: ts filename and the time (keyframe) in the source where the rest of the video starts
+    """
     title_start_time = meta.get_skip_time_timedelta(orig_mp4_filename)
-    min_title_end_time = title_start_time + datetime.timedelta(seconds=10)
-    title_end_time = get_next_keyframe_timestamp(orig_mp4_filename, min_title_end_time)
+    title_end_time = get_title_end_time(orig_mp4_filename)
     title_len_seconds = (title_end_time - title_start_time).total_seconds()
     ts_title_filename = make_title_ts(orig_mp4_filename, lang, title_len_seconds)
-    ts_rest_filename = make_rest_ts(orig_mp4_filename, lang, title_end_time)
-    return ts_title_filename, ts_rest_filename
+    return ts_title_filename, title_end_time
+
+
+def get_title_end_time(orig_mp4_filename):
+    """The first keyframe 10 seconds after the skip time: the title ends and the copied rest of the video starts here"""
+    title_start_time = meta.get_skip_time_timedelta(orig_mp4_filename)
+    min_title_end_time = title_start_time + datetime.timedelta(seconds=10)
+    return get_next_keyframe_timestamp(orig_mp4_filename, min_title_end_time)
 
 
 def main():
@@ -0,0 +1,117 @@
+"""
+Title card rendering.
+
+Lays out the author and title lines with the Charis SIL font and writes an RGBA png
+that is overlaid on the first seconds of the video. Text is white and fully opaque,
+the background is black and almost transparent (alpha 16), text edges blend between the two.
+
+Rendered cards are cached in the work dir by a hash of everything that affects the picture
+(text, font, resolution, scale), so repeated runs just return the existing file.
+"""
+import hashlib
+import json
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'CharisSIL-R.ttf')
+
+# bump when the layout changes so that cached cards are re-rendered
+_LAYOUT_VERSION = 1
+
+# sizes and offsets for 720p, scaled to the video height.
+# Font sizes are line heights (ascent + descent) like in ass subtitles.
+_AUTHOR_FONT_SIZE = 60
+_AUTHOR_SHIFT = 120
+_TITLE_FONT_SIZE = 108
+_TITLE_SHIFT = -80
+_MARGIN = 10
+_BACKGROUND_ALPHA = 16
+
+
+def make_png(authors, title, width, height, cache_dir, scale=None) -> str:
+    """
+    Render title card of given size into cache_dir (if not rendered yet)
+    :return: png filename
+    """
+    if scale is None:
+        scale = float(height) / 720
+    png_filename = os.path.join(cache_dir, 'title-{}.png'.format(_card_hash(authors, title, width, height, scale)))
+    if os.path.exists(png_filename):
+        return png_filename
+
+    image = render(authors, title, width, height, scale)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_filename = png_filename + '.tmp'
+    image.save(tmp_filename, format='PNG')
+    os.replace(tmp_filename, png_filename)
+    return png_filename
+
+
+def render(authors, title, width, height, scale) -> Image.Image:
+    """Return RGBA image of the title card"""
+    mask = Image.new('L', (width, height), 0)
+    draw = ImageDraw.Draw(mask)
+    _draw_centered(draw, authors, _font(int(_AUTHOR_FONT_SIZE * scale)), width, height // 2 + int(_AUTHOR_SHIFT * scale))
+    _draw_centered(draw, title, _font(int(_TITLE_FONT_SIZE * scale)), width, height // 2 + int(_TITLE_SHIFT * scale))
+    alpha = mask.point(lambda v: v if v else _BACKGROUND_ALPHA)
+    return Image.merge('RGBA', (mask, mask, mask, alpha))
+
+
+def _card_hash(authors, title, width, height, scale):
+    st = os.stat(FONT_FILENAME)
+    key = [_LAYOUT_VERSION, authors, title, os.path.basename(FONT_FILENAME), st.st_size, width, height, scale]
+    return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()[:16]
+
+
+def _font(line_height):
+    """Font whose ascent + descent is line_height pixels"""
+    font = ImageFont.truetype(FONT_FILENAME, line_height)
+    ascent, descent = font.getmetrics()
+    return ImageFont.truetype(FONT_FILENAME, max(1, round(line_height * line_height / (ascent + descent))))
+
+
+def _draw_centered(draw, text, font, width, center_y):
+    lines = []
+    for paragraph in text.split('\n'):
+        lines += wrap(paragraph, font, width - 2 * _MARGIN)
+    ascent, descent = font.getmetrics()
+    line_height = ascent + descent
+    top = center_y - line_height * len(lines) // 2
+    for i, line in enumerate(lines):
+        draw.text((width // 2, top + i * line_height + ascent), line, fill=255, font=font, anchor='ms')
+
+
+def wrap(text, font, max_width) -> list:
+    """
+    Split text into as few lines as fit max_width, keeping the lines about the same length.
+    A word longer than max_width gets a line of its own.
+    """
+    words = text.split()
+    lines = _wrap_greedy(words, font, max_width)
+    if len(lines) < 2:
+        return lines
+    # the narrowest width that still gives the same number of lines
+    low, high = 1, int(max_width)
+    while low < high:
+        mid = (low + high) // 2
+        if len(_wrap_greedy(words, font, mid)) <= len(lines):
+            high = mid
+        else:
+            low = mid + 1
+    return _wrap_greedy(words, font, low)
+
+
+def _wrap_greedy(words, font, max_width):
+    lines = []
+    line = ''
+    for word in words:
+        candidate = line + ' ' + word if line else word
+        if line and font.getlength(candidate) > max_width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines
@@ -0,0 +1,67 @@
+"""
+Process-wide cache of parsed .yml sidecars.
+
+Every meta.py getter needs the parsed yaml of the same sidecar, so we parse it once
+and then reuse the result for as long as the file's mtime and size stay the same.
+Writers (see yamlupdater.set) must call invalidate() after changing a file.
+"""
+import collections
+import os
+
+import yaml
+
+# How many parsed files to keep in memory. Each one is a small dict, but a long
+# GUI session may open many of them.
+MAX_ENTRIES = 64
+
+_cache = collections.OrderedDict()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def load(yaml_filename) -> dict:
+    """
+    Return parsed contents of yaml_filename, re-reading it only if it has changed.
+    Raises FileNotFoundError if there is no such file.
+    The returned dict is shared between callers and must not be modified.
+    """
+    key = os.path.abspath(yaml_filename)
+    st = os.stat(key)
+    identity = (st.st_mtime_ns, st.st_size)
+    try:
+        cached_identity, data = _cache[key]
+    except KeyError:
+        pass
+    else:
+        if cached_identity == identity:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return data
+    _stats['misses'] += 1
+    with open(key, 'r', encoding='UTF-8') as f:
+        data = yaml.load(f)
+    if data is None:
+        # empty file
+        data = dict()
+    _cache[key] = (identity, data)
+    _cache.move_to_end(key)
+    while len(_cache) > MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return data
+
+
+def invalidate(yaml_filename=None):
+    """Forget the cached contents of yaml_filename (or of all files if it's None)"""
+    if yaml_filename is None:
+        _cache.clear()
+    else:
+        _cache.pop(os.path.abspath(yaml_filename), None)
+
+
+def stats() -> dict:
+    """Return number of cache hits and misses (re-parses) so far, e.g. {'hits': 12, 'misses': 1}"""
+    return dict(_stats)
+
+
+def reset_stats():
+    _stats['hits'] = 0
+    _stats['misses'] = 0
@@ -8,6 +8,8 @@ import tempfile
 import os
 import ruamel.yaml
 
+import yamlcache
+
 
 def set(filename, key, value):
     with filelock.FileLock(filename + '.lock'):
@@ -22,6 +24,7 @@ def set(filename, key, value):
             f.write(yaml_str.encode('UTF-8'))
             f.flush()
             os.fsync(f.fileno())
+        yamlcache.invalidate(filename)
 
 
 @contextlib.contextmanager